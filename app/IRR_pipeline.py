@@ -5,13 +5,18 @@ import numpy as np
 import seaborn as sns
 import os
 import re
-import traceback
+import logging
 from pathlib import Path
 import matplotlib.pyplot as plt
 from pathlib import Path
 
+from stage_timing import span
+from profiling import profiled
+from file_cache import cached_load
 
-#print("Script starting...")
+# Per-country and per-category details (including the category value vectors) are logged at DEBUG,
+# progress and summaries at INFO; set GREENTRAC_LOG_LEVEL=DEBUG to see the details
+logger = logging.getLogger(__name__)
 
 def safe_extract_value(data, *keys, default=None):
     """
@@ -71,7 +76,7 @@ def get_json_files(directory='docs'):
     
     # Check if the directory exists
     if not os.path.exists(directory):
-        print(f"Directory '{directory}' does not exist.")
+        logger.warning("Directory %r does not exist", directory)
         return json_files
     
     # Walk through the directory and find all JSON files
@@ -82,9 +87,10 @@ def get_json_files(directory='docs'):
                 file_path = os.path.join(root, file)
                 json_files.append(file_path)
     
-    print(f"Found {len(json_files)} JSON files in {directory}.")
+    logger.info("Found %d JSON files in %s", len(json_files), directory)
     return json_files
 
+@profiled("process_json_files")
 def process_json_files(file_paths_or_path):
     """
     Process one or multiple JSON files and convert them into a structured DataFrame.
@@ -99,7 +105,6 @@ def process_json_files(file_paths_or_path):
     pd.DataFrame
         DataFrame containing the extracted data from all JSON files
     """
-    #print(f"DEBUGGING - process_json_files received: {file_paths_or_path}")
     # List to store data from each file
     all_data = []
     
@@ -119,7 +124,7 @@ def process_json_files(file_paths_or_path):
             
             # Extract country name
             country = safe_extract_value(data, 'submission_metadata', 'country', default='Unknown')
-            print(f"Processing country: {country}")
+            logger.debug("Processing country %s (%s)", country, file_path)
             
             # Create a dictionary for this country's data
             country_data = {'country': country}
@@ -293,21 +298,21 @@ def process_json_files(file_paths_or_path):
             
             # Add data to our list
             all_data.append(country_data)
-            print(f"Successfully processed {country}")
+            logger.debug("Processed country %s", country)
             
         except json.JSONDecodeError as e:
-            print(f"JSON parsing error in file {file_path}: {e}")
-            print(f"First 100 characters of file: {file_content[:100] if 'file_content' in locals() else 'Not available'}")
+            logger.error("JSON parsing error in file %s: %s (starts with %r)", file_path, e,
+                         file_content[:100] if 'file_content' in locals() else None)
         except Exception as e:
-            print(f"Error processing file {file_path}: {e}")
-            traceback.print_exc()
+            logger.exception("Error processing file %s", file_path)
     
     # Convert to DataFrame
     if all_data:
         df = pd.DataFrame(all_data)
+        logger.info("Processed %d of %d JSON files", len(all_data), len(file_paths))
         return df
     else:
-        print("No data was successfully processed.")
+        logger.warning("No data was successfully processed")
         return pd.DataFrame()
 
 def run_extraction(directory='docs', output_file='country_submissions_analysis.xlsx'):
@@ -326,13 +331,13 @@ def run_extraction(directory='docs', output_file='country_submissions_analysis.x
     pd.DataFrame
         DataFrame containing the extracted data
     """
-    print(f"Starting extraction process on directory: {directory}")
+    logger.info("Starting extraction on directory %s", directory)
     
     # Get all JSON files
     json_files = get_json_files(directory)
     
     if not json_files:
-        print("No JSON files found. Cannot proceed.")
+        logger.error("No JSON files found in %s", directory)
         return None
     
     # Process all JSON files
@@ -341,12 +346,7 @@ def run_extraction(directory='docs', output_file='country_submissions_analysis.x
     if df is not None and not df.empty:
         # Save to Excel
         df.to_excel(output_file, index=False)
-        print(f"Results saved to {output_file}")
-        
-        # Print some statistics
-        print(f"\nExtraction Results:")
-        print(f"Total countries processed: {len(df)}")
-        print(f"Columns in output: {len(df.columns)}")
+        logger.info("Extraction results saved to %s: %d countries, %d columns", output_file, len(df), len(df.columns))
     
     return df
 
@@ -444,10 +444,8 @@ def clean_datasets_for_irr(llm_data, nvivo_data):
         if re.search(r'C\d+\s+Objectives|C\d+\s+Time|C\d+\s+Stringency|C\d+\s+Value|C\d+\s+Type', col):
             category_columns.append(col)
     
-    # Print identified category columns for verification
-    print(f"Identified {len(category_columns)} category columns to exclude:")
-    for col in category_columns:
-        print(f"  - {col}")
+    # Log identified category columns for verification
+    logger.debug("Excluding %d category columns: %s", len(category_columns), category_columns)
     
     # Drop the category columns from both dataframes
     llm_clean = llm_clean.drop(columns=category_columns)
@@ -455,7 +453,7 @@ def clean_datasets_for_irr(llm_data, nvivo_data):
     
     # Verify both dataframes have the same columns left
     remaining_columns = llm_clean.columns
-    print(f"\nRemaining columns for IRR calculation: {len(remaining_columns)}")
+    logger.debug("Remaining columns for IRR calculation: %d", len(remaining_columns))
     
     # Make sure both dataframes have identical columns
     assert set(llm_clean.columns) == set(nvivo_clean.columns), "Column mismatch after cleaning"
@@ -543,8 +541,7 @@ def calculate_category_irr(df1, df2, category_mappings):
     
     # Verify alignment
     if df1_copy['country'].tolist() != df2_copy['country'].tolist():
-        print("\n⚠️ WARNING: Country lists don't match after sorting!")
-        print("Using direct position-based alignment instead.")
+        logger.warning("Country lists don't match after sorting; using position-based alignment")
         
         # Create a standardized reference list from the first dataframe
         reference_countries = df1_copy['country'].tolist()
@@ -560,7 +557,7 @@ def calculate_category_irr(df1, df2, category_mappings):
     df2_copy = df2_copy.drop('country_index', axis=1)
     
     if df1_copy['country'].tolist() == df2_copy['country'].tolist():
-        print("✓ Countries are perfectly aligned!")
+        logger.debug("Countries are aligned")
     
     # Create aggregated category columns
     results = {}
@@ -570,18 +567,17 @@ def calculate_category_irr(df1, df2, category_mappings):
         existing_columns = [col for col in columns if col in df1_copy.columns and col in df2_copy.columns]
         
         if not existing_columns:
-            print(f"Warning: No columns found for category {category}")
+            logger.warning("No columns found for category %s", category)
             continue
             
-        print(f"\nProcessing category: {category}")
-        print(f"Using columns: {existing_columns}")
+        logger.debug("Processing category %s using columns %s", category, existing_columns)
         
         # Identify "Not mentioned" columns for this category
         not_mentioned_cols = [col for col in existing_columns if "Not mentioned" in col]
         positive_cols = [col for col in existing_columns if "Not mentioned" not in col]
         
-        print(f"  Positive columns: {positive_cols}")
-        print(f"  'Not mentioned' columns: {not_mentioned_cols}")
+        logger.debug("Category %s: positive columns %s, 'Not mentioned' columns %s",
+                     category, positive_cols, not_mentioned_cols)
         
         # Encode the category value for each row in each dataframe based on column values
         df1_category_values = []
@@ -602,19 +598,21 @@ def calculate_category_irr(df1, df2, category_mappings):
             df1_category_values.append(1 if df1_category_present else 0)
             df2_category_values.append(1 if df2_category_present else 0)
         
-        # Show category values for verification
-        print(f"  LLM Category Values: {df1_category_values}")
-        print(f"  NVivo Category Values: {df2_category_values}")
-        print(f"  Match Count: {sum(1 for a, b in zip(df1_category_values, df2_category_values) if a == b)}/{len(df1_category_values)}")
+        # Dump category values for verification (only computed when DEBUG is enabled)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Category %s: LLM values %s, NVivo values %s, %d/%d match", category,
+                         df1_category_values, df2_category_values,
+                         sum(1 for a, b in zip(df1_category_values, df2_category_values) if a == b),
+                         len(df1_category_values))
         
         # Calculate Gwet's AC1 for this category
         try:
             ac1 = gwets_ac1_manual(df1_category_values, df2_category_values)
             results[category] = ac1
-            print(f"  Gwet's AC1: {ac1:.4f}")
+            logger.debug("Category %s: Gwet's AC1 %.4f", category, ac1)
         except Exception as e:
             results[category] = f"Error: {str(e)}"
-            print(f"  Error: {str(e)}")
+            logger.warning("Category %s: could not calculate Gwet's AC1: %s", category, e)
     
     return results
 
@@ -683,7 +681,10 @@ def generate_irr_report(llm_data, nvivo_data, irr_results, category_mappings=Non
         # Check alignment again
         countries_match = llm_sorted['country'].tolist() == nvivo_sorted['country'].tolist()
     
-    print(f"Country Alignment: {'✓ MATCHED' if countries_match else '❌ MISMATCHED'}")
+    if countries_match:
+        logger.debug("Country alignment: matched")
+    else:
+        logger.warning("Country alignment: mismatched")
     
     # Calculate category presence and agreement
     report_data = []
@@ -748,9 +749,8 @@ def generate_irr_report(llm_data, nvivo_data, irr_results, category_mappings=Non
     # Create report DataFrame
     report_df = pd.DataFrame(report_data)
     
-    # Print summary
-    print("\n=== IRR ANALYSIS SUMMARY ===")
-    print(f"Total Categories: {len(report_df)}")
+    # Log summary
+    logger.info("IRR analysis summary: %d categories", len(report_df))
     
     agreement_levels = [
         ('Excellent (0.8-1.0)', lambda x: x >= 0.8),
@@ -761,16 +761,16 @@ def generate_irr_report(llm_data, nvivo_data, irr_results, category_mappings=Non
         ('Very Poor (<0.0)', lambda x: x < 0.0)
     ]
     
-    print("\nAgreement Distribution:")
-    for level_name, level_func in agreement_levels:
-        count = sum(1 for x in report_df['Gwet AC1'] if isinstance(x, float) and level_func(x))
-        print(f"  {level_name}: {count} categories")
+    if logger.isEnabledFor(logging.INFO):
+        distribution = {level_name: sum(1 for x in report_df['Gwet AC1'] if isinstance(x, float) and level_func(x))
+                        for level_name, level_func in agreement_levels}
+        logger.info("Agreement distribution: %s", distribution)
     
     # Calculate average AC1
     valid_ac1 = [x for x in report_df['Gwet AC1'] if isinstance(x, float)]
     if valid_ac1:
         avg_ac1 = sum(valid_ac1) / len(valid_ac1)
-        print(f"\nAverage Gwet's AC1: {avg_ac1:.4f}")
+        logger.info("Average Gwet's AC1: %.4f", avg_ac1)
     
     return report_df
 
@@ -941,7 +941,7 @@ def export_irr_report(report_df, filename='irr_analysis_report.xlsx'):
         if not disagreements.empty:
             disagreements.to_excel(writer, sheet_name='Disagreements', index=False)
     
-    print(f"Report exported to {filename}")
+    logger.info("Report exported to %s", filename)
 
 def analyze_irr(llm_data, nvivo_data):
     """
@@ -959,8 +959,8 @@ def analyze_irr(llm_data, nvivo_data):
     tuple
         (cleaned_llm_data, cleaned_nvivo_data, irr_results)
     """
-    print(f"LLM data: {llm_data.shape[0]} rows and {llm_data.shape[1]} columns")
-    print(f"NVivo data: {nvivo_data.shape[0]} rows and {nvivo_data.shape[1]} columns")
+    logger.info("LLM data: %d rows, %d columns; NVivo data: %d rows, %d columns",
+                llm_data.shape[0], llm_data.shape[1], nvivo_data.shape[0], nvivo_data.shape[1])
     
     # Clean the datasets (remove category header columns)
     llm_clean, nvivo_clean = clean_datasets_for_irr(llm_data, nvivo_data)
@@ -984,26 +984,26 @@ def analyze_irr(llm_data, nvivo_data):
     # Calculate Gwet's AC1 at the category level
     category_results = calculate_category_irr(llm_clean, nvivo_clean, category_mappings)
     
-    # Display results
-    print("\nGwet's AC1 results by coding category:")
+    # Log results
     for category, ac1 in category_results.items():
-        if isinstance(ac1, float):
-            print(f"{category}: {ac1:.4f}")
-        else:
-            print(f"{category}: {ac1}")
+        logger.info("Gwet's AC1 for %s: %s", category, f"{ac1:.4f}" if isinstance(ac1, float) else ac1)
     
     # Calculate overall average AC1
     valid_scores = [score for score in category_results.values() if isinstance(score, float)]
     if valid_scores:
         avg_ac1 = sum(valid_scores) / len(valid_scores)
-        print(f"\nAverage Gwet's AC1 across all categories: {avg_ac1:.4f}")
-        print(f"Number of categories included in average: {len(valid_scores)}")
+        logger.info("Average Gwet's AC1 across %d categories: %.4f", len(valid_scores), avg_ac1)
     else:
-        print("\nNo valid AC1 scores calculated.")
+        logger.warning("No valid AC1 scores calculated")
     
     return llm_clean, nvivo_clean, category_results
 
-def run_irr_analysis(llm_data_path, nvivo_data_path, output_dir='output'):
+def read_nvivo_csv(path):
+    """Reads an NVivo CSV export."""
+    return pd.read_csv(path, encoding='utf-8')
+
+@profiled("run_irr_analysis")
+def run_irr_analysis(llm_data_path, nvivo_data_path, output_dir='output', spans_owner=None):
     """
     Run the complete IRR analysis pipeline.
     
@@ -1015,6 +1015,8 @@ def run_irr_analysis(llm_data_path, nvivo_data_path, output_dir='output'):
         Path to the NVivo data file (Excel or CSV)
     output_dir : str, optional
         Directory to save output files (default: 'output')
+    spans_owner : dict, optional
+        If provided, 'irr' and 'export' stage timings are appended to spans_owner['spans']
     
     Returns:
     --------
@@ -1024,44 +1026,45 @@ def run_irr_analysis(llm_data_path, nvivo_data_path, output_dir='output'):
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
     
-    print("=" * 80)
-    print("STARTING IRR ANALYSIS PIPELINE")
-    print("=" * 80)
+    logger.info("Starting IRR analysis pipeline")
     
     # Load data based on file extension
-    print(f"\nLoading LLM data from: {llm_data_path}")
+    logger.info("Loading LLM data from %s", llm_data_path)
     if llm_data_path.endswith('.xlsx') or llm_data_path.endswith('.xls'):
         llm_data = pd.read_excel(llm_data_path)
     else:
         llm_data = pd.read_csv(llm_data_path)
     
-    print(f"Loading NVivo data from: {nvivo_data_path}")
+    # The NVivo reference data rarely changes, so it is parsed once per process (until the file changes)
+    logger.info("Loading NVivo data from %s", nvivo_data_path)
     if nvivo_data_path.endswith('.xlsx') or nvivo_data_path.endswith('.xls'):
-        nvivo_data = pd.read_excel(nvivo_data_path)
+        nvivo_data = cached_load(nvivo_data_path, pd.read_excel)
     else:
-        nvivo_data = pd.read_csv(nvivo_data_path, encoding='utf-8')
+        nvivo_data = cached_load(nvivo_data_path, read_nvivo_csv)
         
     # Check if 'country' column exists in NVivo data
     if 'Unnamed: 0' in nvivo_data.columns and 'country' not in nvivo_data.columns:
         nvivo_data = nvivo_data.rename(columns={'Unnamed: 0': 'country'})
     
-    # Map country names to ensure consistency
-    llm_data_mapped = map_country_names(llm_data)
-    
-    # Run IRR analysis
-    print("\nAnalyzing inter-rater reliability...")
-    llm_clean, nvivo_clean, irr_results = analyze_irr(llm_data_mapped, nvivo_data)
-    
-    # Generate report
-    print("\nGenerating comprehensive report...")
-    report_df = generate_irr_report(llm_clean, nvivo_clean, irr_results)
+    with span(spans_owner, "irr"):
+        # Map country names to ensure consistency
+        llm_data_mapped = map_country_names(llm_data)
+        
+        # Run IRR analysis
+        logger.info("Analyzing inter-rater reliability")
+        llm_clean, nvivo_clean, irr_results = analyze_irr(llm_data_mapped, nvivo_data)
+        
+        # Generate report
+        logger.info("Generating report")
+        report_df = generate_irr_report(llm_clean, nvivo_clean, irr_results)
     
     # Export report to Excel
     report_path = os.path.join(output_dir, 'irr_analysis_report.xlsx')
-    export_irr_report(report_df, report_path)
+    with span(spans_owner, "export"):
+        export_irr_report(report_df, report_path)
     
     # Create and save visualizations
-    print("\nGenerating visualizations...")
+    logger.info("Generating visualizations")
     try:
         # Store the current backend
         orig_backend = plt.get_backend()
@@ -1152,13 +1155,11 @@ def run_irr_analysis(llm_data_path, nvivo_data_path, output_dir='output'):
         # Restore the original backend
         plt.switch_backend(orig_backend)
         
-        print(f"Visualizations saved to {output_dir}")
-    except Exception as e:
-        print(f"Error generating visualizations: {str(e)}")
-        traceback.print_exc()
+        logger.info("Visualizations saved to %s", output_dir)
+    except Exception:
+        logger.exception("Error generating visualizations")
     
-    print("\nIRR analysis complete!")
-    print("=" * 80)
+    logger.info("IRR analysis complete")
     
     return report_df, llm_clean, nvivo_clean, irr_results, report_path
 
@@ -1168,6 +1169,9 @@ if __name__ == "__main__":
 
     import argparse
     
+    logging.basicConfig(level=os.getenv("GREENTRAC_LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    
     parser = argparse.ArgumentParser(description='Run IRR analysis between LLM and NVivo data')
     parser.add_argument('--llm_data', required=False, help='Path to LLM data file (Excel or CSV)')
     parser.add_argument('--nvivo_data', required=True, help='Path to NVivo data file (Excel or CSV)')
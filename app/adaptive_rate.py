@@ -0,0 +1,129 @@
+import os
+import json
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Hard ceilings and floors for the learned request rate (calls per minute) and concurrency.
+# The rate ceiling is per usable API key (see set_usable_keys)
+MIN_CALLS_PER_MINUTE = 2
+MAX_CALLS_PER_MINUTE_CEILING = 15
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 8
+
+# Starting point when nothing has been learned yet
+INITIAL_CALLS_PER_MINUTE = 10
+INITIAL_CONCURRENCY = 4
+
+# Additive increase after this many consecutive fast successes
+INCREASE_AFTER_SUCCESSES = 5
+RATE_INCREASE_STEP = 1
+CONCURRENCY_INCREASE_STEP = 1
+
+# Multiplicative decrease on throttling
+DECREASE_FACTOR = 0.5
+
+# Successes slower than this don't count towards an increase
+LATENCY_TARGET_SECONDS = 60
+
+# Learned limits are kept between runs
+ADAPTIVE_STATE_PATH = os.path.join("results", "adaptive_rate.json")
+
+state_lock = threading.Lock()
+slots = threading.Condition()
+adaptive_state = None
+active_requests = 0
+usable_keys = 1
+
+def set_usable_keys(count):
+    """Scales the rate ceiling to the number of API keys that can currently take requests."""
+    global usable_keys
+    with state_lock:
+        usable_keys = max(int(count), 1)
+
+def _rate_ceiling():
+    return MAX_CALLS_PER_MINUTE_CEILING * usable_keys
+
+def _load_state():
+    """Loads the learned limits, clamped to the floors (the rate ceiling depends on the key pool)."""
+    state = {"calls_per_minute": INITIAL_CALLS_PER_MINUTE, "concurrency": INITIAL_CONCURRENCY}
+    if os.path.exists(ADAPTIVE_STATE_PATH):
+        try:
+            with open(ADAPTIVE_STATE_PATH, 'r', encoding='utf-8') as f:
+                state.update(json.load(f))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Error reading adaptive rate state: %s", e)
+    state["calls_per_minute"] = max(state["calls_per_minute"], MIN_CALLS_PER_MINUTE)
+    state["concurrency"] = min(max(int(state["concurrency"]), MIN_CONCURRENCY), MAX_CONCURRENCY)
+    state["successes"] = 0
+    return state
+
+def _save_state(state):
+    os.makedirs(os.path.dirname(ADAPTIVE_STATE_PATH), exist_ok=True)
+    tmp_path = f"{ADAPTIVE_STATE_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"calls_per_minute": state["calls_per_minute"], "concurrency": state["concurrency"]}, f, indent=2)
+    os.replace(tmp_path, ADAPTIVE_STATE_PATH)
+
+def _get_state():
+    """Returns the in-memory state, loading it on first use (call with state_lock held)."""
+    global adaptive_state
+    if adaptive_state is None:
+        adaptive_state = _load_state()
+    return adaptive_state
+
+def current_limits():
+    """Returns (calls_per_minute, concurrency) currently allowed (the rate capped at the current key pool's ceiling)."""
+    with state_lock:
+        state = _get_state()
+        return min(state["calls_per_minute"], _rate_ceiling()), state["concurrency"]
+
+def record_success(latency_seconds):
+    """Additive increase: raise the limits after a run of successes within the latency target."""
+    with state_lock:
+        state = _get_state()
+        if latency_seconds > LATENCY_TARGET_SECONDS:
+            state["successes"] = 0
+            return
+        state["successes"] += 1
+        if state["successes"] < INCREASE_AFTER_SUCCESSES:
+            return
+        state["successes"] = 0
+        calls_per_minute = min(state["calls_per_minute"] + RATE_INCREASE_STEP, _rate_ceiling())
+        concurrency = min(state["concurrency"] + CONCURRENCY_INCREASE_STEP, MAX_CONCURRENCY)
+        if (calls_per_minute, concurrency) == (state["calls_per_minute"], state["concurrency"]):
+            return
+        state["calls_per_minute"], state["concurrency"] = calls_per_minute, concurrency
+        _save_state(state)
+
+    with slots:
+        slots.notify_all()
+
+def record_throttle():
+    """Multiplicative decrease: cut the limits after a 429 or overload response."""
+    with state_lock:
+        state = _get_state()
+        state["successes"] = 0
+        state["calls_per_minute"] = max(min(state["calls_per_minute"], _rate_ceiling()) * DECREASE_FACTOR,
+                                        MIN_CALLS_PER_MINUTE)
+        state["concurrency"] = max(int(state["concurrency"] * DECREASE_FACTOR), MIN_CONCURRENCY)
+        _save_state(state)
+        logger.warning("API throttling: reducing to %.1f calls/min, %d concurrent requests",
+                       state["calls_per_minute"], state["concurrency"])
+
+@contextmanager
+def request_slot():
+    """Holds one of the currently allowed concurrent request slots for the duration of a request."""
+    global active_requests
+    with slots:
+        while active_requests >= current_limits()[1]:
+            slots.wait()
+        active_requests += 1
+    try:
+        yield
+    finally:
+        with slots:
+            active_requests -= 1
+            slots.notify_all()
@@ -0,0 +1,220 @@
+import os
+import json
+import logging
+import time
+import hashlib
+import datetime
+import threading
+from collections import defaultdict, deque
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# Free-tier quota per API key
+KEY_CALLS_PER_MINUTE = int(os.getenv("GREENTRAC_KEY_CALLS_PER_MINUTE", "15"))
+KEY_CALLS_PER_DAY = int(os.getenv("GREENTRAC_KEY_CALLS_PER_DAY", "1500"))
+
+# Daily quotas reset at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+
+# Keys rejected as invalid are set aside for this long
+INVALID_KEY_QUARANTINE_SECONDS = 24 * 60 * 60
+
+# Daily usage and quarantines are persisted so restarts don't forget spent quota
+KEY_USAGE_PATH = os.path.join("results", "api_key_usage.json")
+
+pool_lock = threading.Lock()
+minute_usage = defaultdict(deque)
+key_usage = None
+
+def key_label(api_key):
+    """Returns a short, non-secret identifier for an API key."""
+    return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+def environment_api_keys():
+    """Returns the API keys configured in the environment (GOOGLE_API_KEYS, comma-separated, and GOOGLE_API_KEY)."""
+    keys = [key.strip() for key in os.getenv("GOOGLE_API_KEYS", "").split(",") if key.strip()]
+    single_key = os.getenv("GOOGLE_API_KEY")
+    if single_key and single_key not in keys:
+        keys.append(single_key)
+    return keys
+
+def _quota_day(now):
+    return datetime.datetime.fromtimestamp(now, QUOTA_TIMEZONE).date().isoformat()
+
+def _next_daily_reset(now):
+    """Returns the Unix time of the next daily quota reset."""
+    local_now = datetime.datetime.fromtimestamp(now, QUOTA_TIMEZONE)
+    tomorrow = (local_now + datetime.timedelta(days=1)).date()
+    return datetime.datetime.combine(tomorrow, datetime.time(), tzinfo=QUOTA_TIMEZONE).timestamp()
+
+def _load_usage():
+    if os.path.exists(KEY_USAGE_PATH):
+        try:
+            with open(KEY_USAGE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Error reading API key usage: %s", e)
+    return {}
+
+def _save_usage(usage):
+    os.makedirs(os.path.dirname(KEY_USAGE_PATH), exist_ok=True)
+    tmp_path = f"{KEY_USAGE_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(usage, f, indent=2)
+    os.replace(tmp_path, KEY_USAGE_PATH)
+
+def _key_entry(label, now):
+    """Returns the usage entry for a key, resetting the daily count on a new quota day (call with pool_lock held)."""
+    global key_usage
+    if key_usage is None:
+        key_usage = _load_usage()
+    entry = key_usage.setdefault(label, {"day": _quota_day(now), "day_count": 0, "quarantined_until": 0, "reason": ""})
+    if entry["day"] != _quota_day(now):
+        entry["day"] = _quota_day(now)
+        entry["day_count"] = 0
+    return entry
+
+def _remaining(label, entry, now):
+    """Returns (calls left today, calls left this minute) for a key (call with pool_lock held)."""
+    calls = minute_usage[label]
+    while calls and calls[0] <= now - 60:
+        calls.popleft()
+    return KEY_CALLS_PER_DAY - entry["day_count"], KEY_CALLS_PER_MINUTE - len(calls)
+
+def acquire_key(api_keys, now=None):
+    """
+    Picks the key with the most remaining budget and records a call against it.
+
+    Quarantined keys and keys without daily or per-minute quota left are skipped (a key with
+    no calls left this minute would only earn a 429). Keys are ranked by calls left today,
+    then calls left this minute.
+
+    Returns:
+    --------
+    str or None
+        The API key to use, or None if every key is exhausted or quarantined
+    """
+    now = now if now is not None else time.time()
+    with pool_lock:
+        best_key, best_budget = None, None
+        for api_key in api_keys:
+            label = key_label(api_key)
+            entry = _key_entry(label, now)
+            if entry["quarantined_until"] > now:
+                continue
+            budget = _remaining(label, entry, now)
+            if budget[0] <= 0 or budget[1] <= 0:
+                continue
+            if best_budget is None or budget > best_budget:
+                best_key, best_budget = api_key, budget
+
+        if best_key is None:
+            return None
+
+        label = key_label(best_key)
+        entry = _key_entry(label, now)
+        entry["day_count"] += 1
+        minute_usage[label].append(now)
+        _save_usage(key_usage)
+        return best_key
+
+def next_key_available_at(api_keys, now=None):
+    """Returns the Unix time at which the earliest quarantined or exhausted key becomes usable again."""
+    now = now if now is not None else time.time()
+    with pool_lock:
+        times = []
+        for api_key in api_keys:
+            label = key_label(api_key)
+            entry = _key_entry(label, now)
+            day_left, minute_left = _remaining(label, entry, now)
+            if entry["quarantined_until"] > now:
+                times.append(entry["quarantined_until"])
+            elif day_left <= 0:
+                times.append(_next_daily_reset(now))
+            elif minute_left <= 0:
+                # The oldest call of the last minute leaves the window
+                times.append(minute_usage[label][0] + 60)
+        return min(times) if times else now
+
+def usable_key_count(api_keys, now=None):
+    """Returns the number of keys that are not quarantined and have daily quota left."""
+    now = now if now is not None else time.time()
+    with pool_lock:
+        count = 0
+        for api_key in api_keys:
+            label = key_label(api_key)
+            entry = _key_entry(label, now)
+            if entry["quarantined_until"] <= now and _remaining(label, entry, now)[0] > 0:
+                count += 1
+        return count
+
+def quarantine_key(api_key, until, reason, now=None):
+    """Sets a key aside until the given Unix time."""
+    now = now if now is not None else time.time()
+    with pool_lock:
+        entry = _key_entry(key_label(api_key), now)
+        entry["quarantined_until"] = max(entry["quarantined_until"], until)
+        entry["reason"] = reason
+        _save_usage(key_usage)
+    logger.warning("Quarantined API key %s until %s: %s", key_label(api_key),
+                   datetime.datetime.fromtimestamp(until).strftime('%Y-%m-%d %H:%M'), reason)
+
+def report_key_error(api_key, error, now=None):
+    """
+    Quarantines a key after a quota or authentication error.
+
+    A 429 mentioning a per-day quota sets the key aside until the daily reset, other
+    429s for a minute. Invalid or unauthorized keys are set aside for a day.
+    """
+    from google.genai import errors
+
+    if not isinstance(error, errors.APIError):
+        return
+    now = now if now is not None else time.time()
+    message = str(error.details).lower()
+    if error.code == 429:
+        if "perday" in message or "per day" in message or "daily" in message:
+            quarantine_key(api_key, _next_daily_reset(now), "daily quota exhausted", now)
+        else:
+            quarantine_key(api_key, now + 60, "per-minute quota exhausted", now)
+    elif error.code in (401, 403) or (error.code == 400 and "api_key_invalid" in message):
+        quarantine_key(api_key, now + INVALID_KEY_QUARANTINE_SECONDS, f"rejected ({error.code})", now)
+
+def calls_left_today(api_keys, now=None):
+    """Returns the number of calls left today across all keys (keys quarantined until the daily reset count as spent)."""
+    now = now if now is not None else time.time()
+    reset = _next_daily_reset(now)
+    left = 0
+    with pool_lock:
+        for api_key in api_keys:
+            label = key_label(api_key)
+            entry = _key_entry(label, now)
+            if entry["quarantined_until"] >= reset:
+                continue
+            left += max(_remaining(label, entry, now)[0], 0)
+    return left
+
+def next_daily_reset(now=None):
+    """Returns the Unix time of the next daily quota reset."""
+    return _next_daily_reset(now if now is not None else time.time())
+
+def key_usage_table(api_keys, now=None):
+    """Returns per-key usage rows (for display), without exposing the keys themselves."""
+    now = now if now is not None else time.time()
+    rows = []
+    with pool_lock:
+        for api_key in api_keys:
+            label = key_label(api_key)
+            entry = _key_entry(label, now)
+            day_left, minute_left = _remaining(label, entry, now)
+            quarantined = entry["quarantined_until"] > now
+            rows.append({
+                "Key": label,
+                "Calls Today": entry["day_count"],
+                "Left Today": max(day_left, 0),
+                "Calls Last Minute": KEY_CALLS_PER_MINUTE - minute_left,
+                "Status": f"Quarantined until {datetime.datetime.fromtimestamp(entry['quarantined_until']).strftime('%H:%M')} ({entry['reason']})"
+                          if quarantined else ("Exhausted" if day_left <= 0 else "Available")
+            })
+    return rows
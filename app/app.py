@@ -1,7 +1,9 @@
 import streamlit as st
 import os
+import logging
 from utils import load_codebook_comments, ensure_folders_exist
-import pandas as pd
+from file_cache import cached_load
+from result_store import put_result
 
 # Import authentication
 from auth import require_login, admin_panel
@@ -14,8 +16,7 @@ from ui_elements import (
     DOCS_FOLDER, AUDIO_FOLDER, LYRICS_FOLDER, RESULTS_FOLDER
 )
 
-# Import experiment history
-from ui_experiment_history import render_experiment_history_tab
+from metrics import start_metrics_exporter, start_metrics_server
 
 # Set page config
 st.set_page_config(
@@ -30,23 +31,29 @@ def init_app():
     # Ensure required directories exist
     ensure_folders_exist([DOCS_FOLDER, AUDIO_FOLDER, LYRICS_FOLDER, RESULTS_FOLDER])
     
-    # Configure session state variables if they don't exist
-    if 'results' not in st.session_state:
-        st.session_state.results = {}
+    # Configure session state variables if they don't exist. Result payloads live in the shared
+    # result store; session state only keeps their content hashes
+    if 'result_hashes' not in st.session_state:
+        st.session_state.result_hashes = {}
+    # How each result was produced (timings, token counts), saved with experiments
+    if 'run_metadata' not in st.session_state:
+        st.session_state.run_metadata = {}
 
     # Initialize IRR analysis results
-    if 'irr_analysis' not in st.session_state:
+    if 'irr_analysis_hash' not in st.session_state:
         # Check if there's an existing IRR analysis report
         irr_report_path = os.path.join(RESULTS_FOLDER, 'irr_analysis_report.xlsx')
         if os.path.exists(irr_report_path):
+            import pandas as pd
+            
             # If report exists, create a minimal results structure
-            st.session_state.irr_analysis = {
+            st.session_state.irr_analysis_hash = put_result({
                 'report_path': irr_report_path,
-                'report_df': pd.read_excel(irr_report_path) if pd.read_excel else None,
+                'report_df': cached_load(irr_report_path, pd.read_excel),
                 # Other fields will be populated later if needed
-            }
+            })
         else:
-            st.session_state.irr_analysis = None
+            st.session_state.irr_analysis_hash = None
         
     if 'processed_files' not in st.session_state:
         st.session_state.processed_files = []
@@ -73,6 +80,11 @@ def main():
     # Initialize the application at startup
     init_app()
     
+    # Write results/metrics.prom periodically and serve /metrics if GREENTRAC_METRICS_PORT is set
+    # (both started once per server process)
+    start_metrics_exporter()
+    start_metrics_server()
+    
     # Render sidebar
     render_sidebar()
     
@@ -115,6 +127,8 @@ def main():
         render_codebook_editor_tab()
     
     with tabs[3]:  # Experiment History
+        # Imported here (pandas, matplotlib) so the login page doesn't wait for it
+        from ui_experiment_history import render_experiment_history_tab
         render_experiment_history_tab()
     
     with tabs[4]:  # Audio Player
@@ -127,6 +141,13 @@ def main():
         else:
             st.warning("You need admin privileges to access this section.")
 
+def configure_logging():
+    """Sets up log output for the app's modules (a no-op on reruns, once the handler exists)."""
+    # Log level of the pipeline modules; DEBUG adds per-country and per-category details
+    logging.basicConfig(level=os.getenv("GREENTRAC_LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 # Entry point for the application 
 if __name__ == "__main__":
+    configure_logging()
     main()
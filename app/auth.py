@@ -140,6 +140,10 @@ def admin_panel():
         st.warning("You must be an admin to access this area.")
         return
     
+    from api_key_pool import environment_api_keys, key_usage_table, KEY_CALLS_PER_MINUTE, KEY_CALLS_PER_DAY
+    from user_quota import get_allowance, set_allowance, user_usage_table
+    from metrics import METRICS_PATH, METRICS_PORT, dashboard_summary, render_prometheus
+    
     st.title("User Management")
     
     # Load current users
@@ -201,7 +205,69 @@ def admin_panel():
                 is_admin = credentials[username_to_change].get('is_admin', False)
                 save_credentials(username_to_change, new_password, is_admin)
                 st.success(f"Password for '{username_to_change}' changed successfully")
-
-# We do NOT need a create_initial_admin function since load_credentials handles it
-# Just calling load_credentials() once when this module is imported to ensure credentials file exists
-load_credentials()
+    
+    # Per-user usage and daily allowances
+    st.subheader("User Usage Today")
+    
+    st.table(user_usage_table(list(credentials.keys())))
+    
+    # Outside the form so changing the user reruns and loads that user's allowance; the inputs are
+    # keyed by user so they never carry another user's values
+    allowance_user = st.selectbox("User", list(credentials.keys()), key="allowance_user")
+    current_requests, current_tokens = get_allowance(allowance_user)
+    with st.form("allowance_form"):
+        daily_requests = st.number_input("Daily request allowance", min_value=0, value=current_requests,
+                                         key=f"allowance_requests_{allowance_user}")
+        daily_tokens = st.number_input("Daily token allowance", min_value=0, value=current_tokens, step=100000,
+                                       key=f"allowance_tokens_{allowance_user}")
+        
+        submit = st.form_submit_button("Update Allowance")
+        
+        if submit:
+            set_allowance(allowance_user, daily_requests, daily_tokens)
+            st.success(f"Allowance for '{allowance_user}' updated")
+            st.rerun()
+    
+    # API key pool usage
+    st.subheader("API Key Usage")
+    
+    api_keys = environment_api_keys()
+    if st.session_state.get('api_key') and st.session_state.api_key not in api_keys:
+        api_keys.insert(0, st.session_state.api_key)
+    
+    if api_keys:
+        st.caption(f"Quota per key: {KEY_CALLS_PER_MINUTE} calls/minute, {KEY_CALLS_PER_DAY} calls/day. "
+                   "Requests are routed to the key with the most remaining quota.")
+        st.table(key_usage_table(api_keys))
+    else:
+        st.info("No API keys configured. Set GOOGLE_API_KEYS (comma-separated) or GOOGLE_API_KEY in the .env file.")
+    
+    # Process-wide metrics since the server started
+    st.subheader("Metrics")
+    
+    summary = dashboard_summary()
+    
+    def format_seconds(seconds):
+        return f"{seconds:.1f}s" if seconds is not None else "-"
+    
+    def format_ratio(ratio):
+        return f"{ratio:.0%}" if ratio is not None else "-"
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Gemini Requests", summary["requests"])
+    col2.metric("Failure Rate", format_ratio(summary["failure_rate"]))
+    col3.metric("Context Cache Hits", format_ratio(summary["cache_hit_ratio"]))
+    col4.metric("Requests Left Today", summary["gauges"].get("greentrac_quota_remaining_requests", "-"))
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Latency p50", format_seconds(summary["latency_p50"]))
+    col2.metric("Latency p90", format_seconds(summary["latency_p90"]))
+    col3.metric("Latency p99", format_seconds(summary["latency_p99"]))
+    col4.metric("Tokens In / Out", f"{summary['input_tokens']:,} / {summary['output_tokens']:,}")
+    
+    prometheus_text = render_prometheus()
+    with st.expander("Prometheus Metrics"):
+        where = f"served at :{METRICS_PORT}/metrics and " if METRICS_PORT else ""
+        st.caption(f"Metrics are {where}written to {METRICS_PATH}.")
+        st.code(prometheus_text, language="text")
+        st.download_button("Download metrics.prom", prometheus_text, file_name="metrics.prom", mime="text/plain")
@@ -0,0 +1,235 @@
+import os
+import json
+import logging
+import math
+import time
+import datetime
+import threading
+
+from windowing import needs_windowing, plan_windows
+
+logger = logging.getLogger(__name__)
+
+# Persistent queue of batch jobs that may span several quota days
+QUEUE_PATH = os.path.join("results", "batch_queue.json")
+
+# Extra requests expected from retries of transient errors
+RETRY_OVERHEAD = 1.1
+
+# Extraction modes as shown in the batch tab
+MODE_FULL = "Full codebook"
+MODE_SECTIONED = "Sectioned"
+MODE_INCREMENTAL = "Incremental"
+
+queue_lock = threading.Lock()
+page_count_cache = {}
+
+def count_pdf_pages(pdf_file_path):
+    """Returns the page count of a PDF (0 if it can't be read), cached by path, size and modification time."""
+    stat = os.stat(pdf_file_path)
+    cache_key = (pdf_file_path, stat.st_size, stat.st_mtime)
+    if cache_key not in page_count_cache:
+        try:
+            from pypdf import PdfReader
+            page_count_cache[cache_key] = len(PdfReader(pdf_file_path).pages)
+        except Exception as e:
+            logger.warning("Could not count pages of %s: %s", pdf_file_path, e)
+            page_count_cache[cache_key] = 0
+    return page_count_cache[cache_key]
+
+def estimate_file_requests(pdf_file_path, mode, section_count):
+    """Estimates the number of API requests needed for one PDF in the given extraction mode."""
+    if mode == MODE_SECTIONED:
+        return section_count
+    if mode == MODE_INCREMENTAL:
+        return 1
+
+    # Full codebook: long documents are split into page windows
+    page_count = count_pdf_pages(pdf_file_path)
+    if needs_windowing(pdf_file_path, page_count):
+        return len(plan_windows(page_count, os.path.getsize(pdf_file_path)))
+    return 1
+
+def plan_batch(pdf_file_paths, mode, section_count, calls_left_today, daily_budget, calls_per_minute, next_reset,
+               now=None, incremental_files=None, fallback_mode=MODE_FULL):
+    """
+    Estimates the requests and duration of a batch and schedules it across daily quota windows.
+
+    Files are assigned in order to the first day with enough quota left (the rest of today,
+    then one full daily budget per following day); a file is never split across days. Files
+    needing more requests than a full quota day (and than is left today) can never be run and
+    are listed as unschedulable instead.
+
+    Parameters:
+    -----------
+    pdf_file_paths : list
+        PDFs in processing order
+    mode : str
+        MODE_FULL, MODE_SECTIONED or MODE_INCREMENTAL
+    section_count : int
+        Number of top-level codebook sections (requests per file in sectioned mode)
+    calls_left_today : int
+        Requests still available before the next quota reset
+    daily_budget : int
+        Requests available per full quota day
+    calls_per_minute : float
+        Request rate used to estimate processing time
+    next_reset : float
+        Unix time of the next daily quota reset
+    now : float, optional
+        Current Unix time (defaults to time.time())
+    incremental_files : set, optional
+        In incremental mode, the filenames that have a previous result (defaults to all files);
+        the others are extracted from scratch and estimated in fallback_mode
+    fallback_mode : str, optional
+        MODE_FULL or MODE_SECTIONED, used for files without a previous result
+
+    Returns:
+    --------
+    dict
+        Plan with total requests, per-file requests, per-day schedule, unschedulable files and
+        ETA (Unix time, None if not every file can be scheduled)
+    """
+    now = now if now is not None else time.time()
+
+    def file_mode(filename):
+        if mode == MODE_INCREMENTAL and incremental_files is not None and filename not in incremental_files:
+            return fallback_mode
+        return mode
+
+    file_requests = {}
+    for path in pdf_file_paths:
+        filename = os.path.basename(path)
+        requests = estimate_file_requests(path, file_mode(filename), section_count)
+        file_requests[filename] = math.ceil(requests * RETRY_OVERHEAD)
+
+    def fits(day, requests):
+        return day["requests"] + requests <= day["capacity"]
+
+    days = []
+    unschedulable = []
+    day = {"index": 0, "start": now, "capacity": calls_left_today, "requests": 0, "files": []}
+    for filename, requests in file_requests.items():
+        if 0 < daily_budget < requests and not (day["index"] == 0 and fits(day, requests)):
+            # The batch runner only starts a file the remaining quota can cover, so this one would never run
+            unschedulable.append(filename)
+            continue
+        while not fits(day, requests) and daily_budget > 0:
+            days.append(day)
+            index = day["index"] + 1
+            day = {"index": index, "start": next_reset + (index - 1) * 86400, "capacity": daily_budget,
+                   "requests": 0, "files": []}
+        if not fits(day, requests):
+            # No daily budget at all: the rest can't be scheduled
+            break
+        day["requests"] += requests
+        day["files"].append(filename)
+    days.append(day)
+    days = [day for day in days if day["files"]]
+
+    scheduled = sum(len(day["files"]) for day in days)
+    eta = None
+    if days and not unschedulable and scheduled == len(file_requests):
+        last_day = days[-1]
+        eta = last_day["start"] + last_day["requests"] / max(calls_per_minute, 0.1) * 60
+
+    return {
+        "mode": mode,
+        "total_requests": sum(file_requests.values()),
+        "file_requests": file_requests,
+        "processing_minutes": round(sum(file_requests.values()) / max(calls_per_minute, 0.1), 1),
+        "days": [{"date": datetime.datetime.fromtimestamp(day["start"]).strftime("%Y-%m-%d"),
+                  "start": day["start"], "requests": day["requests"], "files": day["files"]} for day in days],
+        "unschedulable": unschedulable,
+        "eta": eta
+    }
+
+def format_eta(eta):
+    """Formats an ETA (Unix time) for display."""
+    if eta is None:
+        return "not schedulable with the current quota"
+    return datetime.datetime.fromtimestamp(eta).strftime("%Y-%m-%d %H:%M")
+
+def format_plan(plan):
+    """Returns a one-line summary of a batch plan."""
+    summary = (f"~{plan['total_requests']} requests, ~{plan['processing_minutes']:.0f} min of processing, "
+               f"{len(plan['days'])} quota day(s), ETA {format_eta(plan['eta'])}")
+    if plan.get("unschedulable"):
+        summary += (f". {len(plan['unschedulable'])} file(s) need more requests than a full quota day and "
+                    f"will be skipped: {', '.join(plan['unschedulable'])}")
+    return summary
+
+def load_queue():
+    """Loads the persistent job queue ({job_id: job})."""
+    if not os.path.exists(QUEUE_PATH):
+        return {}
+    try:
+        with open(QUEUE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning("Error reading batch queue: %s", e)
+        return {}
+
+def _save_queue(queue):
+    os.makedirs(os.path.dirname(QUEUE_PATH), exist_ok=True)
+    tmp_path = f"{QUEUE_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(queue, f, indent=2)
+    os.replace(tmp_path, QUEUE_PATH)
+
+def create_job(username, name, notes, settings, filenames, plan):
+    """Adds a batch job to the queue and returns its ID."""
+    # Microseconds keep jobs submitted within the same second apart
+    job_id = f"job_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    with queue_lock:
+        queue = load_queue()
+        queue[job_id] = {
+            "id": job_id,
+            "user": username,
+            "name": name,
+            "notes": notes,
+            "settings": settings,
+            "created": datetime.datetime.now().isoformat(),
+            "files": {filename: "pending" for filename in filenames},
+            "plan": plan,
+            "status": "queued"
+        }
+        _save_queue(queue)
+    return job_id
+
+def get_job(job_id):
+    """Returns a queued job, or None."""
+    return load_queue().get(job_id)
+
+def update_job(job_id, filename=None, file_status=None, plan=None, run_info=None):
+    """
+    Records a file's status (and how it was processed) and/or a new plan for a job; marks
+    the job done when no files are pending.
+
+    The file's run_info (timings, token counts) is kept in the job so a job resumed on a
+    later day can still save it with the experiment.
+    """
+    with queue_lock:
+        queue = load_queue()
+        job = queue.get(job_id)
+        if job is None:
+            return None
+        if filename is not None:
+            job["files"][filename] = file_status
+            if run_info is not None:
+                job.setdefault("run_metadata", {})[filename] = run_info
+        if plan is not None:
+            job["plan"] = plan
+        job["status"] = "done" if "pending" not in job["files"].values() else "queued"
+        _save_queue(queue)
+        return job
+
+def pending_files(job):
+    """Returns the files of a job that still need processing."""
+    return [filename for filename, status in job["files"].items() if status == "pending"]
+
+def list_jobs(username=None, include_done=False):
+    """Lists queued jobs (optionally for one user), oldest first."""
+    jobs = [job for job in load_queue().values()
+            if (username is None or job["user"] == username) and (include_done or job["status"] != "done")]
+    return sorted(jobs, key=lambda job: job["created"])
@@ -0,0 +1,77 @@
+"""
+Cold-start check: how long a fresh interpreter takes to import the app (the work Streamlit does
+before the login page can render).
+
+Each import runs in a new process, so nothing is cached between measurements. The check fails if
+the median time exceeds the target or if a heavy module is imported at startup:
+
+    python benchmarks/check_startup.py
+    python benchmarks/check_startup.py --target 1.0 --runs 7
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# Median import time of app.py (seconds) the cold start must stay under; importing streamlit
+# alone takes roughly half of this, and eager imports of the pipeline took about 3 seconds
+STARTUP_TARGET_SECONDS = float(os.getenv("GREENTRAC_STARTUP_TARGET", "1.0"))
+
+# Modules that are slow to import and must only be loaded once a page actually needs them
+DEFERRED_MODULES = ["pandas", "matplotlib", "seaborn", "PIL", "pypdf", "google.genai", "IRR_pipeline", "versioning"]
+
+# Run in a fresh interpreter per measurement; prints the import time and the deferred modules that got loaded
+MEASURE_SCRIPT = """
+import sys, time, json
+sys.path.insert(0, {app_dir!r})
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+def measure_import(module, runs):
+    """Imports module in runs fresh interpreters; returns (import times, deferred modules that got loaded)."""
+    times, loaded = [], set()
+    for _ in range(runs):
+        script = MEASURE_SCRIPT.format(app_dir=APP_DIR, module=module, deferred=DEFERRED_MODULES)
+        output = subprocess.run([sys.executable, "-c", script], cwd=APP_DIR, capture_output=True,
+                                text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return times, sorted(loaded)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Check the cold-start import time of the app')
+    parser.add_argument('--target', type=float, default=STARTUP_TARGET_SECONDS,
+                        help='Maximum median import time of app.py in seconds')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per measurement')
+    args = parser.parse_args()
+
+    baseline, _ = measure_import("streamlit", args.runs)
+    times, loaded = measure_import("app", args.runs)
+    median = statistics.median(times)
+    print(f"import streamlit: median {statistics.median(baseline):.3f}s")
+    print(f"import app:       median {median:.3f}s (min {min(times):.3f}s, max {max(times):.3f}s, "
+          f"target {args.target:.2f}s)")
+
+    failed = False
+    if median > args.target:
+        print(f"FAIL: cold start is {median - args.target:.3f}s over the target")
+        failed = True
+    if loaded:
+        print(f"FAIL: imported at startup: {', '.join(loaded)}")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+End-to-end pipeline benchmarks on synthetic corpora (no API calls).
+
+Times prompt building, replayed extraction (parsing and normalization), process_json_files,
+analyze_irr, report export and save_experiment at several corpus sizes, with the peak Python
+memory of each stage. Results are written as JSON so runs on different commits can be compared:
+
+    python benchmarks/run_benchmarks.py --sizes 10,1000
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier run>.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import datetime
+import tempfile
+import tracemalloc
+import subprocess
+import logging
+import contextlib
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, APP_DIR)
+
+# Responses are served by the replay backend, so nothing here needs an API key
+os.environ["GREENTRAC_MODEL_BACKEND"] = "replay"
+os.environ.setdefault("GREENTRAC_REPLAY_LATENCY", "0")
+
+import pandas as pd
+from google.genai import types
+
+import model_backend
+import versioning
+from gemini_calls import MODEL_NAME, analyze_pdf_file, create_dynamic_prompt
+from IRR_pipeline import process_json_files, map_country_names, analyze_irr, generate_irr_report, export_irr_report
+from synthetic import (make_codebook_result, make_codebook_comments, make_response_text, write_nvivo_export,
+                       read_nvivo_header, write_documents)
+
+# Streamlit warns about bare mode on every st.* call; keep the benchmark output readable
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+
+# Corpus sizes (documents) benchmarked by default
+DEFAULT_SIZES = [10, 1000, 10000]
+
+# Distinct recorded responses used for replayed extraction; documents beyond this reuse them
+REPLAY_DOCUMENTS = 100
+
+# Benchmark results are stored here, one JSON file per run
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+def git_commit():
+    """Returns the short hash of the checked-out commit (or 'unknown')."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_stage(timings, name, func, track_memory=True):
+    """Runs func with stdout silenced, recording wall time and peak traced memory under timings[name]."""
+    if track_memory:
+        tracemalloc.start()
+    start_time = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = func()
+    seconds = time.perf_counter() - start_time
+    timings[name] = {"seconds": round(seconds, 4)}
+    if track_memory:
+        timings[name]["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+    print(f"  {name:<18} {seconds:9.3f}s" + (f"  peak {timings[name]['peak_mb']:.1f} MB" if track_memory else ""))
+    return result
+
+def record_responses(template, document_paths, prompt, seed):
+    """Stores a synthetic response for each document, as the record backend would."""
+    for index, path in enumerate(document_paths):
+        fingerprint = model_backend.request_fingerprint(MODEL_NAME, path, prompt)
+        response = types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[
+                types.Part.from_text(text=make_response_text(make_codebook_result(template, index, seed), seed, index))
+            ]))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(prompt_token_count=6000,
+                                                                      candidates_token_count=4000)
+        )
+        model_backend.record_response(fingerprint, response, latency_seconds=0, source=os.path.basename(path))
+
+def benchmark_size(size, template, nvivo_header, work_dir, seed=0, reasoning_words=30, track_memory=True):
+    """
+    Runs every pipeline stage on a synthetic corpus of the given size.
+
+    Parameters:
+    -----------
+    size : int
+        Number of documents
+    template : dict
+        Codebook template the synthetic results follow
+    nvivo_header : list
+        Column header of the NVivo export
+    work_dir : str
+        Scratch directory (used as the working directory, so results/ and experiments/ land there)
+    seed : int
+        Seed for the synthetic data
+    reasoning_words : int
+        Approximate length of each synthetic reasoning string
+    track_memory : bool
+        Record peak memory per stage (tracemalloc slows the stages down)
+
+    Returns:
+    --------
+    dict
+        Stage name -> {"seconds", "peak_mb"}
+    """
+    os.chdir(work_dir)
+    model_backend.RECORDINGS_DIR = os.path.join(work_dir, "recordings")
+    versioning.EXPERIMENTS_DIR = os.path.join(work_dir, "experiments")
+    comments = make_codebook_comments(template)
+
+    # Synthetic inputs (untimed)
+    replay_paths = write_documents(os.path.join(work_dir, "documents"), min(size, REPLAY_DOCUMENTS))
+    record_responses(template, replay_paths, create_dynamic_prompt(template, comments), seed)
+    results = {}
+    json_paths = []
+    os.makedirs(os.path.join(work_dir, "docs"), exist_ok=True)
+    for index in range(size):
+        filename = f"document_{index:05d}.pdf"
+        results[filename] = make_codebook_result(template, index, seed, reasoning_words)
+        json_path = os.path.join(work_dir, "docs", f"document_{index:05d}_codebook.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results[filename], f, indent=4)
+        json_paths.append(json_path)
+    nvivo_path = os.path.join(work_dir, "nvivo_export.csv")
+    write_nvivo_export(nvivo_path, nvivo_header, size, seed)
+    nvivo_data = pd.read_csv(nvivo_path, encoding='utf-8').rename(columns={'Unnamed: 0': 'country'})
+
+    timings = {}
+    run_stage(timings, "prompt_build",
+              lambda: [create_dynamic_prompt(template, comments) for _ in range(size)], track_memory)
+    run_stage(timings, "replay_extraction",
+              lambda: [analyze_pdf_file(replay_paths[i % len(replay_paths)], template, comments, slimming_policy="none")
+                       for i in range(size)], track_memory)
+    llm_data = run_stage(timings, "process_json_files", lambda: process_json_files(json_paths), track_memory)
+    llm_clean, nvivo_clean, irr_results = run_stage(
+        timings, "analyze_irr", lambda: analyze_irr(map_country_names(llm_data), nvivo_data), track_memory)
+
+    def export_report():
+        report_df = generate_irr_report(llm_clean, nvivo_clean, irr_results)
+        os.makedirs("results", exist_ok=True)
+        export_irr_report(report_df, os.path.join("results", "irr_analysis_report.xlsx"))
+    run_stage(timings, "report_export", export_report, track_memory)
+    run_stage(timings, "save_experiment",
+              lambda: versioning.save_experiment(results, template, notes="benchmark", name=f"benchmark_{size}"),
+              track_memory)
+    return timings
+
+def compare_runs(current, previous):
+    """Prints the time ratio of every stage against an earlier run (ratios above 1 are slower)."""
+    print(f"\nCompared with {previous['commit']} ({previous['timestamp']}):")
+    for size, stages in current["sizes"].items():
+        for stage, timing in stages.items():
+            before = previous["sizes"].get(size, {}).get(stage)
+            if before and before["seconds"] > 0:
+                print(f"  {size:>6} docs  {stage:<18} {timing['seconds'] / before['seconds']:6.2f}x "
+                      f"({before['seconds']:.3f}s -> {timing['seconds']:.3f}s)")
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the extraction and IRR pipeline on synthetic corpora')
+    parser.add_argument('--sizes', default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma-separated corpus sizes (documents)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data')
+    parser.add_argument('--reasoning_words', type=int, default=30, help='Length of synthetic reasoning strings')
+    parser.add_argument('--no_memory', action='store_true', help='Skip peak memory tracking (faster, less overhead)')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directories')
+    args = parser.parse_args()
+
+    with open(os.path.join(APP_DIR, "plastics_codebook.json"), 'r', encoding='utf-8') as f:
+        template = json.load(f)
+    nvivo_header = read_nvivo_header(os.path.join(APP_DIR, "nvivo_export.csv"))
+
+    run = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "sizes": {}
+    }
+    original_dir = os.getcwd()
+    for size in [int(size) for size in args.sizes.split(",")]:
+        print(f"{size} documents:")
+        work_dir = tempfile.mkdtemp(prefix=f"greentrac_bench_{size}_")
+        try:
+            run["sizes"][str(size)] = benchmark_size(size, template, nvivo_header, work_dir, args.seed,
+                                                     args.reasoning_words, not args.no_memory)
+        finally:
+            os.chdir(original_dir)
+            if not args.keep:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output_path = os.path.join(RESULTS_DIR, f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{run['commit']}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(run, f, indent=2)
+    print(f"\nResults saved to {output_path}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare_runs(run, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Memory held per Streamlit session for result payloads, before and after moving them to the result store.
+
+Before, every session kept its codebook results and IRR analysis (DataFrames and PNG figures) in
+st.session_state. Now a session keeps only content hashes, and the payloads live once in the shared
+result store (bounded in memory, backed by disk). Each simulated session processes its own synthetic
+corpus and runs the same IRR analysis:
+
+    python benchmarks/session_memory.py --sessions 10 --documents 50
+"""
+import os
+import sys
+import json
+import pickle
+import shutil
+import tempfile
+import tracemalloc
+import logging
+import contextlib
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, APP_DIR)
+
+import result_store
+from IRR_pipeline import process_json_files
+from irr_analysis import run_irr_analysis_for_streamlit
+from synthetic import make_codebook_result, write_nvivo_export, read_nvivo_header
+
+# Streamlit warns about bare mode on every st.* call; keep the output readable
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+
+def session_results(template, session, documents):
+    """Synthetic codebook results of one session's batch, keyed by filename."""
+    return {f"document_{index:05d}.pdf": make_codebook_result(template, index, seed=session)
+            for index in range(documents)}
+
+def irr_payload(template, documents, work_dir):
+    """Runs the IRR analysis on a synthetic corpus and returns the payload a session used to keep."""
+    json_paths = []
+    for filename, result in session_results(template, 0, documents).items():
+        json_path = os.path.join(work_dir, os.path.splitext(filename)[0] + "_codebook.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        json_paths.append(json_path)
+    llm_csv_path = os.path.join(work_dir, "llm_data.csv")
+    process_json_files(json_paths).to_csv(llm_csv_path, index=False)
+    nvivo_path = os.path.join(work_dir, "nvivo_export.csv")
+    write_nvivo_export(nvivo_path, read_nvivo_header(os.path.join(APP_DIR, "nvivo_export.csv")), documents)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return run_irr_analysis_for_streamlit(llm_csv_path, nvivo_path, output_dir=work_dir)
+
+def measure(build_sessions):
+    """Returns the Python memory (bytes) still allocated after build_sessions() and its result."""
+    tracemalloc.start()
+    sessions = build_sessions()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return current, sessions
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Measure result memory per session')
+    parser.add_argument('--sessions', type=int, default=10, help='Simulated concurrent sessions')
+    parser.add_argument('--documents', type=int, default=50, help='Documents processed per session')
+    args = parser.parse_args()
+
+    with open(os.path.join(APP_DIR, "plastics_codebook.json"), 'r', encoding='utf-8') as f:
+        template = json.load(f)
+    # Scratch working directory, so results/ (the result store) lands there
+    original_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="greentrac_session_memory_")
+    os.chdir(work_dir)
+    try:
+        irr_blob = pickle.dumps(irr_payload(template, args.documents, work_dir))
+
+        # Before: each session keeps its own results and IRR analysis objects
+        before, _ = measure(lambda: [
+            {"results": session_results(template, session, args.documents), "irr_analysis": pickle.loads(irr_blob)}
+            for session in range(args.sessions)
+        ])
+
+        # After: each session keeps content hashes; the store holds the serialized payloads once
+        def reference_sessions():
+            sessions = []
+            for session in range(args.sessions):
+                sessions.append({
+                    "result_hashes": {filename: result_store.put_result(result) for filename, result
+                                      in session_results(template, session, args.documents).items()},
+                    "irr_analysis_hash": result_store.put_result(pickle.loads(irr_blob))
+                })
+            return sessions
+        after, _ = measure(reference_sessions)
+        store_bytes = sum(len(payload) for payload in result_store.MEMORY_STORE.values())
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    mb = 2 ** 20
+    print(f"{args.sessions} sessions, {args.documents} documents each:")
+    print(f"  before: {before / mb:8.2f} MB total, {before / args.sessions / mb:7.2f} MB per session")
+    print(f"  after:  {(after - store_bytes) / mb:8.2f} MB in sessions, "
+          f"{(after - store_bytes) / args.sessions / 1024:7.1f} KB per session")
+    print(f"          {store_bytes / mb:8.2f} MB shared in the result store's memory "
+          f"(capped at {result_store.MAX_MEMORY_BYTES / mb:.0f} MB; the rest is read back from disk)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import csv
+import json
+import random
+
+# Words used for synthetic locations and reasoning text
+VOCABULARY = ["plastic", "pollution", "production", "recycling", "waste", "marine", "health", "lifecycle",
+              "treaty", "measure", "target", "ban", "levy", "deposit", "design", "reuse", "emissions",
+              "microplastics", "monitoring", "financing", "transition", "circular", "economy", "climate"]
+
+# Values matched by keyword in IRR_pipeline.process_json_files
+OTHER_OBJECTIVES = ["Circular economy", "Climate change mitigation", "Environmentally sound management",
+                    "Sustainable production and consumption", "Just transition"]
+
+def country_name(index):
+    """Country label in the NVivo export format ('N : Name'), so no name mapping is needed."""
+    return f"{index + 1} : Country {index + 1}"
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + "."
+
+def _extracted(rng, value, reasoning_words):
+    return {
+        "value": value,
+        "location": f"{rng.choice(VOCABULARY).title()}, {rng.choice(VOCABULARY).title()}",
+        "reasoning": " ".join(_sentence(rng, 12) for _ in range(max(reasoning_words // 12, 1)))
+    }
+
+def _fill(template, rng, reasoning_words):
+    """Fills a codebook template with random extracted values ({value, location, reasoning} leaves)."""
+    result = {}
+    for key, value in template.items():
+        if isinstance(value, dict):
+            result[key] = _fill(value, rng, reasoning_words)
+        elif isinstance(value, list):
+            pool = OTHER_OBJECTIVES if key == "other_objectives" else None
+            result[key] = [_extracted(rng, rng.choice(pool) if pool else _sentence(rng, 6), reasoning_words)
+                           for _ in range(rng.randint(0, 3))]
+        elif value is None:
+            result[key] = _extracted(rng, rng.random() < 0.5, reasoning_words)
+        else:
+            result[key] = _extracted(rng, _sentence(rng, 3), reasoning_words)
+    return result
+
+def make_codebook_result(template, index, seed=0, reasoning_words=60):
+    """Returns a synthetic extraction result for document number index (deterministic per seed and index)."""
+    rng = random.Random(f"{seed}:{index}")
+    result = _fill(template, rng, reasoning_words)
+    result["submission_metadata"]["country"]["value"] = country_name(index)
+    result["implementation"]["stringency"]["level"]["value"] = rng.choice(["High", "Low", ""])
+    result["objectives"]["lifecycle_approach"]["coverage"]["value"] = rng.choice(["Full lifecycle", "Partial", ""])
+    return result
+
+def make_codebook_comments(template, prefix=""):
+    """Returns field descriptions for a template in the shape of codebook_finetune.json."""
+    comments = {}
+    for key, value in template.items():
+        if isinstance(value, dict):
+            comments[key] = make_codebook_comments(value, f"{prefix}{key}.")
+        elif value is None:
+            comments[key] = f"Boolean: whether the document mentions {prefix}{key}"
+        elif isinstance(value, list):
+            comments[key] = f"List of the document's statements on {prefix}{key}"
+        else:
+            comments[key] = f"Text describing {prefix}{key}"
+    return comments
+
+def make_response_text(result, seed=0, index=0):
+    """Formats a result the way Gemini answers: a short preamble followed by a ```json block."""
+    rng = random.Random(f"response:{seed}:{index}")
+    return f"{_sentence(rng, 20)}\n\n```json\n{json.dumps(result, indent=2)}\n```\n"
+
+def write_nvivo_export(path, header, count, seed=0):
+    """Writes a synthetic NVivo export with random 0/1 coding for count countries, using a real export's header."""
+    rng = random.Random(f"nvivo:{seed}")
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for index in range(count):
+            writer.writerow([country_name(index)] + [int(rng.random() < 0.3) for _ in header[1:]])
+
+def read_nvivo_header(path):
+    """Reads the column header of an NVivo export."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return next(csv.reader(f))
+
+def write_documents(directory, count):
+    """Writes count small text documents (their content only has to make request fingerprints unique)."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f"document_{index:05d}.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"[Page 1]\nSynthetic policy submission {index}\n")
+        paths.append(path)
+    return paths
@@ -0,0 +1,265 @@
+import os
+import copy
+import json
+import hashlib
+import difflib
+import threading
+from collections import OrderedDict
+
+# Maximum number of codebook pair diffs kept in memory
+MAX_CACHED_DIFFS = 64
+DIFF_CACHE = OrderedDict()
+diff_cache_lock = threading.Lock()
+
+# Codebook path prefixes feeding each IRR category (see IRR_pipeline.process_json_files)
+CATEGORY_PATH_PREFIXES = {
+    'C1: End plastic pollution': ['objectives.end_plastic_pollution'],
+    'C2: Reduce production of plastics': ['objectives.reduce_production'],
+    'C3: Benefits of plastics': ['objectives.benefits_of_plastics'],
+    'C4: Protect human health': ['objectives.protect_human_health'],
+    'C5: Protect biodiversity and environment': ['objectives.protect_biodiversity'],
+    'C6: Addressing full life cycle': ['objectives.lifecycle_approach'],
+    'C7: Other objectives': ['objectives.other_objectives'],
+    'C8: Value chain': ['value_chain'],
+    'C9: Type of measure': ['measures'],
+    'C10: Time horizon of implementation': ['implementation.timeframe'],
+    'C11: Stringency of measure': ['implementation.stringency'],
+}
+
+def hash_codebook(codebook):
+    """Returns a stable SHA-256 hash of a codebook (or any JSON-serializable subtree)."""
+    serialized = json.dumps(codebook, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+def build_hash_tree(node):
+    """
+    Builds a Merkle-style hash tree for a codebook.
+
+    Each dictionary node gets a hash derived from the hashes of its children, so two
+    subtrees with the same hash are identical and can be skipped without walking them.
+
+    Parameters:
+    -----------
+    node : any
+        Codebook node (dict, list or scalar)
+
+    Returns:
+    --------
+    dict
+        {"hash": str, "children": {key: subtree}} for dicts, {"hash": str} for leaves
+    """
+    if isinstance(node, dict):
+        children = {key: build_hash_tree(value) for key, value in node.items()}
+        digest = hashlib.sha256()
+        for key in sorted(children):
+            digest.update(key.encode("utf-8"))
+            digest.update(children[key]["hash"].encode("ascii"))
+        return {"hash": digest.hexdigest(), "children": children}
+    return {"hash": hash_codebook(node)}
+
+def category_for_path(path):
+    """Returns the IRR category a codebook field path feeds into, or None."""
+    for category, prefixes in CATEGORY_PATH_PREFIXES.items():
+        for prefix in prefixes:
+            if path == prefix or path.startswith(prefix + "."):
+                return category
+    return None
+
+def text_diff(old_text, new_text):
+    """Returns a word-level inline diff, marking removals as [-...-] and additions as {+...+}."""
+    old_words = str(old_text).split()
+    new_words = str(new_text).split()
+    matcher = difflib.SequenceMatcher(a=old_words, b=new_words, autojunk=False)
+
+    parts = []
+    for opcode, i1, i2, j1, j2 in matcher.get_opcodes():
+        if opcode == "equal":
+            parts.append(" ".join(old_words[i1:i2]))
+        if opcode in ("delete", "replace"):
+            parts.append("[-" + " ".join(old_words[i1:i2]) + "-]")
+        if opcode in ("insert", "replace"):
+            parts.append("{+" + " ".join(new_words[j1:j2]) + "+}")
+    return " ".join(parts)
+
+def _collect_leaves(node, prefix):
+    """Yields (path, value) for every leaf below a codebook node."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _collect_leaves(value, f"{prefix}{key}.")
+    else:
+        yield prefix.rstrip("."), node
+
+def _diff_nodes(old_node, new_node, old_tree, new_tree, prefix, changes):
+    """Recursively compares two codebook nodes, skipping subtrees whose hashes match."""
+    if old_tree["hash"] == new_tree["hash"]:
+        return
+
+    if "children" not in old_tree or "children" not in new_tree:
+        # Leaf changed, or a leaf was replaced by a subtree (or vice versa)
+        path = prefix.rstrip(".")
+        change = {
+            "path": path,
+            "change": "changed",
+            "old": old_node,
+            "new": new_node,
+            "category": category_for_path(path),
+        }
+        if isinstance(old_node, str) and isinstance(new_node, str):
+            change["text_diff"] = text_diff(old_node, new_node)
+        changes["changed"].append(change)
+        return
+
+    for key in old_node:
+        if key not in new_node:
+            for path, value in _collect_leaves(old_node[key], f"{prefix}{key}."):
+                changes["removed"].append({"path": path, "change": "removed", "old": value, "new": None,
+                                           "category": category_for_path(path)})
+
+    for key in new_node:
+        if key not in old_node:
+            for path, value in _collect_leaves(new_node[key], f"{prefix}{key}."):
+                changes["added"].append({"path": path, "change": "added", "old": None, "new": value,
+                                         "category": category_for_path(path)})
+        else:
+            _diff_nodes(old_node[key], new_node[key],
+                        old_tree["children"][key], new_tree["children"][key],
+                        f"{prefix}{key}.", changes)
+
+def codebook_file_key(path):
+    """Cache key for a codebook loaded from path: the file's path, modification time and size."""
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+def diff_codebooks(old_codebook, new_codebook, cache_key=None):
+    """
+    Computes a structural diff between two codebook comment trees.
+
+    Results are memoized, so repeated comparisons of the same experiments (e.g. on
+    every Streamlit rerun) are served from memory without building the hash trees.
+    Each caller gets its own copy of the diff.
+
+    Parameters:
+    -----------
+    old_codebook : dict
+        The baseline codebook comments
+    new_codebook : dict
+        The codebook comments to compare against the baseline
+    cache_key : tuple, optional
+        Key identifying the pair, e.g. the codebook_file_key of both files when the
+        codebooks were loaded from disk; defaults to the pair of codebook hashes
+
+    Returns:
+    --------
+    dict
+        Dictionary with 'old_hash', 'new_hash' and lists of 'added', 'removed' and
+        'changed' fields. Each change has 'path', 'change', 'old', 'new', 'category'
+        and, for changed descriptions, a word-level 'text_diff'.
+    """
+    old_codebook = old_codebook or {}
+    new_codebook = new_codebook or {}
+    if cache_key is None:
+        cache_key = (hash_codebook(old_codebook), hash_codebook(new_codebook))
+
+    with diff_cache_lock:
+        if cache_key in DIFF_CACHE:
+            DIFF_CACHE.move_to_end(cache_key)
+            return copy.deepcopy(DIFF_CACHE[cache_key])
+
+    old_tree = build_hash_tree(old_codebook)
+    new_tree = build_hash_tree(new_codebook)
+    changes = {
+        "old_hash": old_tree["hash"],
+        "new_hash": new_tree["hash"],
+        "added": [],
+        "removed": [],
+        "changed": [],
+    }
+    _diff_nodes(old_codebook, new_codebook, old_tree, new_tree, "", changes)
+
+    with diff_cache_lock:
+        DIFF_CACHE[cache_key] = changes
+        while len(DIFF_CACHE) > MAX_CACHED_DIFFS:
+            DIFF_CACHE.popitem(last=False)
+
+    return copy.deepcopy(changes)
+
+def summarize_diff_by_category(codebook_diff):
+    """Counts the number of changed codebook fields per IRR category."""
+    counts = {}
+    for kind in ("added", "removed", "changed"):
+        for change in codebook_diff.get(kind, []):
+            category = change.get("category") or "Uncategorized"
+            counts[category] = counts.get(category, 0) + 1
+    return counts
+
+def changed_field_paths(codebook_diff):
+    """Returns the sorted field paths that were added or changed in a codebook diff."""
+    paths = {change["path"] for kind in ("added", "changed") for change in codebook_diff.get(kind, [])}
+    return sorted(paths)
+
+def removed_field_paths(codebook_diff):
+    """Returns the sorted field paths that were removed in a codebook diff."""
+    return sorted({change["path"] for change in codebook_diff.get("removed", [])})
+
+def remove_paths(tree, paths):
+    """
+    Returns a copy of a codebook or result tree without the given field paths.
+
+    Sections left empty by the removal are dropped as well. Paths not present in the
+    tree are ignored.
+    """
+    pruned = copy.deepcopy(tree)
+    for path in paths:
+        keys = path.split(".")
+        parents = []
+        node = pruned
+        for key in keys[:-1]:
+            if not isinstance(node, dict) or key not in node:
+                node = None
+                break
+            parents.append((node, key))
+            node = node[key]
+        if not isinstance(node, dict) or keys[-1] not in node:
+            continue
+        del node[keys[-1]]
+        for parent, key in reversed(parents):
+            if parent[key] == {}:
+                del parent[key]
+    return pruned
+
+def subset_codebook(codebook, paths):
+    """
+    Returns a copy of a codebook tree containing only the given field paths.
+
+    A path may point at a single field ("objectives.end_plastic_pollution.mentioned")
+    or at a whole subtree ("value_chain.upstream"). Paths not present in the
+    codebook are ignored.
+    """
+    subset = {}
+    for path in paths:
+        keys = path.split(".")
+        source = codebook
+        target = subset
+        for depth, key in enumerate(keys):
+            if not isinstance(source, dict) or key not in source:
+                break
+            if depth == len(keys) - 1:
+                target[key] = copy.deepcopy(source[key])
+            else:
+                source = source[key]
+                target = target.setdefault(key, {})
+    return _drop_empty_branches(subset)
+
+def _drop_empty_branches(node):
+    """Removes dictionaries left empty by subset_codebook when a path did not resolve."""
+    if not isinstance(node, dict):
+        return node
+    pruned = {}
+    for key, value in node.items():
+        if isinstance(value, dict) and value:
+            value = _drop_empty_branches(value)
+            if value:
+                pruned[key] = value
+        elif not (isinstance(value, dict) and not value):
+            pruned[key] = value
+    return pruned
@@ -0,0 +1,97 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+
+from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# How long a cached prompt prefix lives on the server
+CACHE_TTL_SECONDS = 60 * 60
+
+# Stop reusing a cache this long before it expires
+EXPIRY_MARGIN_SECONDS = 60
+
+# After a failed cache creation (e.g. prompt below the model's minimum cache size),
+# don't try again for this prompt until this much time has passed
+UNAVAILABLE_RETRY_SECONDS = 30 * 60
+
+# Process-wide mapping of (model, prompt hash, scope) -> cache entry, shared by all sessions
+PROMPT_CACHES = {}
+cache_lock = threading.Lock()
+creation_locks = defaultdict(threading.Lock)
+
+def hash_prompt(prompt):
+    """Returns the SHA-256 hash of a prompt string."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def get_prompt_cache(client, model, prompt, now=None, scope=""):
+    """
+    Returns the name of a server-side cache holding the prompt, creating it once per prompt hash.
+
+    Parameters:
+    -----------
+    client : genai.Client
+        Gemini client used to create the cache
+    model : str
+        Model the cache is created for (must match the generate_content model)
+    prompt : str
+        The static prompt prefix (codebook instructions and template)
+    now : float, optional
+        Current Unix time (defaults to time.time())
+    scope : str, optional
+        Namespace for the cache (e.g. the API key label); caches belong to one key's project
+
+    Returns:
+    --------
+    tuple
+        (cache_name, status) where status is 'hit', 'created' or 'unavailable'.
+        cache_name is None when caching is unavailable.
+    """
+    key = (model, hash_prompt(prompt), scope)
+
+    with cache_lock:
+        creation_lock = creation_locks[key]
+
+    # Only one request creates the cache; concurrent requests wait and then reuse it
+    with creation_lock:
+        current_time = now if now is not None else time.time()
+        with cache_lock:
+            entry = PROMPT_CACHES.get(key)
+
+        if entry:
+            if entry.get("name") and entry["expires_at"] - EXPIRY_MARGIN_SECONDS > current_time:
+                return entry["name"], "hit"
+            if not entry.get("name") and entry["retry_after"] > current_time:
+                return None, "unavailable"
+
+        try:
+            cached_content = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    contents=[prompt],
+                    ttl=f"{CACHE_TTL_SECONDS}s",
+                    display_name=f"greentrac-prompt-{key[1][:12]}"
+                )
+            )
+        except Exception as e:
+            logger.info("Context caching unavailable, sending prompt inline: %s", e)
+            with cache_lock:
+                PROMPT_CACHES[key] = {"name": None, "retry_after": current_time + UNAVAILABLE_RETRY_SECONDS}
+            return None, "unavailable"
+
+        if cached_content.expire_time is not None:
+            expires_at = cached_content.expire_time.timestamp()
+        else:
+            expires_at = current_time + CACHE_TTL_SECONDS
+
+        with cache_lock:
+            PROMPT_CACHES[key] = {"name": cached_content.name, "expires_at": expires_at}
+        return cached_content.name, "created"
+
+def invalidate_prompt_cache(model, prompt, scope=""):
+    """Forgets the cache for a prompt (e.g. after the server rejected it)."""
+    with cache_lock:
+        PROMPT_CACHES.pop((model, hash_prompt(prompt), scope), None)
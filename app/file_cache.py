@@ -0,0 +1,106 @@
+import os
+import sys
+import copy
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import increment
+
+# Parsed files kept per process (shared by all sessions), evicted least recently used first
+MAX_CACHED_FILES = 128
+
+# Upper bound on the estimated memory of the cached values (see _estimate_bytes); a parsed file
+# can take several times its size on disk, and values larger than this are never cached
+MAX_CACHED_BYTES = 256 * 1024 * 1024
+
+FILE_CACHE = OrderedDict()
+file_cache_lock = threading.Lock()
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+def _hash_contents(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _estimate_bytes(value):
+    """Approximate memory held by a parsed value; DataFrames and Series report their own (deep) usage."""
+    if hasattr(value, "memory_usage"):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_bytes(key) + _estimate_bytes(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(_estimate_bytes(item) for item in value)
+    return size
+
+def read_json(path):
+    """Loader for JSON files."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def cached_load(path, loader, copy_value=True):
+    """
+    Returns loader(path), parsing the file only when it has changed since it was last loaded.
+
+    Entries are keyed by path and loader (a module-level function such as read_json or
+    pd.read_excel) and validated by the file's mtime and size. If those changed but the
+    content hash didn't (e.g. the file was touched or rewritten unchanged) the cached value
+    is kept. Raises FileNotFoundError like the loader would.
+
+    Parameters:
+    -----------
+    path : str
+        File to load
+    loader : callable
+        Parses the file at the given path
+    copy_value : bool
+        Return a deep copy, so callers may modify the result. Pass False only for
+        read-only use of large values
+
+    Returns:
+    --------
+    any
+        The loaded value
+    """
+    path = os.path.abspath(path)
+    key = (path, loader)
+    signature = _signature(path)
+    with file_cache_lock:
+        entry = FILE_CACHE.get(key)
+        if entry is not None and entry["signature"] == signature:
+            FILE_CACHE.move_to_end(key)
+            value = entry["value"]
+            outcome = "hit"
+        else:
+            outcome = None
+
+    if outcome is None:
+        digest = _hash_contents(path)
+        if entry is not None and entry["sha256"] == digest:
+            value = entry["value"]
+            outcome = "revalidated"
+            with file_cache_lock:
+                entry["signature"] = signature
+        else:
+            value = loader(path)
+            outcome = "miss"
+            size = _estimate_bytes(value)
+            if size <= MAX_CACHED_BYTES:
+                with file_cache_lock:
+                    FILE_CACHE[key] = {"signature": signature, "sha256": digest, "size": size, "value": value}
+                    FILE_CACHE.move_to_end(key)
+                    total_bytes = sum(e["size"] for e in FILE_CACHE.values())
+                    while len(FILE_CACHE) > MAX_CACHED_FILES or total_bytes > MAX_CACHED_BYTES:
+                        _, evicted = FILE_CACHE.popitem(last=False)
+                        total_bytes -= evicted["size"]
+
+    increment("greentrac_file_cache_total", outcome=outcome)
+    return copy.deepcopy(value) if copy_value else value
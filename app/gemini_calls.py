@@ -1,5 +1,7 @@
 import os
+import copy
 import json
+import logging
 import re
 import time
 import threading
@@ -8,24 +10,72 @@ from google import genai
 from google.genai import types
 import pathlib
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from codebook_diff import remove_paths, subset_codebook
+from upload_registry import get_pdf_part, invalidate_pdf_part
+from context_cache import get_prompt_cache, invalidate_prompt_cache
+from pdf_slimming import slim_pdf
+from page_ranking import select_section_pages, write_page_subset, page_map_note
+from windowing import count_pages, needs_windowing, plan_windows, write_window, merge_window_results
+from resilience import REQUEST_TIMEOUT_SECONDS, breaker_is_open, call_with_retries, error_label, is_retryable
+from adaptive_rate import MAX_CONCURRENCY, current_limits, record_success, record_throttle, request_slot, set_usable_keys
+from api_key_pool import (
+    acquire_key, calls_left_today, environment_api_keys, key_label, next_key_available_at, report_key_error,
+    usable_key_count
+)
+from user_quota import check_allowance, fair_share_turn, record_user_usage
+from model_backend import is_replay, is_recording, request_fingerprint, record_response, replay_response
+from stage_timing import span, add_tokens
+from metrics import increment, observe, set_gauge, register_collector
+from profiling import profiled
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Rate limiter setup
-MAX_CALLS_PER_MINUTE = 10
+# Gemini model used for extraction
+MODEL_NAME = "gemini-1.5-flash"
+
+# Upload each PDF once through the file API instead of inlining it in every request
+USE_FILE_API = os.getenv("GREENTRAC_USE_FILE_API", "1") != "0"
+
+# Cache the static prompt prefix on the server instead of resending it with every PDF
+USE_CONTEXT_CACHE = os.getenv("GREENTRAC_USE_CONTEXT_CACHE", "1") != "0"
+
+# Default local pre-processing applied to PDFs before sending them (see pdf_slimming.SLIMMING_POLICIES)
+PDF_SLIMMING_POLICY = os.getenv("GREENTRAC_PDF_POLICY", "none")
+
+# Thread pool size for sectioned and windowed extraction; the number of requests actually
+# in flight is limited by the adaptive concurrency (see adaptive_rate)
+SECTION_WORKERS = MAX_CONCURRENCY
+
+# Wait at most this long for a quarantined API key before failing a request
+MAX_KEY_WAIT_SECONDS = 120
+
+# HTTP status codes that indicate throttling or overload
+THROTTLE_STATUS_CODES = {429, 503}
+
+# HTTP status codes with which the API rejects a reference to an uploaded file that is gone
+FILE_REJECTED_STATUS_CODES = {403, 404}
+
+# Rate limiter setup (the calls-per-minute budget is learned, see adaptive_rate)
 CALL_HISTORY = deque()
 lock = threading.Lock()
 
 def rate_limit():
     """Rate limits the API calls to avoid exceeding the quota."""
     with lock:
+        max_calls = max(int(current_limits()[0]), 1)
         current_time = time.time()
         while CALL_HISTORY and CALL_HISTORY[0] <= current_time - 60:
             CALL_HISTORY.popleft()
-        if len(CALL_HISTORY) >= MAX_CALLS_PER_MINUTE:
-            sleep_time = 60 - (current_time - CALL_HISTORY[0])
+        if len(CALL_HISTORY) >= max_calls:
+            # Wait until enough calls have left the window (the budget may have just shrunk)
+            sleep_time = 60 - (current_time - CALL_HISTORY[len(CALL_HISTORY) - max_calls])
             st.warning(f"Rate limit hit. Waiting for {sleep_time:.2f} seconds.")
             time.sleep(sleep_time)
         CALL_HISTORY.append(time.time())
@@ -214,27 +264,33 @@ def process_extracted_data(data):
                             process_extracted_data(item)
     return data
 
-def get_api_key(user_provided_key=None):
-    """Get the API key from various sources in order of priority."""
+def get_api_keys(user_provided_key=None):
+    """
+    Get the pool of API keys requests are spread across.
+
+    A user-provided key or the key entered in the sidebar comes first, followed by the
+    keys from the environment (GOOGLE_API_KEYS, comma-separated, and GOOGLE_API_KEY).
+    """
+    api_keys = []
+    
     # 1. Use the user-provided key if available
     if user_provided_key:
-        return user_provided_key
+        api_keys.append(user_provided_key)
     
     # 2. Check if there's a key in session state
     if 'api_key' in st.session_state and st.session_state.api_key:
-        return st.session_state.api_key
+        api_keys.append(st.session_state.api_key)
     
-    # 3. Check for environment variable from .env file
-    env_key = os.getenv("GOOGLE_API_KEY")
-    if env_key:
-        return env_key
+    # 3. Check for environment variables from .env file
+    api_keys.extend(environment_api_keys())
     
     # If no API key found, show error
-    st.error("No API key found. Please enter an API key in the sidebar or add it to your .env file.")
-    return None
+    if not api_keys:
+        st.error("No API key found. Please enter an API key in the sidebar or add it to your .env file.")
+    return list(dict.fromkeys(api_keys))
 
-def analyze_pdf_file(pdf_file_path, codebook_template, codebook_comments, api_key=None):
-    """Analyzes a PDF file using Gemini and returns a populated codebook JSON."""
+def _get_api_keys(pdf_file_path, api_key=None):
+    """Checks the PDF exists and returns the API key pool, or None on failure."""
     try:
         # Check if file exists
         if not os.path.exists(pdf_file_path):
@@ -244,63 +300,566 @@ def analyze_pdf_file(pdf_file_path, codebook_template, codebook_comments, api_ke
         st.error(f"Error checking PDF file: {e}")
         return None
 
-    # Get the API key from various sources
-    api_key = get_api_key(api_key)
+    # Replayed responses don't need an API key
+    if is_replay():
+        return []
+
+    # Get the API keys from various sources
+    api_keys = get_api_keys(api_key)
     
     # Check if we have a valid API key
-    if not api_key:
+    if not api_keys:
         st.error("No valid API key found. Please provide an API key to continue.")
         return None
-    
-    # Set up environment variable for API key
-    os.environ["GOOGLE_API_KEY"] = api_key
-    
-    # Initialize Gemini client
-    client = genai.Client()
-    
-    # Use st.status to show processing status
-    with st.status(f"Processing {os.path.basename(pdf_file_path)}...", expanded=True) as status:
-        st.write("Creating dynamic prompt...")
-        
-        prompt = create_dynamic_prompt(codebook_template, codebook_comments)
-        
-        status.update(label=f"Rate limiting API calls", state="running")
-        rate_limit()  # Rate limiter called before API call
-        
-        status.update(label=f"Sending PDF to Gemini API", state="running")
+    # The learned request rate may grow with the number of keys that can take requests
+    set_usable_keys(usable_key_count(api_keys))
+    return api_keys
+
+def collect_api_gauges():
+    """Updates the quota, adaptive rate and circuit breaker gauges (called when metrics are rendered)."""
+    calls_per_minute, concurrency = current_limits()
+    set_gauge("greentrac_rate_limit_calls_per_minute", calls_per_minute)
+    set_gauge("greentrac_rate_limit_concurrency", concurrency)
+    set_gauge("greentrac_quota_remaining_requests", calls_left_today(environment_api_keys()))
+    set_gauge("greentrac_circuit_breaker_open", 1 if breaker_is_open() else 0)
+
+register_collector(collect_api_gauges)
+
+clients = {}
+clients_lock = threading.Lock()
+
+def _client_for_key(api_key):
+    """Returns a Gemini client for an API key, reusing clients across requests."""
+    with clients_lock:
+        if api_key not in clients:
+            # Initialize Gemini client with a per-request timeout (milliseconds)
+            clients[api_key] = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(timeout=REQUEST_TIMEOUT_SECONDS * 1000)
+            )
+        return clients[api_key]
+
+def _acquire_api_key(api_keys):
+    """Picks the key with the most remaining quota, waiting briefly if all keys are temporarily quarantined."""
+    api_key = acquire_key(api_keys)
+    while api_key is None:
+        wait_seconds = next_key_available_at(api_keys) - time.time()
+        if wait_seconds > MAX_KEY_WAIT_SECONDS:
+            raise RuntimeError(f"All {len(api_keys)} API keys are out of quota for the next {wait_seconds / 60:.0f} minutes")
+        time.sleep(max(wait_seconds, 1))
+        api_key = acquire_key(api_keys)
+    return api_key
+
+def _prepare_document(pdf_file_path, slimming_policy=None, run_info=None):
+    """
+    Applies the slimming policy to a PDF and returns the path of the document to send.
+
+    Savings are recorded in run_info['slimming']. If slimming fails the original PDF is used.
+    """
+    policy = slimming_policy or PDF_SLIMMING_POLICY
+    try:
+        document_path, stats = slim_pdf(pdf_file_path, policy)
+    except Exception as e:
+        st.warning(f"Could not apply '{policy}' pre-processing to {os.path.basename(pdf_file_path)}, sending original PDF: {e}")
+        return pdf_file_path
+
+    if run_info is not None:
+        run_info["slimming"] = stats
+    return document_path
+
+def _pdf_part(client, pdf_file_path, api_key):
+    """Returns the document as a Gemini Part, referencing a copy previously uploaded with the same key when possible."""
+    if pdf_file_path.endswith(".txt"):
+        # Documents converted to text by the slimming pre-pass are sent inline
+        with open(pdf_file_path, 'r', encoding='utf-8') as f:
+            return types.Part.from_text(text=f.read())
+
+    if USE_FILE_API:
         try:
-            # Create a pathlib Path object for the PDF
-            pdf_path = pathlib.Path(pdf_file_path)
+            # Uploaded files belong to the key's project, so uploads are tracked per key
+            return get_pdf_part(client, pdf_file_path, scope=key_label(api_key))
+        except Exception as e:
+            st.warning(f"File upload failed for {os.path.basename(pdf_file_path)}, sending inline instead: {e}")
+
+    # Create a pathlib Path object for the PDF
+    pdf_path = pathlib.Path(pdf_file_path)
+    return types.Part.from_bytes(
+        data=pdf_path.read_bytes(),
+        mime_type='application/pdf',
+    )
+
+run_info_lock = threading.Lock()
+
+def _record_context_cache(run_info, outcome):
+    """Counts context cache outcomes ('hit', 'created', 'unavailable', 'fallback') in run_info."""
+    increment("greentrac_context_cache_total", outcome=outcome)
+    if run_info is None:
+        return
+    with run_info_lock:
+        counts = run_info.setdefault("context_cache", {})
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+def _generate(client, pdf_part, prompt, run_info=None, prompt_note="", api_key=""):
+    """
+    Calls Gemini with the PDF and prompt, using a server-side cache of the prompt when available.
+
+    prompt_note is request-specific text (e.g. a page map) sent after the cacheable prompt.
+    If the cache can't be created or is rejected, the prompt is sent inline instead.
+    """
+    if USE_CONTEXT_CACHE:
+        cache_name, cache_status = get_prompt_cache(client, MODEL_NAME, prompt, scope=key_label(api_key))
+        _record_context_cache(run_info, cache_status)
+        if cache_name:
+            try:
+                return client.models.generate_content(
+                    model=MODEL_NAME,
+                    contents=[pdf_part, prompt_note] if prompt_note else [pdf_part],
+                    config=types.GenerateContentConfig(cached_content=cache_name)
+                )
+            except Exception as e:
+                # Throttling and server errors are retried by the caller, not treated as a bad cache
+                if is_retryable(e):
+                    raise
+                # The cache may have been deleted or expired early; forget it and send inline
+                logger.warning("Cached prompt %s rejected, sending prompt inline: %s", cache_name, e)
+                invalidate_prompt_cache(MODEL_NAME, prompt, scope=key_label(api_key))
+                _record_context_cache(run_info, "fallback")
+
+    return client.models.generate_content(
+        model=MODEL_NAME,
+        contents=[pdf_part, prompt + prompt_note]
+    )
+
+def _generate_for_file(client, pdf_part, pdf_file_path, prompt, run_info=None, prompt_note="", api_key=""):
+    """
+    Calls _generate, uploading the PDF again once if the API rejects the uploaded copy.
+
+    Uploaded files can be deleted or expire before the registry's expiry time; the API then
+    answers 403/404 for the file reference, so the stale handle is dropped like a rejected cache.
+    """
+    try:
+        return _generate(client, pdf_part, prompt, run_info, prompt_note, api_key)
+    except Exception as e:
+        if getattr(e, "code", None) not in FILE_REJECTED_STATUS_CODES or pdf_part.file_data is None:
+            raise
+        logger.warning("Uploaded copy of %s rejected, uploading again: %s", os.path.basename(pdf_file_path), e)
+        invalidate_pdf_part(pdf_file_path, scope=key_label(api_key))
+        with span(run_info, "upload"):
+            pdf_part = _pdf_part(client, pdf_file_path, api_key)
+        return _generate(client, pdf_part, prompt, run_info, prompt_note, api_key)
+
+def _record_key_use(run_info, api_key):
+    """Counts requests per API key (by label) in run_info['api_keys']."""
+    if run_info is None:
+        return
+    with run_info_lock:
+        counts = run_info.setdefault("api_keys", {})
+        counts[key_label(api_key)] = counts.get(key_label(api_key), 0) + 1
+
+def _current_username():
+    """Returns the logged-in user for accounting (works from worker threads attached to the session)."""
+    try:
+        return st.session_state.get("username") or "anonymous"
+    except Exception:
+        return "anonymous"
+
+def _request_codebook_json(api_keys, pdf_file_path, prompt, status=None, run_info=None, prompt_note=""):
+    """
+    Sends the PDF and a prompt to Gemini and returns the processed codebook JSON, or None.
+
+    Each attempt is routed to the key with the most remaining quota; keys that hit their
+    quota are quarantined so retries go to another key. Requests and tokens are charged
+    to the logged-in user, and users take turns at the rate limiter (fair share).
+
+    With the record backend every response is stored under its request fingerprint; with
+    the replay backend stored responses are served without keys, quota or rate limiting
+    (see model_backend).
+    """
+    def update_status(label, state="running"):
+        if status is not None:
+            status.update(label=label, state=state)
+
+    username = _current_username()
+    if not is_replay():
+        allowed, message = check_allowance(username)
+        if not allowed:
+            st.error(message)
+            update_status("Daily allowance used up", state="error")
+            return None
+
+    update_status("Sending PDF to Gemini API")
+    try:
+        fingerprint = None
+        if is_replay() or is_recording():
+            fingerprint = request_fingerprint(MODEL_NAME, pdf_file_path, prompt, prompt_note)
+
+        def attempt():
+            if is_replay():
+                with span(run_info, "model_latency"):
+                    return replay_response(fingerprint)
+
+            api_key = _acquire_api_key(api_keys)
+            _record_key_use(run_info, api_key)
+            client = _client_for_key(api_key)
+            with span(run_info, "upload"):
+                pdf_part = _pdf_part(client, pdf_file_path, api_key)
             
-            # Generate content with PDF and prompt
-            response = client.models.generate_content(
-                model="gemini-1.5-flash",
-                contents=[
-                    types.Part.from_bytes(
-                        data=pdf_path.read_bytes(),
-                        mime_type='application/pdf',
-                    ),
-                    prompt
-                ]
+            # Latencies and throttling responses drive the adaptive rate and concurrency
+            with request_slot():
+                start_time = time.time()
+                try:
+                    with span(run_info, "model_latency"):
+                        response = _generate_for_file(client, pdf_part, pdf_file_path, prompt, run_info,
+                                                      prompt_note, api_key)
+                except Exception as e:
+                    increment("greentrac_gemini_requests_total", outcome="error", code=error_label(e))
+                    observe("greentrac_gemini_request_seconds", time.time() - start_time)
+                    record_user_usage(username)
+                    report_key_error(api_key, e)
+                    if getattr(e, "code", None) in THROTTLE_STATUS_CODES:
+                        record_throttle()
+                    raise
+            record_success(time.time() - start_time)
+            increment("greentrac_gemini_requests_total", outcome="ok", code="200")
+            observe("greentrac_gemini_request_seconds", time.time() - start_time)
+            if is_recording():
+                record_response(fingerprint, response, time.time() - start_time, os.path.basename(pdf_file_path))
+            usage = getattr(response, "usage_metadata", None)
+            increment("greentrac_gemini_tokens_total", getattr(usage, "prompt_token_count", 0) or 0, kind="input")
+            increment("greentrac_gemini_tokens_total", getattr(usage, "candidates_token_count", 0) or 0, kind="output")
+            record_user_usage(
+                username,
+                input_tokens=getattr(usage, "prompt_token_count", 0),
+                output_tokens=getattr(usage, "candidates_token_count", 0)
             )
-            
-            status.update(label=f"Extracting response data", state="running")
+            return response
+        
+        def wait_turn():
+            with span(run_info, "rate_limit_wait"):
+                fair_share_turn(username, rate_limit)
+        
+        # Generate content with PDF and prompt; transient errors are retried with backoff and
+        # the rate limiter is called before every attempt so retries share the same budget
+        response = call_with_retries(
+            attempt,
+            run_info=run_info,
+            before_attempt=None if is_replay() else wait_turn,
+            use_breaker=not is_replay()
+        )
+        add_tokens(run_info, getattr(response, "usage_metadata", None))
+        
+        update_status("Extracting response data")
+        with span(run_info, "parse"):
             extracted_json, reasoning_text = extract_answer_and_reasoning(response)
 
-            if extracted_json:
-                status.update(label=f"Processing extracted data", state="running")
+        if extracted_json:
+            update_status("Processing extracted data")
+            with span(run_info, "normalize"):
                 # First add any missing reasoning from the response text
                 extracted_json_with_reasoning = add_reasoning_to_json(extracted_json, reasoning_text)
                 # Then ensure proper structure
                 processed_json = process_extracted_data(extracted_json_with_reasoning)
-                status.update(label=f"Finished processing", state="complete")
-                return processed_json
-            else:
-                st.error(f"Error: No JSON extracted from Gemini response for {os.path.basename(pdf_file_path)}")
-                status.update(label=f"Processing failed", state="error")
-                return None
-                
+            update_status("Finished processing", state="complete")
+            return processed_json
+        else:
+            st.error(f"Error: No JSON extracted from Gemini response for {os.path.basename(pdf_file_path)}")
+            update_status("Processing failed", state="error")
+            return None
+            
+    except Exception as e:
+        st.error(f"Error processing PDF with Gemini API: {e}")
+        update_status("API error", state="error")
+        return None
+
+@profiled("analyze_pdf_file")
+def analyze_pdf_file(pdf_file_path, codebook_template, codebook_comments, api_key=None, run_info=None,
+                     slimming_policy=None):
+    """
+    Analyzes a PDF file using Gemini and returns a populated codebook JSON.
+
+    Documents above the windowing thresholds are split into overlapping page windows
+    (see analyze_pdf_file_windowed). Context cache usage and pre-processing savings are
+    recorded in run_info (if provided).
+    """
+    api_keys = _get_api_keys(pdf_file_path, api_key)
+    if api_keys is None:
+        return None
+    document_path = _prepare_document(pdf_file_path, slimming_policy, run_info)
+    
+    if not document_path.endswith(".txt"):
+        try:
+            page_count = count_pages(document_path)
         except Exception as e:
-            st.error(f"Error processing PDF with Gemini API: {e}")
-            status.update(label=f"API error", state="error")
-            return None
\ No newline at end of file
+            logger.warning("Could not count pages of %s, sending whole document: %s", document_path, e)
+            page_count = 0
+        if page_count and needs_windowing(document_path, page_count):
+            return analyze_pdf_file_windowed(api_keys, pdf_file_path, document_path, page_count,
+                                             codebook_template, codebook_comments, run_info)
+    
+    # Use st.status to show processing status
+    with st.status(f"Processing {os.path.basename(pdf_file_path)}...", expanded=True) as status:
+        st.write("Creating dynamic prompt...")
+        
+        with span(run_info, "prompt_build"):
+            prompt = create_dynamic_prompt(codebook_template, codebook_comments)
+        
+        return _request_codebook_json(api_keys, document_path, prompt, status, run_info)
+
+def create_incremental_prompt(codebook_template, codebook_comments, changed_paths):
+    """Creates a prompt that only asks for the given codebook fields and subtrees."""
+    partial_template = subset_codebook(codebook_template, changed_paths)
+    partial_comments = subset_codebook(codebook_comments, changed_paths)
+
+    prompt = create_dynamic_prompt(partial_template, partial_comments)
+    prompt += """
+    NOTE: This is a partial extraction. Only the fields in the codebook structure above are requested,
+    because their definitions changed. Output only these fields, keeping the nesting shown above.
+    """
+    return prompt
+
+def merge_extracted_results(previous_result, partial_result):
+    """
+    Merges a partial extraction into a previous result.
+
+    Extracted values ({"value", "location", "reasoning"} objects, lists and scalars) from
+    the partial result replace the previous ones; nested sections are merged recursively.
+    """
+    merged = copy.deepcopy(previous_result) if isinstance(previous_result, dict) else {}
+
+    for key, value in partial_result.items():
+        is_section = isinstance(value, dict) and "value" not in value
+        if is_section and isinstance(merged.get(key), dict) and "value" not in merged[key]:
+            merged[key] = merge_extracted_results(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+def analyze_pdf_file_incremental(pdf_file_path, codebook_template, codebook_comments,
+                                 previous_result, changed_paths, api_key=None, run_info=None,
+                                 slimming_policy=None, removed_paths=None):
+    """
+    Re-extracts only the changed codebook fields for a PDF and merges them into a previous result.
+
+    Fields in removed_paths (no longer in the codebook) are dropped from the previous result.
+    If no fields changed the pruned previous result is returned without calling the API.
+    """
+    previous_result = remove_paths(previous_result, removed_paths or [])
+    if not changed_paths:
+        return previous_result
+
+    api_keys = _get_api_keys(pdf_file_path, api_key)
+    if api_keys is None:
+        return None
+    document_path = _prepare_document(pdf_file_path, slimming_policy, run_info)
+
+    with st.status(f"Updating {os.path.basename(pdf_file_path)} ({len(changed_paths)} changed fields)...",
+                   expanded=True) as status:
+        st.write("Creating targeted prompt for changed fields...")
+
+        with span(run_info, "prompt_build"):
+            prompt = create_incremental_prompt(codebook_template, codebook_comments, changed_paths)
+
+        partial_result = _request_codebook_json(api_keys, document_path, prompt, status, run_info)
+        if partial_result is None:
+            return None
+
+        return merge_extracted_results(previous_result, partial_result)
+
+def _run_in_threads(func, items, max_workers):
+    """Runs func over items in a thread pool (attached to the Streamlit session) and returns results in order."""
+    ctx = get_script_run_ctx()
+
+    def run(item):
+        # Let st.* calls made from worker threads render in the calling session
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return func(item)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, items))
+
+def merge_section_results(section_results, codebook_template):
+    """
+    Merges per-section extraction results into one codebook result.
+
+    Parameters:
+    -----------
+    section_results : dict
+        Maps each top-level section name to the JSON returned for it (or None)
+    codebook_template : dict
+        The full codebook template
+
+    Returns:
+    --------
+    tuple
+        (merged_result, merge_conflicts) where merge_conflicts lists keys returned by
+        more than one section request. The section that owns a key always wins.
+    """
+    merged = {}
+    owners = {}
+    conflicts = []
+
+    for section, result in section_results.items():
+        if not isinstance(result, dict):
+            continue
+        # The model sometimes returns the section contents without the top-level key
+        section_keys = codebook_template.get(section)
+        if section not in result and isinstance(section_keys, dict) and set(result) & set(section_keys):
+            result = {section: result}
+
+        for key, value in result.items():
+            if key in owners:
+                # Prefer the request that was actually asked for this section
+                if key == section:
+                    conflicts.append({"key": key, "kept_from": section, "also_returned_by": owners[key]})
+                else:
+                    conflicts.append({"key": key, "kept_from": owners[key], "also_returned_by": section})
+                    continue
+            merged[key] = value
+            owners[key] = section
+
+    return merged, conflicts
+
+def _original_page_numbers(run_info):
+    """Returns the original page numbers of a slimmed PDF's pages (empty if no pages were dropped)."""
+    slimming = (run_info or {}).get("slimming", {})
+    dropped = set(slimming.get("dropped_pages", []))
+    return [page for page in range(1, slimming.get("pages_before", 0) + 1) if page not in dropped]
+
+def _to_original_pages(page_indices, original_pages):
+    """Maps 0-based page indices of the sent document to 1-based original page numbers."""
+    return [original_pages[i] if i < len(original_pages) else i + 1 for i in page_indices]
+
+def analyze_pdf_file_windowed(api_keys, pdf_file_path, document_path, page_count, codebook_template,
+                              codebook_comments, run_info=None, max_workers=SECTION_WORKERS):
+    """
+    Extracts the full codebook from overlapping page windows of a long document and merges the results.
+
+    Windows are requested concurrently through the shared rate limiter. Results are merged with
+    codebook-aware rules (see windowing.merge_window_values). Per-window timings are recorded in run_info.
+    """
+    run_info = run_info if run_info is not None else {}
+    run_info["windows"] = []
+    original_pages = _original_page_numbers(run_info)
+    windows = plan_windows(page_count, os.path.getsize(document_path))
+    with span(run_info, "prompt_build"):
+        prompt = create_dynamic_prompt(codebook_template, codebook_comments)
+
+    def extract_window(window):
+        start, end = window
+        pages = _to_original_pages(range(start, end), original_pages)
+        start_time = time.time()
+        result = _request_codebook_json(api_keys, write_window(document_path, start, end), prompt,
+                                        run_info=run_info, prompt_note=page_map_note(pages))
+        with run_info_lock:
+            run_info["windows"].append({
+                "pages": [pages[0], pages[-1]],
+                "seconds": round(time.time() - start_time, 3),
+                "status": "ok" if result is not None else "failed"
+            })
+        return result
+
+    with st.status(f"Processing {os.path.basename(pdf_file_path)} ({page_count} pages) in {len(windows)} windows...",
+                   expanded=True) as status:
+        st.write(f"Requesting page windows concurrently: {', '.join(f'{s + 1}-{e}' for s, e in windows)}")
+        window_results = _run_in_threads(extract_window, windows, max_workers)
+        run_info["windows"].sort(key=lambda window: window["pages"][0])
+
+        merged = merge_window_results(window_results)
+        failed = sum(1 for result in window_results if result is None)
+        if merged is None:
+            status.update(label="Processing failed", state="error")
+            return None
+        if failed:
+            st.warning(f"{failed} of {len(windows)} page windows failed for {os.path.basename(pdf_file_path)}")
+            status.update(label=f"Finished with {failed} failed windows", state="error")
+        else:
+            status.update(label="Finished processing", state="complete")
+        return merged
+
+def _section_documents(document_path, codebook_comments, sections, top_k_pages, run_info):
+    """
+    Returns {section: (document_path, prompt_note)} with only the top_k_pages most relevant pages per section.
+
+    Selected pages are recorded in run_info['page_selection'] using the original page numbers
+    (accounting for pages dropped by slimming). Text documents and failures fall back to the whole document.
+    """
+    whole_document = {section: (document_path, "") for section in sections}
+    if not top_k_pages or document_path.endswith(".txt"):
+        return whole_document
+
+    try:
+        selected = select_section_pages(document_path, codebook_comments, sections, top_k_pages)
+    except Exception as e:
+        st.warning(f"Page selection failed, sending whole document: {e}")
+        return whole_document
+    if selected is None:
+        # Every page would be selected; send the document itself without a subset copy or page map
+        return whole_document
+
+    # Pages dropped by the slimming pre-pass shift the page numbers of the slimmed PDF
+    original_pages = _original_page_numbers(run_info)
+
+    documents = {}
+    run_info["page_selection"] = {}
+    for section, page_indices in selected.items():
+        pages = _to_original_pages(page_indices, original_pages)
+        run_info["page_selection"][section] = pages
+        documents[section] = (write_page_subset(document_path, page_indices), page_map_note(pages))
+    return documents
+
+def analyze_pdf_file_sectioned(pdf_file_path, codebook_template, codebook_comments, api_key=None,
+                               run_info=None, max_workers=SECTION_WORKERS, slimming_policy=None,
+                               top_k_pages=None):
+    """
+    Analyzes a PDF by requesting each top-level codebook section concurrently and merging the results.
+
+    If top_k_pages is set, each section request only gets the pages ranked most relevant to it.
+    Per-section timings, selected pages and merge conflicts are recorded in run_info (if provided).
+    """
+    api_keys = _get_api_keys(pdf_file_path, api_key)
+    if api_keys is None:
+        return None
+
+    run_info = run_info if run_info is not None else {}
+    run_info["mode"] = "sectioned"
+    run_info["sections"] = {}
+    document_path = _prepare_document(pdf_file_path, slimming_policy, run_info)
+    sections = list(codebook_template.keys())
+    section_documents = _section_documents(document_path, codebook_comments, sections, top_k_pages, run_info)
+
+    def extract_section(section):
+        section_path, page_note = section_documents[section]
+        with span(run_info, "prompt_build"):
+            prompt = create_dynamic_prompt(
+                {section: codebook_template[section]},
+                {section: codebook_comments.get(section, {})}
+            )
+        start_time = time.time()
+        result = _request_codebook_json(api_keys, section_path, prompt, run_info=run_info, prompt_note=page_note)
+        with run_info_lock:
+            run_info["sections"][section] = {
+                "seconds": round(time.time() - start_time, 3),
+                "status": "ok" if result is not None else "failed"
+            }
+        return result
+
+    with st.status(f"Processing {os.path.basename(pdf_file_path)} in {len(sections)} sections...",
+                   expanded=True) as status:
+        st.write(f"Requesting sections concurrently: {', '.join(sections)}")
+        section_results = dict(zip(sections, _run_in_threads(extract_section, sections, max_workers)))
+
+        merged, conflicts = merge_section_results(section_results, codebook_template)
+        run_info["merge_conflicts"] = conflicts
+
+        failed = [section for section, result in section_results.items() if result is None]
+        if len(failed) == len(sections):
+            status.update(label="Processing failed", state="error")
+            return None
+        if failed:
+            st.warning(f"Sections failed for {os.path.basename(pdf_file_path)}: {', '.join(failed)}")
+            status.update(label=f"Finished with {len(failed)} failed sections", state="error")
+        else:
+            status.update(label="Finished processing", state="complete")
+
+        return merged
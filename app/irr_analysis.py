@@ -12,7 +12,7 @@ import streamlit as st
 # Import the run_irr_analysis function directly from IRR_pipeline
 from IRR_pipeline import run_irr_analysis
 
-def run_irr_analysis_for_streamlit(llm_data_path, nvivo_data_path, output_dir='results'):
+def run_irr_analysis_for_streamlit(llm_data_path, nvivo_data_path, output_dir='results', spans_owner=None):
     """
     Run the IRR analysis pipeline and return results adapted for Streamlit display.
 
@@ -24,6 +24,8 @@ def run_irr_analysis_for_streamlit(llm_data_path, nvivo_data_path, output_dir='r
         Path to the NVivo data file (Excel or CSV)
     output_dir : str, optional
         Directory to save output files (default: 'results')
+    spans_owner : dict, optional
+        Receives the 'irr' and 'export' stage timings (see stage_timing)
 
     Returns:
     --------
@@ -34,7 +36,7 @@ def run_irr_analysis_for_streamlit(llm_data_path, nvivo_data_path, output_dir='r
     try:
         # Run the main IRR analysis pipeline from IRR_pipeline.py
         report_df, llm_clean, nvivo_clean, irr_results, report_path = run_irr_analysis( # Capture report_path
-            llm_data_path, nvivo_data_path, output_dir
+            llm_data_path, nvivo_data_path, output_dir, spans_owner
         )
 
         # Create visualizations as bytes data for Streamlit
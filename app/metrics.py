@@ -0,0 +1,241 @@
+import os
+import time
+import atexit
+import logging
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Metrics are written in the Prometheus text format to this file (e.g. for node_exporter's
+# textfile collector) every METRICS_WRITE_INTERVAL seconds by a background exporter thread
+METRICS_PATH = os.getenv("GREENTRAC_METRICS_PATH", os.path.join("results", "metrics.prom"))
+METRICS_WRITE_INTERVAL = 15
+
+# If set, /metrics is also served over HTTP on this port
+METRICS_PORT = int(os.getenv("GREENTRAC_METRICS_PORT", "0"))
+
+# Histogram buckets (seconds); request latencies of Gemini calls range from seconds to minutes
+LATENCY_BUCKETS = [0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300]
+
+# Help text per metric, shown in the exposition output and the admin dashboard
+METRIC_HELP = {
+    "greentrac_gemini_requests_total": "Gemini request attempts by outcome and status code",
+    "greentrac_gemini_request_seconds": "Latency of Gemini request attempts",
+    "greentrac_gemini_tokens_total": "Tokens sent to and received from Gemini",
+    "greentrac_gemini_retries_total": "Retried transient Gemini errors by error",
+    "greentrac_context_cache_total": "Prompt context cache lookups by outcome",
+    "greentrac_upload_cache_total": "Uploaded-file registry lookups by outcome",
+    "greentrac_file_cache_total": "Parsed-file cache lookups by outcome",
+    "greentrac_result_store_total": "Result store reads by where the payload was found",
+    "greentrac_files_processed_total": "Documents processed by extraction mode and status",
+    "greentrac_stage_seconds": "Duration of pipeline stages",
+    "greentrac_quota_remaining_requests": "Requests left today across the API key pool",
+    "greentrac_rate_limit_calls_per_minute": "Current adaptive request rate",
+    "greentrac_rate_limit_concurrency": "Current adaptive request concurrency",
+    "greentrac_circuit_breaker_open": "1 while the circuit breaker pauses requests",
+}
+
+metrics_lock = threading.Lock()
+counters = {}
+gauges = {}
+histograms = {}
+collectors = []
+server = None
+exporter = None
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def increment(name, value=1, **labels):
+    """Adds value to a counter."""
+    key = _key(name, labels)
+    with metrics_lock:
+        counters[key] = counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    """Sets a gauge to value."""
+    with metrics_lock:
+        gauges[_key(name, labels)] = value
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    """Records an observation in a histogram."""
+    key = _key(name, labels)
+    with metrics_lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0, "count": 0}
+        index = bisect.bisect_left(histogram["buckets"], value)
+        if index < len(histogram["counts"]):
+            histogram["counts"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+def register_collector(func):
+    """Registers a function that updates gauges right before metrics are rendered."""
+    with metrics_lock:
+        if func not in collectors:
+            collectors.append(func)
+
+def _run_collectors():
+    with metrics_lock:
+        funcs = list(collectors)
+    for func in funcs:
+        try:
+            func()
+        except Exception as e:
+            logger.warning("Metrics collector %s failed: %s", getattr(func, '__name__', func), e)
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def render_prometheus():
+    """Returns all metrics in the Prometheus text exposition format."""
+    _run_collectors()
+    with metrics_lock:
+        families = {}
+        for (name, labels), value in counters.items():
+            families.setdefault((name, "counter"), []).append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in gauges.items():
+            families.setdefault((name, "gauge"), []).append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms.items():
+            lines = families.setdefault((name, "histogram"), [])
+            cumulative = 0
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {round(histogram['sum'], 6)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    output = []
+    for (name, kind), lines in sorted(families.items()):
+        output.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
+
+def write_metrics_file(path=None):
+    """Writes the current metrics to the Prometheus text file (the exporter does this periodically)."""
+    path = path or METRICS_PATH
+    text = render_prometheus()
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Several server processes may share the file; each writes its own tmp file before the atomic replace
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Error writing metrics file: %s", e)
+
+def start_metrics_exporter(interval=METRICS_WRITE_INTERVAL):
+    """
+    Starts writing the metrics file every interval seconds in a background thread (once per process).
+
+    Counters and histograms are only updated in memory on the request path; rendering (which
+    runs the collectors) and file writes happen on the exporter thread, plus once at exit.
+    """
+    global exporter
+    with metrics_lock:
+        if exporter is not None:
+            return exporter
+
+        def run():
+            while True:
+                time.sleep(interval)
+                write_metrics_file()
+
+        exporter = threading.Thread(target=run, daemon=True, name="metrics-exporter")
+        exporter.start()
+    atexit.register(write_metrics_file)
+    return exporter
+
+def histogram_quantile(name, quantile, **labels):
+    """Estimates a quantile of a histogram (summed over label sets matching labels) by bucket interpolation."""
+    with metrics_lock:
+        matching = [h for (metric, metric_labels), h in histograms.items()
+                    if metric == name and set(labels.items()) <= set(metric_labels)]
+        if not matching:
+            return None
+        buckets = matching[0]["buckets"]
+        counts = [sum(h["counts"][i] for h in matching) for i in range(len(buckets))]
+        total = sum(h["count"] for h in matching)
+    if total == 0:
+        return None
+    rank = quantile * total
+    cumulative, lower = 0, 0
+    for bound, count in zip(buckets, counts):
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    # The quantile lies above the largest bucket
+    return buckets[-1]
+
+def counter_values(name):
+    """Returns {labels: value} for a counter."""
+    with metrics_lock:
+        return {labels: value for (metric, labels), value in counters.items() if metric == name}
+
+def dashboard_summary():
+    """Returns headline figures for the admin dashboard."""
+    _run_collectors()
+    requests = counter_values("greentrac_gemini_requests_total")
+    total = sum(requests.values())
+    failed = sum(value for labels, value in requests.items() if dict(labels).get("outcome") != "ok")
+    cache = counter_values("greentrac_context_cache_total")
+    cache_lookups = sum(cache.values())
+    cache_hits = sum(value for labels, value in cache.items() if dict(labels).get("outcome") == "hit")
+    tokens = counter_values("greentrac_gemini_tokens_total")
+    with metrics_lock:
+        gauge_values = {name: value for (name, labels), value in gauges.items() if not labels}
+    return {
+        "requests": total,
+        "failure_rate": failed / total if total else None,
+        "latency_p50": histogram_quantile("greentrac_gemini_request_seconds", 0.5),
+        "latency_p90": histogram_quantile("greentrac_gemini_request_seconds", 0.9),
+        "latency_p99": histogram_quantile("greentrac_gemini_request_seconds", 0.99),
+        "cache_hit_ratio": cache_hits / cache_lookups if cache_lookups else None,
+        "input_tokens": sum(value for labels, value in tokens.items() if dict(labels).get("kind") == "input"),
+        "output_tokens": sum(value for labels, value in tokens.items() if dict(labels).get("kind") == "output"),
+        "gauges": gauge_values
+    }
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics in the Prometheus text format."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port=None):
+    """Starts the /metrics HTTP endpoint in a background thread (once per process; no-op if no port is set)."""
+    global server
+    port = port if port is not None else METRICS_PORT
+    with metrics_lock:
+        if server is not None or not port:
+            return server
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        except OSError as e:
+            logger.error("Could not start metrics endpoint on port %s: %s", port, e)
+            return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    logger.info("Serving metrics on http://0.0.0.0:%s/metrics", port)
+    return server
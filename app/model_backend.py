@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+
+# Where model responses come from:
+#   live   - call the Gemini API
+#   record - call the Gemini API and store every response under its request fingerprint
+#   replay - serve stored responses without any network access (for benchmarks and debugging)
+MODEL_BACKEND = os.getenv("GREENTRAC_MODEL_BACKEND", "live")
+MODEL_BACKENDS = ["live", "record", "replay"]
+
+# Recorded responses, one JSON file per request fingerprint
+RECORDINGS_DIR = os.getenv("GREENTRAC_RECORDINGS_DIR", os.path.join("results", "recordings"))
+
+# Simulated latency in replay mode: seconds per response, or "recorded" to reuse the recorded latency
+REPLAY_LATENCY = os.getenv("GREENTRAC_REPLAY_LATENCY", "0")
+
+# Share of replayed attempts that fail with a simulated transient error (503), and the seed that
+# decides which ones; the same requests in the same order always fail the same way
+REPLAY_ERROR_RATE = float(os.getenv("GREENTRAC_REPLAY_ERROR_RATE", "0"))
+REPLAY_SEED = os.getenv("GREENTRAC_REPLAY_SEED", "0")
+
+replay_lock = threading.Lock()
+replay_attempts = {}
+
+def is_replay():
+    """Checks whether responses are served from recordings instead of the API."""
+    return MODEL_BACKEND == "replay"
+
+def is_recording():
+    """Checks whether live responses are stored for later replay."""
+    return MODEL_BACKEND == "record"
+
+def request_fingerprint(model, document_path, prompt, prompt_note=""):
+    """
+    Returns a stable fingerprint for a request: the model, the content of the document and the prompt.
+
+    API keys, upload URIs and context caches don't affect the fingerprint, so a recording made
+    with one key or cache setting replays under any other.
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8") + b"\0")
+    with open(document_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    digest.update(b"\0" + prompt.encode("utf-8") + b"\0" + prompt_note.encode("utf-8"))
+    return digest.hexdigest()
+
+def _recording_path(fingerprint, recordings_dir=None):
+    return os.path.join(recordings_dir or RECORDINGS_DIR, f"{fingerprint}.json")
+
+def record_response(fingerprint, response, latency_seconds, source="", recordings_dir=None):
+    """Stores a raw Gemini response under its request fingerprint."""
+    path = _recording_path(fingerprint, recordings_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    recording = {
+        "fingerprint": fingerprint,
+        "source": source,
+        "recorded_at": datetime.datetime.now().isoformat(),
+        "latency_seconds": round(latency_seconds, 3),
+        "response": response.model_dump(mode="json", exclude_none=True)
+    }
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(recording, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _simulated_failure(fingerprint, attempt):
+    """Decides deterministically whether a replayed attempt fails (same seed, request and attempt -> same outcome)."""
+    if REPLAY_ERROR_RATE <= 0:
+        return False
+    draw = hashlib.sha256(f"{REPLAY_SEED}:{fingerprint}:{attempt}".encode("utf-8")).digest()
+    return int.from_bytes(draw[:8], "big") / 2 ** 64 < REPLAY_ERROR_RATE
+
+def replay_response(fingerprint, recordings_dir=None):
+    """
+    Returns the recorded response for a request fingerprint.
+
+    Sleeps for the configured simulated latency and raises a simulated 503 for the share of
+    attempts set by REPLAY_ERROR_RATE. A request without a recording raises FileNotFoundError.
+    """
+    path = _recording_path(fingerprint, recordings_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No recorded response for request {fingerprint[:12]} in {os.path.dirname(path)}")
+    with open(path, 'r', encoding='utf-8') as f:
+        recording = json.load(f)
+    # google.genai is slow to import and only needed once a request is actually replayed
+    from google.genai import types, errors
+
+    with replay_lock:
+        attempt = replay_attempts.get(fingerprint, 0)
+        replay_attempts[fingerprint] = attempt + 1
+
+    latency = recording.get("latency_seconds", 0) if REPLAY_LATENCY == "recorded" else float(REPLAY_LATENCY)
+    if latency > 0:
+        time.sleep(latency)
+
+    if _simulated_failure(fingerprint, attempt):
+        raise errors.ServerError(503, {"error": {"code": 503, "message": "Simulated replay error",
+                                                 "status": "UNAVAILABLE"}})
+    return types.GenerateContentResponse.model_validate(recording["response"])
+
+def reset_replay():
+    """Forgets replay attempt counts, so a replayed run can be repeated with the same simulated errors."""
+    with replay_lock:
+        replay_attempts.clear()
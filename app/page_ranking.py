@@ -0,0 +1,158 @@
+import os
+import re
+import json
+import math
+import hashlib
+import tempfile
+from collections import Counter
+
+from utils import hash_file
+from pdf_slimming import SLIM_CACHE_DIR
+
+# Default number of pages sent per codebook section
+DEFAULT_TOP_K_PAGES = 5
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Words that appear in most codebook descriptions and don't help find relevant pages
+STOPWORDS = {
+    "the", "and", "for", "are", "any", "not", "this", "that", "with", "from", "such", "into", "its",
+    "has", "have", "been", "was", "were", "will", "can", "may", "should", "would", "other", "their",
+    "which", "whether", "etc", "e.g", "i.e", "about", "than", "also", "only", "all", "more", "each",
+    "document", "documents", "text", "field", "mentioned", "mention", "mentions", "mentioning",
+    "specific", "specifically", "list", "look", "looks", "check", "determine", "identify", "extract",
+    "boolean", "true", "false", "yes", "null", "value", "values", "including", "include", "includes",
+    "address", "addresses", "addressing", "addressed", "related", "measure", "measures", "details",
+}
+
+def tokenize(text):
+    """Lowercases text and splits it into words, dropping stopwords and very short tokens."""
+    return [word for word in re.findall(r"[a-z][a-z\-]{2,}", (text or "").lower()) if word not in STOPWORDS]
+
+def section_query(codebook_comments, section):
+    """Returns the query terms for a codebook section, taken from its field names and descriptions."""
+    terms = []
+
+    def collect(key, node):
+        terms.extend(tokenize(key.replace("_", " ")))
+        if isinstance(node, dict):
+            for child_key, child in node.items():
+                collect(child_key, child)
+        elif isinstance(node, str):
+            terms.extend(tokenize(node))
+
+    collect(section, codebook_comments.get(section, {}))
+    return terms
+
+def bm25_scores(page_texts, query_terms, k1=BM25_K1, b=BM25_B):
+    """Scores each page against the query terms with Okapi BM25."""
+    pages = [Counter(tokenize(text)) for text in page_texts]
+    if not pages:
+        return []
+
+    lengths = [sum(page.values()) for page in pages]
+    average_length = (sum(lengths) / len(lengths)) or 1
+    page_count = len(pages)
+
+    scores = [0.0] * page_count
+    for term in set(query_terms):
+        containing = sum(1 for page in pages if term in page)
+        if not containing:
+            continue
+        idf = math.log(1 + (page_count - containing + 0.5) / (containing + 0.5))
+        for i, page in enumerate(pages):
+            frequency = page.get(term, 0)
+            if frequency:
+                scores[i] += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * lengths[i] / average_length))
+    return scores
+
+def rank_pages(page_texts, query_terms, top_k=DEFAULT_TOP_K_PAGES):
+    """
+    Returns the indices of the top_k most relevant pages, in document order.
+
+    Pages that match none of the query terms are never selected; if no page matches,
+    all pages are returned so the section isn't answered from nothing.
+    """
+    scores = bm25_scores(page_texts, query_terms)
+    ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])
+    if not ranked:
+        return list(range(len(page_texts)))
+    return sorted(ranked[:top_k])
+
+def extract_page_texts(pdf_file_path, cache_dir=SLIM_CACHE_DIR):
+    """Returns the extracted text of each page of a PDF, cached by content hash."""
+    content_hash = hash_file(pdf_file_path).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{content_hash}_pages.json")
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    from pypdf import PdfReader
+
+    page_texts = [page.extract_text() or "" for page in PdfReader(pdf_file_path).pages]
+    os.makedirs(cache_dir, exist_ok=True)
+    # Section threads and concurrent sessions may extract the same PDF, so each writes its own temporary file
+    fd, tmp_path = tempfile.mkstemp(suffix=".json.tmp", dir=cache_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(page_texts, f)
+    os.replace(tmp_path, cache_path)
+    return page_texts
+
+def write_page_subset(pdf_file_path, page_indices, cache_dir=SLIM_CACHE_DIR):
+    """Writes a PDF containing only the given pages (0-based) and returns its path, cached by content and pages."""
+    content_hash = hash_file(pdf_file_path).hexdigest()
+    pages_hash = hashlib.sha256(",".join(map(str, page_indices)).encode("utf-8")).hexdigest()[:16]
+    subset_path = os.path.join(cache_dir, f"{content_hash}_pages_{pages_hash}.pdf")
+    if os.path.exists(subset_path):
+        return subset_path
+
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(pdf_file_path)
+    writer = PdfWriter()
+    for i in page_indices:
+        writer.add_page(reader.pages[i])
+
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".pdf.tmp", dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writer.write(f)
+        os.replace(tmp_path, subset_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return subset_path
+
+def select_section_pages(pdf_file_path, codebook_comments, sections, top_k=DEFAULT_TOP_K_PAGES):
+    """
+    Picks the most relevant pages of a PDF for each codebook section.
+
+    Returns:
+    --------
+    dict or None
+        Maps each section to a list of 0-based page indices, or None for documents with
+        no more than top_k pages (every section gets the whole document)
+    """
+    page_texts = extract_page_texts(pdf_file_path)
+    if len(page_texts) <= top_k:
+        return None
+    return {
+        section: rank_pages(page_texts, section_query(codebook_comments, section), top_k)
+        for section in sections
+    }
+
+def page_map_note(original_pages):
+    """Returns a prompt note mapping the pages of a page subset to the original page numbers."""
+    mapping = ", ".join(f"{i + 1} -> {page}" for i, page in enumerate(original_pages))
+    return f"""
+    NOTE: Only some pages of the original document are attached. If a field is not covered by these pages, leave it empty.
+    Attached page -> original page: {mapping}.
+    Report locations using the document's section headings as usual. If you refer to a page number, use the original page number.
+    """
@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import tempfile
+
+from utils import hash_file
+
+# Slimmed documents are cached here, keyed by the hash of the original PDF and the policy
+SLIM_CACHE_DIR = os.path.join("results", "slim_cache")
+
+# Pre-processing policies that can be applied before a PDF is sent to the model
+SLIMMING_POLICIES = {
+    "none": {},
+    "strip_images": {"strip_images": True},
+    "drop_blank_pages": {"drop_blank_pages": True},
+    "slim": {"strip_images": True, "drop_blank_pages": True},
+    "text": {"drop_blank_pages": True, "as_text": True},
+}
+
+# Pages with less extractable text than this are considered blank (e.g. scanned covers)
+MIN_PAGE_CHARS = 40
+
+# Rough token estimates: Gemini counts each PDF page as a fixed number of tokens,
+# plain text is roughly four characters per token
+TOKENS_PER_PDF_PAGE = 258
+CHARS_PER_TOKEN = 4
+
+def _normalize_page_text(text):
+    """Normalizes whitespace so identical pages compare equal."""
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def linearize_text(text):
+    """Joins hyphenated line breaks and wrapped lines into paragraphs."""
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", text)
+    paragraphs = re.split(r"\n\s*\n", text)
+    return "\n\n".join(re.sub(r"\s*\n\s*", " ", p).strip() for p in paragraphs if p.strip())
+
+def select_pages(page_texts, drop_blank_pages=False):
+    """
+    Returns the indices of pages to keep.
+
+    Blank pages and pages repeating an earlier page's text (boilerplate) are dropped
+    when drop_blank_pages is set. If that would drop everything (e.g. a fully scanned
+    document) all pages are kept.
+    """
+    if not drop_blank_pages:
+        return list(range(len(page_texts)))
+
+    kept = []
+    seen = set()
+    for index, text in enumerate(page_texts):
+        normalized = _normalize_page_text(text)
+        if len(normalized) < MIN_PAGE_CHARS or normalized in seen:
+            continue
+        seen.add(normalized)
+        kept.append(index)
+
+    return kept or list(range(len(page_texts)))
+
+def estimate_tokens(page_count=0, text=""):
+    """Estimates input tokens for a PDF with page_count pages, or for plain text."""
+    return page_count * TOKENS_PER_PDF_PAGE + len(text) // CHARS_PER_TOKEN
+
+def slim_pdf(pdf_file_path, policy="none", cache_dir=SLIM_CACHE_DIR):
+    """
+    Applies a slimming policy to a PDF and returns the document to send to the model.
+
+    Results are cached by the PDF's content hash and the policy, so each document is
+    only processed once per policy.
+
+    Parameters:
+    -----------
+    pdf_file_path : str
+        Path to the original PDF
+    policy : str
+        One of SLIMMING_POLICIES
+    cache_dir : str
+        Directory for slimmed documents
+
+    Returns:
+    --------
+    tuple
+        (document_path, stats) where document_path is a PDF or a .txt file and stats
+        has the policy, page counts, and byte and estimated token counts before and after
+    """
+    options = SLIMMING_POLICIES[policy]
+    bytes_before = os.path.getsize(pdf_file_path)
+    if not options:
+        return pdf_file_path, {"policy": policy, "bytes_before": bytes_before, "bytes_after": bytes_before}
+
+    content_hash = hash_file(pdf_file_path).hexdigest()
+    extension = ".txt" if options.get("as_text") else ".pdf"
+    document_path = os.path.join(cache_dir, f"{content_hash}_{policy}{extension}")
+    stats_path = os.path.join(cache_dir, f"{content_hash}_{policy}.json")
+
+    if os.path.exists(document_path) and os.path.exists(stats_path):
+        try:
+            with open(stats_path, 'r', encoding='utf-8') as f:
+                return document_path, json.load(f)
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    # Imported here so pypdf is only needed when a slimming policy is used
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(pdf_file_path)
+    page_texts = [page.extract_text() or "" for page in reader.pages]
+    kept_pages = select_pages(page_texts, options.get("drop_blank_pages", False))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Concurrent sessions may slim the same PDF, so each writes its own temporary file
+    fd, tmp_path = tempfile.mkstemp(suffix=f"{extension}.tmp", dir=cache_dir)
+    try:
+        if options.get("as_text"):
+            # Keep page markers so the model can still report where values were found
+            text = "\n\n".join(f"[Page {i + 1}]\n{linearize_text(page_texts[i])}" for i in kept_pages)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            tokens_after = estimate_tokens(text=text)
+        else:
+            writer = PdfWriter()
+            for i in kept_pages:
+                writer.add_page(reader.pages[i])
+            if options.get("strip_images"):
+                writer.remove_images()
+            for page in writer.pages:
+                page.compress_content_streams()
+            with os.fdopen(fd, 'wb') as f:
+                writer.write(f)
+            tokens_after = estimate_tokens(page_count=len(kept_pages))
+        os.replace(tmp_path, document_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    stats = {
+        "policy": policy,
+        "pages_before": len(page_texts),
+        "pages_after": len(kept_pages),
+        "dropped_pages": [i + 1 for i in range(len(page_texts)) if i not in kept_pages],
+        "bytes_before": bytes_before,
+        "bytes_after": os.path.getsize(document_path),
+        "tokens_before": estimate_tokens(page_count=len(page_texts)),
+        "tokens_after": tokens_after,
+    }
+    fd, tmp_path = tempfile.mkstemp(suffix=".json.tmp", dir=cache_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, indent=2)
+    os.replace(tmp_path, stats_path)
+
+    return document_path, stats
+
+def format_slimming_stats(stats):
+    """Returns a one-line summary of the savings from slimming a document."""
+    if stats.get("policy", "none") == "none":
+        return "No pre-processing"
+    summary = (f"{stats['policy']}: {stats['bytes_before'] / 1024:.0f} KB -> {stats['bytes_after'] / 1024:.0f} KB, "
+               f"~{stats['tokens_before']} -> ~{stats['tokens_after']} tokens")
+    if stats.get("dropped_pages"):
+        summary += f", dropped {len(stats['dropped_pages'])} of {stats['pages_before']} pages"
+    return summary
@@ -0,0 +1,150 @@
+import os
+import sys
+import shutil
+import pstats
+import logging
+import cProfile
+import datetime
+import functools
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Opt-in profiling of the pipeline entry points; when disabled the entry points are not wrapped at all
+PROFILING_ENABLED = os.getenv("GREENTRAC_PROFILE", "0").lower() in ("1", "true", "yes")
+
+# Profiles not yet attached to an experiment are written here
+PROFILE_DIR = os.path.join("results", "profiles")
+
+# Interval at which the stack sampler records the profiled thread's call stack
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+pending_lock = threading.Lock()
+pending_profiles = {}
+active = threading.local()
+
+def _profile_owner():
+    """Key of pending profiles: the Streamlit session (its reruns may run on different threads), else the thread."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else threading.get_ident()
+
+class StackSampler:
+    """Samples one thread's call stack in the background and counts collapsed stacks (flame graph input)."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True, name="profile-sampler")
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+def write_profile(profiler, sampler, directory, name):
+    """Writes a profile as <name>_<timestamp>.pstats and .collapsed (one 'frame;frame;... count' line per stack)."""
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{name}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+    pstats.Stats(profiler).dump_stats(f"{base}.pstats")
+    with open(f"{base}.collapsed", 'w', encoding='utf-8') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return [f"{base}.pstats", f"{base}.collapsed"]
+
+def profiled(name, output_dir=None):
+    """
+    Decorator that profiles each call of an entry point when GREENTRAC_PROFILE is set.
+
+    Each call is profiled deterministically with cProfile and sampled for collapsed stacks.
+    Profiles are written to output_dir(result) if given (e.g. the saved experiment's directory),
+    otherwise to PROFILE_DIR until attach_profiles moves them to the next experiment saved
+    from the same Streamlit session (or thread, outside Streamlit). Nested profiled calls run
+    inside the outer profile.
+
+    Both cProfile and the sampler only see the calling thread: work handed to thread pools
+    (sectioned and windowed extraction) shows up as time spent waiting on the futures.
+    """
+    def decorator(func):
+        if not PROFILING_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(active, "profiling", False):
+                return func(*args, **kwargs)
+            profiler = sampler = None
+            result = None
+            started = False
+            try:
+                active.profiling = True
+                profiler = cProfile.Profile()
+                sampler = StackSampler(threading.get_ident())
+                sampler.start()
+                profiler.enable()
+                started = True
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                # Undo whatever part of the setup ran, even if starting the sampler or profiler failed
+                if profiler is not None:
+                    profiler.disable()
+                if sampler is not None and sampler.thread.is_alive():
+                    sampler.stop()
+                active.profiling = False
+                if started:
+                    try:
+                        if output_dir is not None and result:
+                            write_profile(profiler, sampler, os.path.join(output_dir(result), "profiles"), name)
+                        else:
+                            paths = write_profile(profiler, sampler, PROFILE_DIR, name)
+                            with pending_lock:
+                                pending_profiles.setdefault(_profile_owner(), []).extend(paths)
+                    except OSError as e:
+                        logger.warning("Could not write profile of %s: %s", name, e)
+        return wrapper
+    return decorator
+
+def attach_profiles(experiment_dir):
+    """Moves the profiles recorded in the current session since the last experiment into experiment_dir/profiles."""
+    if not PROFILING_ENABLED:
+        return []
+    with pending_lock:
+        paths = pending_profiles.pop(_profile_owner(), [])
+    moved = []
+    for path in paths:
+        if os.path.exists(path):
+            target_dir = os.path.join(experiment_dir, "profiles")
+            os.makedirs(target_dir, exist_ok=True)
+            moved.append(shutil.move(path, os.path.join(target_dir, os.path.basename(path))))
+    return moved
+
+def profile_summary(pstats_path, limit=20):
+    """Returns the top functions of a saved profile by cumulative time as rows for display."""
+    stats = pstats.Stats(pstats_path)
+    rows = []
+    for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            "Function": f"{function} ({os.path.basename(filename)}:{line})",
+            "Calls": calls,
+            "Own Time (s)": round(total, 4),
+            "Cumulative (s)": round(cumulative, 4)
+        })
+    return sorted(rows, key=lambda row: row["Cumulative (s)"], reverse=True)[:limit]
@@ -0,0 +1,226 @@
+import os
+import json
+import logging
+import shutil
+import datetime
+import tempfile
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from IRR_pipeline import process_json_files, run_irr_analysis
+from utils import hash_file
+from versioning import EXPERIMENTS_DIR, ensure_experiments_dir, write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Files produced by run_irr_analysis that are stored with each experiment
+IRR_OUTPUT_FILES = ["irr_analysis_report.xlsx", "ac1_by_category.png", "coding_prevalence.png", "percent_agreement.png"]
+
+def read_ac1_scores(report_path):
+    """Read a category -> Gwet AC1 mapping from an IRR report, ignoring non-numeric scores."""
+    if not os.path.exists(report_path):
+        return {}
+    try:
+        report_df = pd.read_excel(report_path)
+    except Exception as e:
+        logger.warning("Error reading IRR report %s: %s", report_path, e)
+        return {}
+
+    scores = {}
+    for category, ac1 in zip(report_df['Category'], report_df['Gwet AC1']):
+        scores[category] = float(ac1) if isinstance(ac1, (int, float)) and not pd.isna(ac1) else None
+    return scores
+
+def _average(scores):
+    """Average of the numeric scores in a category -> score mapping."""
+    valid = [score for score in scores.values() if score is not None]
+    return sum(valid) / len(valid) if valid else None
+
+def rescore_experiment(experiment_id, nvivo_path, nvivo_hash=None, force=False, experiments_dir=EXPERIMENTS_DIR):
+    """
+    Re-run the IRR analysis of a stored experiment against an NVivo reference.
+
+    Only the experiment's stored result JSONs are used, so no API calls are made.
+    New report and plot files are written to a scratch directory inside the
+    experiment and then moved over the old ones; metadata.json is rewritten atomically.
+
+    Parameters:
+    -----------
+    experiment_id : str
+        The ID of the experiment to re-score
+    nvivo_path : str
+        Path to the NVivo reference export (CSV or Excel)
+    nvivo_hash : str, optional
+        SHA-256 of the reference file (computed if not provided)
+    force : bool
+        Re-score even if the experiment was already scored against this reference
+    experiments_dir : str
+        Directory containing the experiments
+
+    Returns:
+    --------
+    dict
+        Status and per-category score movements for the experiment
+    """
+    experiment_dir = os.path.join(experiments_dir, experiment_id)
+    metadata_path = os.path.join(experiment_dir, "metadata.json")
+    summary = {"experiment_id": experiment_id, "status": "skipped", "message": "", "score_changes": []}
+
+    nvivo_hash = nvivo_hash or hash_file(nvivo_path).hexdigest()
+
+    try:
+        metadata = {}
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+
+        if not force and metadata.get("irr_reference", {}).get("sha256") == nvivo_hash:
+            summary["message"] = "Already scored against this reference"
+            return summary
+
+        results_dir = os.path.join(experiment_dir, "results")
+        json_files = []
+        if os.path.isdir(results_dir):
+            json_files = sorted(os.path.join(results_dir, f) for f in os.listdir(results_dir) if f.endswith(".json"))
+        if not json_files:
+            summary["message"] = "No stored results"
+            return summary
+
+        llm_data_df = process_json_files(json_files)
+        if llm_data_df.empty:
+            summary["message"] = "Stored results could not be processed"
+            return summary
+
+        old_scores = read_ac1_scores(os.path.join(experiment_dir, "irr_analysis_report.xlsx"))
+
+        with tempfile.TemporaryDirectory(prefix=".rescore_", dir=experiment_dir) as work_dir:
+            llm_csv_path = os.path.join(work_dir, "llm_data.csv")
+            llm_data_df.to_csv(llm_csv_path, index=False)
+            run_irr_analysis(llm_csv_path, nvivo_path, work_dir)
+
+            new_scores = read_ac1_scores(os.path.join(work_dir, "irr_analysis_report.xlsx"))
+
+            # Scratch directory lives inside the experiment, so each move is an atomic rename
+            for output_file in IRR_OUTPUT_FILES:
+                output_path = os.path.join(work_dir, output_file)
+                if os.path.exists(output_path):
+                    os.replace(output_path, os.path.join(experiment_dir, output_file))
+
+        metadata["irr_reference"] = {
+            "path": os.path.abspath(nvivo_path),
+            "sha256": nvivo_hash,
+            "rescored_at": datetime.datetime.now().isoformat(),
+            "previous_average_ac1": _average(old_scores),
+            "average_ac1": _average(new_scores)
+        }
+        write_json_atomic(metadata_path, metadata)
+
+        for category in sorted(set(old_scores) | set(new_scores)):
+            old_ac1 = old_scores.get(category)
+            new_ac1 = new_scores.get(category)
+            summary["score_changes"].append({
+                "Category": category,
+                "Old AC1": old_ac1,
+                "New AC1": new_ac1,
+                "Difference": new_ac1 - old_ac1 if old_ac1 is not None and new_ac1 is not None else None
+            })
+
+        summary["status"] = "rescored"
+        summary["old_average"] = _average(old_scores)
+        summary["new_average"] = _average(new_scores)
+    except Exception as e:
+        summary["status"] = "failed"
+        summary["message"] = f"{e}\n{traceback.format_exc()}"
+
+    return summary
+
+def rescore_all_experiments(nvivo_path="nvivo_export.csv", max_workers=None, force=False, experiments_dir=EXPERIMENTS_DIR):
+    """
+    Re-score every stored experiment against an NVivo reference in a process pool.
+
+    Parameters:
+    -----------
+    nvivo_path : str
+        Path to the (corrected or extended) NVivo reference export
+    max_workers : int, optional
+        Number of worker processes (default: number of CPUs)
+    force : bool
+        Re-score experiments already scored against this exact reference
+    experiments_dir : str
+        Directory containing the experiments
+
+    Returns:
+    --------
+    list
+        One summary dictionary per experiment (see rescore_experiment)
+    """
+    if experiments_dir == EXPERIMENTS_DIR:
+        ensure_experiments_dir()
+    if not os.path.exists(nvivo_path):
+        raise FileNotFoundError(f"NVivo reference not found at {nvivo_path}")
+
+    nvivo_hash = hash_file(nvivo_path).hexdigest()
+    experiment_ids = sorted(
+        d for d in os.listdir(experiments_dir)
+        if os.path.exists(os.path.join(experiments_dir, d, "metadata.json"))
+    )
+    if not experiment_ids:
+        return []
+
+    summaries = []
+    # Spawn fresh workers; forking a multi-threaded Streamlit server is unsafe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = [
+            executor.submit(rescore_experiment, experiment_id, nvivo_path, nvivo_hash, force, experiments_dir)
+            for experiment_id in experiment_ids
+        ]
+        for future in as_completed(futures):
+            summaries.append(future.result())
+
+    summaries.sort(key=lambda s: s["experiment_id"])
+    return summaries
+
+def format_rescore_summary(summaries):
+    """Build a DataFrame with one row per experiment showing how its average AC1 moved."""
+    rows = []
+    for summary in summaries:
+        old_avg = summary.get("old_average")
+        new_avg = summary.get("new_average")
+        rows.append({
+            "Experiment": summary["experiment_id"],
+            "Status": summary["status"],
+            "Old Average AC1": old_avg,
+            "New Average AC1": new_avg,
+            "Change": new_avg - old_avg if old_avg is not None and new_avg is not None else None,
+            "Message": summary.get("message", "").split("\n")[0]
+        })
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=os.getenv("GREENTRAC_LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    parser = argparse.ArgumentParser(description='Re-score all stored experiments against an NVivo reference (no API calls)')
+    parser.add_argument('--nvivo_data', default='nvivo_export.csv', help='Path to NVivo data file (Excel or CSV)')
+    parser.add_argument('--experiments_dir', default=EXPERIMENTS_DIR, help='Directory containing stored experiments')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--force', action='store_true', help='Re-score experiments already scored against this reference')
+    args = parser.parse_args()
+
+    summaries = rescore_all_experiments(args.nvivo_data, args.workers, args.force, args.experiments_dir)
+    if not summaries:
+        print("No experiments found.")
+    else:
+        print(format_rescore_summary(summaries).to_string(index=False))
+        for summary in summaries:
+            changed = [c for c in summary["score_changes"] if c["Difference"]]
+            if changed:
+                print(f"\n{summary['experiment_id']}:")
+                for change in changed:
+                    print(f"  {change['Category']}: {change['Old AC1']} -> {change['New AC1']} ({change['Difference']:+.3f})")
@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import logging
+import time
+import random
+import threading
+
+import httpx
+from google.genai import errors
+
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+# Per-request timeout for Gemini calls
+REQUEST_TIMEOUT_SECONDS = int(os.getenv("GREENTRAC_REQUEST_TIMEOUT", "300"))
+
+# Retry policy: exponential backoff with full jitter
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
+
+# Circuit breaker: open when at least half of the last calls failed, then pause all requests
+BREAKER_STATE_PATH = os.path.join("results", "circuit_breaker.json")
+BREAKER_WINDOW = 10
+BREAKER_MIN_CALLS = 5
+BREAKER_ERROR_RATE = 0.5
+BREAKER_COOLDOWN_SECONDS = 120
+
+# After the cooldown a single trial request is admitted; others wait for its outcome, or until
+# this lease runs out (e.g. the trial's thread died) and the next caller takes over the trial
+BREAKER_TRIAL_LEASE_SECONDS = REQUEST_TIMEOUT_SECONDS + 60
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+breaker_lock = threading.Lock()
+metrics_lock = threading.Lock()
+breaker_state = None
+
+def is_retryable(error):
+    """Checks whether an error is transient (rate limiting, server error or timeout)."""
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError))
+
+def error_label(error):
+    """Short label for an error, used in run metrics."""
+    if isinstance(error, errors.APIError):
+        return str(error.code)
+    if isinstance(error, (httpx.TimeoutException, TimeoutError)):
+        return "timeout"
+    return type(error).__name__
+
+def retry_after_seconds(error):
+    """Returns the server's suggested retry delay for a 429 (RetryInfo.retryDelay), if any."""
+    details = getattr(error, "details", None)
+    match = re.search(r"'retryDelay':\s*'(\d+(?:\.\d+)?)s'", str(details)) if details else None
+    return float(match.group(1)) if match else None
+
+def backoff_delay(attempt, error=None):
+    """Delay before retry number attempt (0-based): full jitter, never shorter than a server hint."""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt + 1)))
+    hint = retry_after_seconds(error) if error is not None else None
+    return max(delay, hint) if hint else delay
+
+def _record_retry_metric(run_info, key, label=None):
+    """Counts retries in run_info['retries'] (total, exhausted and per error label)."""
+    if run_info is None:
+        return
+    with metrics_lock:
+        metrics = run_info.setdefault("retries", {"retried": 0, "exhausted": 0, "errors": {}})
+        metrics[key] += 1
+        if label:
+            metrics["errors"][label] = metrics["errors"].get(label, 0) + 1
+
+def _load_breaker_state():
+    """Loads the persisted breaker state (closed if missing or unreadable)."""
+    if os.path.exists(BREAKER_STATE_PATH):
+        try:
+            with open(BREAKER_STATE_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Error reading circuit breaker state: %s", e)
+    return {"state": "closed", "open_until": 0, "recent": [], "trial_until": 0}
+
+def _save_breaker_state(state):
+    os.makedirs(os.path.dirname(BREAKER_STATE_PATH), exist_ok=True)
+    tmp_path = f"{BREAKER_STATE_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, BREAKER_STATE_PATH)
+
+def _get_breaker_state():
+    """Returns the in-memory breaker state, loading it from disk on first use (call with breaker_lock held)."""
+    global breaker_state
+    if breaker_state is None:
+        breaker_state = _load_breaker_state()
+    return breaker_state
+
+def record_call_outcome(success, trial_only=False):
+    """
+    Records the outcome of a call and opens or closes the circuit breaker accordingly.
+
+    With trial_only=True (failures that say nothing about the service's health, e.g. a
+    400 or a local error) the outcome only settles a half-open trial and is otherwise ignored.
+    """
+    with breaker_lock:
+        state = _get_breaker_state()
+        previous = state["state"]
+
+        if trial_only and state["state"] != "half_open":
+            return
+        if state["state"] == "half_open":
+            # The trial request after a pause decides whether to resume
+            state["state"] = "closed" if success else "open"
+            state["recent"] = []
+            state["trial_until"] = 0
+        else:
+            state["recent"] = (state["recent"] + [bool(success)])[-BREAKER_WINDOW:]
+            failures = state["recent"].count(False)
+            if (len(state["recent"]) >= BREAKER_MIN_CALLS
+                    and failures / len(state["recent"]) >= BREAKER_ERROR_RATE):
+                state["state"] = "open"
+                state["recent"] = []
+
+        if state["state"] == "open" and previous != "open":
+            state["open_until"] = time.time() + BREAKER_COOLDOWN_SECONDS
+            logger.warning("Circuit breaker opened: pausing Gemini requests for %ss", BREAKER_COOLDOWN_SECONDS)
+
+        # Persist failures and state changes so a restarted app stays paused
+        if state["state"] != previous or not success:
+            _save_breaker_state(state)
+
+def breaker_wait_seconds():
+    """
+    Returns how long the caller must wait before sending a request (0 if it may proceed).
+
+    Once the cooldown is over the breaker is half-open and admits a single trial request:
+    the caller that gets 0 holds the trial, and the others wait until its outcome is
+    recorded (or its lease runs out).
+    """
+    with breaker_lock:
+        state = _get_breaker_state()
+        now = time.time()
+        if state["state"] == "closed":
+            return 0
+        if state["state"] == "open":
+            remaining = state["open_until"] - now
+            if remaining > 0:
+                return remaining
+            state["state"] = "half_open"
+        elif state.get("trial_until", 0) > now:
+            # Another caller's trial request is in flight
+            return state["trial_until"] - now
+        state["trial_until"] = now + BREAKER_TRIAL_LEASE_SECONDS
+        _save_breaker_state(state)
+        return 0
+
+def breaker_pause_seconds():
+    """Returns how much longer the circuit breaker pauses requests (without changing its state or taking the trial)."""
+    with breaker_lock:
+        state = _get_breaker_state()
+        if state["state"] != "open":
+            return 0
+        return max(state["open_until"] - time.time(), 0)
+
+def breaker_is_open():
+    """Checks whether the circuit breaker is currently pausing requests (without changing its state)."""
+    return breaker_pause_seconds() > 0
+
+def wait_for_breaker(take_trial=True):
+    """
+    Blocks until a request may be sent.
+
+    With take_trial=False (e.g. a batch pausing between files) this only waits out the open
+    period and leaves the half-open trial to the next actual request.
+    """
+    wait_seconds = breaker_wait_seconds if take_trial else breaker_pause_seconds
+    remaining = wait_seconds()
+    while remaining > 0:
+        time.sleep(min(remaining, 5))
+        remaining = wait_seconds()
+
+def reset_breaker():
+    """Closes the circuit breaker and forgets recent failures."""
+    global breaker_state
+    with breaker_lock:
+        breaker_state = {"state": "closed", "open_until": 0, "recent": [], "trial_until": 0}
+        _save_breaker_state(breaker_state)
+
+def call_with_retries(func, run_info=None, before_attempt=None, max_retries=MAX_RETRIES, use_breaker=True):
+    """
+    Calls func, retrying transient errors with exponential backoff and jitter.
+
+    Every attempt first waits for the circuit breaker and calls before_attempt (e.g. the
+    shared rate limiter), so retries count against the same request budget. Non-retryable
+    errors are raised immediately; retryable ones are raised once max_retries is exhausted.
+    Only retryable failures (rate limits, server errors, timeouts) count against the circuit
+    breaker's window, but any failure of the half-open trial request reopens it.
+    Retry counts are recorded in run_info['retries']. With use_breaker=False (replayed
+    responses) the circuit breaker is neither consulted nor updated.
+    """
+    for attempt in range(max_retries + 1):
+        if use_breaker:
+            wait_for_breaker()
+        if before_attempt is not None:
+            before_attempt()
+        try:
+            result = func()
+        except Exception as e:
+            if use_breaker:
+                record_call_outcome(False, trial_only=not is_retryable(e))
+            if not is_retryable(e):
+                raise
+            if attempt == max_retries:
+                _record_retry_metric(run_info, "exhausted", error_label(e))
+                raise
+            delay = backoff_delay(attempt, e)
+            _record_retry_metric(run_info, "retried", error_label(e))
+            increment("greentrac_gemini_retries_total", error=error_label(e))
+            logger.warning("Transient error from Gemini (%s), retrying in %.1fs (attempt %d/%d)",
+                           error_label(e), delay, attempt + 1, max_retries)
+            time.sleep(delay)
+        else:
+            if use_breaker:
+                record_call_outcome(True)
+            return result
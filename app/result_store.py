@@ -0,0 +1,110 @@
+import os
+import pickle
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+# Result payloads (codebook results, IRR analyses) shared by all sessions, stored under their
+# content hash; sessions only keep the hashes
+RESULT_STORE_DIR = os.path.join("results", "result_store")
+
+# Serialized payloads kept in memory, evicted least recently used first
+MAX_MEMORY_RESULTS = 256
+MAX_MEMORY_BYTES = 128 * 1024 * 1024
+
+# Total size of the store on disk; least recently used payloads are deleted beyond this
+MAX_DISK_BYTES = 2 * 1024 * 1024 * 1024
+
+MEMORY_STORE = OrderedDict()
+store_lock = threading.Lock()
+
+def _payload_path(content_hash, store_dir=None):
+    return os.path.join(store_dir or RESULT_STORE_DIR, f"{content_hash}.pkl")
+
+def _remember(content_hash, payload):
+    with store_lock:
+        MEMORY_STORE[content_hash] = payload
+        MEMORY_STORE.move_to_end(content_hash)
+        total_bytes = sum(len(p) for p in MEMORY_STORE.values())
+        while len(MEMORY_STORE) > MAX_MEMORY_RESULTS or total_bytes > MAX_MEMORY_BYTES:
+            _, evicted = MEMORY_STORE.popitem(last=False)
+            total_bytes -= len(evicted)
+
+def _prune_disk(store_dir=None):
+    """Deletes the least recently used payloads while the store exceeds MAX_DISK_BYTES."""
+    store_dir = store_dir or RESULT_STORE_DIR
+    entries = []
+    for name in os.listdir(store_dir):
+        if name.endswith(".pkl"):
+            stat = os.stat(os.path.join(store_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total_bytes <= MAX_DISK_BYTES:
+            break
+        try:
+            os.remove(os.path.join(store_dir, name))
+        except OSError:
+            continue
+        total_bytes -= size
+
+def put_result(value, store_dir=None):
+    """Stores a result payload and returns its content hash (identical payloads are stored once)."""
+    payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    content_hash = hashlib.sha256(payload).hexdigest()
+    path = _payload_path(content_hash, store_dir)
+    try:
+        if os.path.exists(path):
+            os.utime(path, None)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            _prune_disk(store_dir)
+    except OSError as e:
+        logger.warning("Error writing result %s to the result store: %s", content_hash[:12], e)
+    _remember(content_hash, payload)
+    return content_hash
+
+def get_result(content_hash, default=None, store_dir=None):
+    """Returns a fresh copy of the payload stored under content_hash, or default if it is no longer stored."""
+    if not content_hash:
+        return default
+    with store_lock:
+        payload = MEMORY_STORE.get(content_hash)
+        if payload is not None:
+            MEMORY_STORE.move_to_end(content_hash)
+    path = _payload_path(content_hash, store_dir)
+    if payload is None:
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+        except OSError:
+            increment("greentrac_result_store_total", outcome="missing")
+            return default
+        _remember(content_hash, payload)
+        increment("greentrac_result_store_total", outcome="disk")
+    else:
+        increment("greentrac_result_store_total", outcome="memory")
+    try:
+        # Recently used payloads are kept on disk when the store is pruned
+        os.utime(path, None)
+    except OSError:
+        pass
+    return pickle.loads(payload)
+
+def get_results(result_hashes, store_dir=None):
+    """Resolves {filename: content hash} to {filename: result}, skipping results no longer stored."""
+    results = {}
+    for filename, content_hash in result_hashes.items():
+        result = get_result(content_hash, store_dir=store_dir)
+        if result is not None:
+            results[filename] = result
+    return results
@@ -0,0 +1,78 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from metrics import observe
+
+# Pipeline stages in display order. Per-file stages are recorded in run_info['spans'];
+# batch stages (IRR analysis, report export, saving) in the experiment's 'batch_spans'
+FILE_STAGES = ["prompt_build", "rate_limit_wait", "upload", "model_latency", "parse", "normalize"]
+BATCH_STAGES = ["irr", "export", "save"]
+STAGES = FILE_STAGES + BATCH_STAGES
+
+spans_lock = threading.Lock()
+
+def add_span(spans_owner, stage, start, seconds):
+    """Appends a {stage, start, seconds} span to spans_owner['spans'] (safe across worker threads)."""
+    observe("greentrac_stage_seconds", seconds, stage=stage)
+    if spans_owner is None:
+        return
+    with spans_lock:
+        spans_owner.setdefault("spans", []).append(
+            {"stage": stage, "start": round(start, 3), "seconds": round(seconds, 4)}
+        )
+
+@contextmanager
+def span(spans_owner, stage):
+    """Times the enclosed block as a span of the given stage (nothing is recorded if spans_owner is None)."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_span(spans_owner, stage, start, time.time() - start)
+
+def add_tokens(run_info, usage_metadata):
+    """Adds a response's prompt and output token counts to run_info['tokens']."""
+    if run_info is None:
+        return
+    input_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+    output_tokens = getattr(usage_metadata, "candidates_token_count", None) or 0
+    with spans_lock:
+        tokens = run_info.setdefault("tokens", {"input": 0, "output": 0, "responses": 0})
+        tokens["input"] += input_tokens
+        tokens["output"] += output_tokens
+        tokens["responses"] += 1
+
+def stage_totals(spans):
+    """Sums span durations per stage, in STAGES order."""
+    totals = {}
+    for stage in STAGES:
+        seconds = sum(s["seconds"] for s in spans if s["stage"] == stage)
+        if seconds:
+            totals[stage] = round(seconds, 3)
+    return totals
+
+def timing_table(metadata):
+    """Returns one row per file (and one for the batch stages) with seconds per stage and token counts."""
+    rows = []
+    for filename, run_info in (metadata.get("run_metadata") or {}).items():
+        row = {"File": filename}
+        row.update({stage: seconds for stage, seconds in stage_totals(run_info.get("spans", [])).items()})
+        tokens = run_info.get("tokens", {})
+        row["input_tokens"] = tokens.get("input", 0)
+        row["output_tokens"] = tokens.get("output", 0)
+        rows.append(row)
+    if metadata.get("batch_spans"):
+        rows.append({"File": "(batch)", **stage_totals(metadata["batch_spans"])})
+    return rows
+
+def timeline(metadata):
+    """Returns (label, stage, offset_seconds, seconds) for every span, with offsets from the first span."""
+    entries = []
+    for filename, run_info in (metadata.get("run_metadata") or {}).items():
+        entries.extend((filename, s) for s in run_info.get("spans", []))
+    entries.extend(("(batch)", s) for s in metadata.get("batch_spans", []))
+    if not entries:
+        return []
+    origin = min(s["start"] for _, s in entries)
+    return [(label, s["stage"], s["start"] - origin, s["seconds"]) for label, s in entries]
@@ -0,0 +1,17 @@
+import os
+import sys
+import logging
+
+import pytest
+
+# The app modules import each other by bare name (Streamlit runs app.py from this directory)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Streamlit warns about bare mode on every st.* call; keep the test output readable
+logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    """Runs each test in a scratch directory, since the app keeps its state under ./results."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
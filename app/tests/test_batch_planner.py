@@ -0,0 +1,89 @@
+from batch_planner import (
+    MODE_INCREMENTAL, MODE_SECTIONED, create_job, format_plan, get_job, list_jobs,
+    pending_files, plan_batch, update_job
+)
+
+NOW = 1_000_000.0
+NEXT_RESET = NOW + 3600
+
+def plan(filenames, section_count, calls_left_today, daily_budget, **kwargs):
+    # Sectioned and incremental estimates don't read the PDFs, so the files needn't exist
+    kwargs.setdefault("mode", MODE_SECTIONED)
+    return plan_batch(filenames, section_count=section_count, calls_left_today=calls_left_today,
+                      daily_budget=daily_budget, calls_per_minute=60, next_reset=NEXT_RESET, now=NOW, **kwargs)
+
+def test_files_are_scheduled_across_quota_days_without_splitting():
+    # 10 sections -> 11 requests per file with the retry overhead
+    result = plan(["a.pdf", "b.pdf", "c.pdf"], 10, calls_left_today=15, daily_budget=25)
+
+    assert result["file_requests"] == {"a.pdf": 11, "b.pdf": 11, "c.pdf": 11}
+    assert [day["files"] for day in result["days"]] == [["a.pdf"], ["b.pdf", "c.pdf"]]
+    assert result["days"][1]["start"] == NEXT_RESET
+    assert result["eta"] == NEXT_RESET + 22
+    assert result["unschedulable"] == []
+
+def test_files_larger_than_a_quota_day_are_unschedulable():
+    result = plan(["a.pdf", "b.pdf"], 10, calls_left_today=5, daily_budget=10)
+
+    assert result["unschedulable"] == ["a.pdf", "b.pdf"]
+    assert result["days"] == []
+    assert result["eta"] is None
+    assert "will be skipped: a.pdf, b.pdf" in format_plan(result)
+
+def test_large_file_that_fits_today_is_scheduled():
+    result = plan(["a.pdf"], 10, calls_left_today=20, daily_budget=10)
+    assert result["unschedulable"] == []
+    assert result["days"][0]["files"] == ["a.pdf"]
+    assert result["eta"] is not None
+
+def test_incremental_plan_estimates_files_without_a_previous_result_in_fallback_mode():
+    result = plan(["a.pdf", "b.pdf"], 10, calls_left_today=0, daily_budget=12,
+                  mode=MODE_INCREMENTAL, incremental_files={"a.pdf"}, fallback_mode=MODE_SECTIONED)
+    assert result["file_requests"] == {"a.pdf": 2, "b.pdf": 11}
+    assert result["unschedulable"] == []
+
+    result = plan(["a.pdf", "b.pdf"], 20, calls_left_today=0, daily_budget=12,
+                  mode=MODE_INCREMENTAL, incremental_files={"a.pdf"}, fallback_mode=MODE_SECTIONED)
+    assert result["unschedulable"] == ["b.pdf"]
+    assert [day["files"] for day in result["days"]] == [["a.pdf"]]
+    assert result["eta"] is None
+
+def test_no_daily_budget_leaves_the_rest_unscheduled():
+    result = plan(["a.pdf", "b.pdf"], 1, calls_left_today=2, daily_budget=0)
+    assert [day["files"] for day in result["days"]] == [["a.pdf"]]
+    assert result["unschedulable"] == []
+    assert result["eta"] is None
+
+def test_incremental_files_cost_one_request():
+    result = plan(["a.pdf"], 10, calls_left_today=100, daily_budget=100, mode=MODE_INCREMENTAL)
+    assert result["file_requests"] == {"a.pdf": 2}
+
+def test_job_tracks_pending_files_until_done():
+    job_id = create_job("alice", "run", "", {"extraction_mode": MODE_SECTIONED}, ["a.pdf", "b.pdf", "c.pdf"], {})
+    assert pending_files(get_job(job_id)) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert [job["id"] for job in list_jobs("alice")] == [job_id]
+    assert list_jobs("bob") == []
+
+    update_job(job_id, "a.pdf", "done")
+    update_job(job_id, "b.pdf", "skipped")
+    assert pending_files(get_job(job_id)) == ["c.pdf"]
+    assert get_job(job_id)["status"] == "queued"
+
+    update_job(job_id, "c.pdf", "failed")
+    assert get_job(job_id)["status"] == "done"
+    assert list_jobs("alice") == []
+    assert [job["id"] for job in list_jobs("alice", include_done=True)] == [job_id]
+
+def test_update_missing_job_returns_none():
+    assert update_job("job_missing", "a.pdf", "done") is None
+    assert get_job("job_missing") is None
+
+def test_run_info_is_kept_with_the_job():
+    job_id = create_job("alice", "run", "", {}, ["a.pdf", "b.pdf"], {})
+
+    update_job(job_id, "a.pdf", "done", run_info={"mode": "full", "tokens": {"input": 10, "output": 2}})
+    update_job(job_id, "b.pdf", "failed")
+
+    job = get_job(job_id)
+    assert job["run_metadata"] == {"a.pdf": {"mode": "full", "tokens": {"input": 10, "output": 2}}}
+    assert job["status"] == "done"
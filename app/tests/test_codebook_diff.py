@@ -0,0 +1,53 @@
+import json
+
+import codebook_diff
+from codebook_diff import codebook_file_key, diff_codebooks, remove_paths, removed_field_paths
+
+OLD_CODEBOOK = {
+    "objectives": {
+        "end_plastic_pollution": {"mentioned": "Whether the objective is mentioned"},
+        "circular_economy": {"mentioned": "Whether circularity is mentioned"},
+    },
+    "legacy": {"notes": {"text": "Free-text notes"}},
+}
+
+def test_removed_fields_are_pruned_from_previous_results():
+    new_codebook = {"objectives": {"end_plastic_pollution": OLD_CODEBOOK["objectives"]["end_plastic_pollution"]}}
+    previous_result = {
+        "objectives": {
+            "end_plastic_pollution": {"mentioned": {"value": "Yes"}},
+            "circular_economy": {"mentioned": {"value": "No"}},
+        },
+        "legacy": {"notes": {"text": {"value": "n/a"}}},
+    }
+
+    removed = removed_field_paths(diff_codebooks(OLD_CODEBOOK, new_codebook))
+    pruned = remove_paths(previous_result, removed)
+
+    assert pruned == {"objectives": {"end_plastic_pollution": {"mentioned": {"value": "Yes"}}}}
+    # The previous result itself is left untouched
+    assert "legacy" in previous_result
+
+def test_unknown_paths_are_ignored():
+    result = {"objectives": {"end_plastic_pollution": {"mentioned": {"value": "Yes"}}}}
+    assert remove_paths(result, ["objectives.missing", "other.path", "objectives.end_plastic_pollution.mentioned.x"]) == result
+
+def test_cached_diffs_are_copies():
+    new_codebook = {"objectives": OLD_CODEBOOK["objectives"]}
+    first = diff_codebooks(OLD_CODEBOOK, new_codebook)
+    first["removed"].clear()
+
+    assert diff_codebooks(OLD_CODEBOOK, new_codebook)["removed"]
+
+def test_file_keyed_diffs_skip_hashing(tmp_path, monkeypatch):
+    old_path, new_path = tmp_path / "old.json", tmp_path / "new.json"
+    old_path.write_text(json.dumps(OLD_CODEBOOK), encoding="utf-8")
+    new_path.write_text(json.dumps({}), encoding="utf-8")
+    cache_key = (codebook_file_key(old_path), codebook_file_key(new_path))
+    expected = diff_codebooks(OLD_CODEBOOK, {}, cache_key=cache_key)
+
+    def fail(node):
+        raise AssertionError("codebook hashed despite a cached diff")
+    monkeypatch.setattr(codebook_diff, "build_hash_tree", fail)
+    monkeypatch.setattr(codebook_diff, "hash_codebook", fail)
+    assert diff_codebooks(OLD_CODEBOOK, {}, cache_key=cache_key) == expected
@@ -0,0 +1,106 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import utils
+from utils import load_codebook_comments, read_cached_codebook
+
+LOCAL_CODEBOOK = {"source": "local"}
+
+class CodebookServer:
+    """Local stand-in for raw.githubusercontent.com serving one codebook with an ETag."""
+
+    def __init__(self):
+        self.codebook = {"source": "github", "version": 1}
+        self.delay_seconds = 0
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                time.sleep(server.delay_seconds)
+                body = json.dumps(server.codebook).encode("utf-8")
+                etag = f'"v{server.codebook["version"]}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/codebook_enhanced.json"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def server():
+    server = CodebookServer()
+    yield server
+    server.close()
+
+@pytest.fixture
+def local_path(tmp_path):
+    path = tmp_path / "codebook_finetune.json"
+    path.write_text(json.dumps(LOCAL_CODEBOOK), encoding="utf-8")
+    return str(path)
+
+def load(server, local_path, tmp_path, **kwargs):
+    return load_codebook_comments(local_path, server.url, cache_dir=str(tmp_path / "cache"), timeout=1, **kwargs)
+
+def wait_for_refreshes():
+    with utils.codebook_fetch_lock:
+        threads = list(utils.codebook_fetches.values())
+    for thread in threads:
+        thread.join(5)
+
+def test_first_load_fetches_and_caches(server, local_path, tmp_path):
+    assert load(server, local_path, tmp_path) == server.codebook
+    assert read_cached_codebook(server.url, str(tmp_path / "cache"))["etag"] == '"v1"'
+
+def test_unchanged_codebook_is_revalidated_with_a_conditional_get(server, local_path, tmp_path):
+    load(server, local_path, tmp_path)
+    wait_for_refreshes()
+
+    assert load(server, local_path, tmp_path, wait_for_refresh=True) == server.codebook
+    assert server.requests[-1].get("If-None-Match") == '"v1"'
+    assert utils.codebook_fetch_status[(server.url, str(tmp_path / "cache"))] == "not_modified"
+
+def test_cached_copy_is_served_while_the_refresh_runs_in_the_background(server, local_path, tmp_path):
+    load(server, local_path, tmp_path)
+    wait_for_refreshes()
+    server.codebook = {"source": "github", "version": 2}
+    server.delay_seconds = 0.5
+
+    # Served from the cache without waiting for the slow server
+    start = time.perf_counter()
+    assert load(server, local_path, tmp_path)["version"] == 1
+    assert time.perf_counter() - start < server.delay_seconds
+
+    wait_for_refreshes()
+    assert load(server, local_path, tmp_path)["version"] == 2
+
+def test_slow_server_falls_back_to_the_local_copy(server, local_path, tmp_path):
+    server.delay_seconds = 2
+
+    start = time.perf_counter()
+    assert load(server, local_path, tmp_path) == LOCAL_CODEBOOK
+    assert time.perf_counter() - start < server.delay_seconds
+
+def test_unreachable_server_falls_back_to_the_local_copy(server, local_path, tmp_path):
+    url = server.url
+    server.close()
+    assert load_codebook_comments(local_path, url, cache_dir=str(tmp_path / "cache"), timeout=1) == LOCAL_CODEBOOK
@@ -0,0 +1,41 @@
+import os
+import time
+
+import pytest
+
+import utils
+from utils import build_cached_zip, deferred_file_data
+
+@pytest.fixture(autouse=True)
+def export_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "EXPORT_CACHE_DIR", str(tmp_path / "exports"))
+    monkeypatch.setattr(utils, "MAX_CACHED_EXPORTS", 1)
+
+def build(name):
+    return build_cached_zip(name, lambda zip_file: zip_file.writestr("result.json", name))
+
+def test_recently_used_exports_are_not_pruned():
+    first = build("first")
+    second = build("second")
+    assert os.path.exists(first) and os.path.exists(second)
+
+def test_exports_past_the_grace_period_are_pruned():
+    first = build("first")
+    old = time.time() - utils.EXPORT_GRACE_SECONDS - 60
+    os.utime(first, (old, old))
+    second = build("second")
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+
+def test_deferred_data_rebuilds_a_pruned_export():
+    path = build("first")
+    read = deferred_file_data(path, lambda: build("first"))
+    os.remove(path)
+    assert read()[:2] == b"PK"
+
+def test_deferred_data_is_read_on_call(tmp_path):
+    path = tmp_path / "report.xlsx"
+    path.write_bytes(b"old")
+    read = deferred_file_data(str(path))
+    path.write_bytes(b"new")
+    assert read() == b"new"
@@ -0,0 +1,49 @@
+import os
+import json
+
+import pytest
+
+import file_cache
+from file_cache import cached_load, read_json
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(file_cache, "FILE_CACHE", file_cache.OrderedDict())
+
+def counting_loader(calls):
+    def load(path):
+        calls.append(path)
+        return read_json(path)
+    return load
+
+def test_unchanged_file_is_parsed_once(tmp_path):
+    path = tmp_path / "metadata.json"
+    path.write_text(json.dumps({"name": "run 1"}), encoding="utf-8")
+    calls = []
+    loader = counting_loader(calls)
+
+    assert cached_load(str(path), loader) == {"name": "run 1"}
+    # Touched but unchanged: revalidated by content hash instead of parsed again
+    os.utime(path, ns=(0, 0))
+    assert cached_load(str(path), loader) == {"name": "run 1"}
+    assert len(calls) == 1
+
+    path.write_text(json.dumps({"name": "run 2"}), encoding="utf-8")
+    assert cached_load(str(path), loader) == {"name": "run 2"}
+    assert len(calls) == 2
+
+def test_callers_get_independent_copies(tmp_path):
+    path = tmp_path / "metadata.json"
+    path.write_text(json.dumps({"tags": ["a"]}), encoding="utf-8")
+
+    cached_load(str(path), read_json)["tags"].append("changed by one session")
+    assert cached_load(str(path), read_json) == {"tags": ["a"]}
+
+def test_values_over_the_memory_cap_are_not_cached(tmp_path, monkeypatch):
+    path = tmp_path / "small_on_disk.json"
+    path.write_text(json.dumps(["x" * 10] * 100), encoding="utf-8")
+    # Parsed, the list takes more memory than the file takes on disk
+    monkeypatch.setattr(file_cache, "MAX_CACHED_BYTES", os.path.getsize(path) + 1)
+
+    cached_load(str(path), read_json)
+    assert not file_cache.FILE_CACHE
@@ -0,0 +1,68 @@
+import pytest
+from google.genai import errors
+
+import resilience
+from resilience import (
+    BREAKER_MIN_CALLS, breaker_pause_seconds, breaker_wait_seconds, call_with_retries, record_call_outcome
+)
+
+@pytest.fixture(autouse=True)
+def closed_breaker(monkeypatch):
+    monkeypatch.setattr(resilience, "breaker_state", None)
+    monkeypatch.setattr(resilience, "BACKOFF_MAX_SECONDS", 0)
+
+def open_breaker():
+    for _ in range(BREAKER_MIN_CALLS):
+        record_call_outcome(False)
+    assert breaker_pause_seconds() > 0
+    # Skip the cooldown
+    resilience.breaker_state["open_until"] = 0
+
+def test_half_open_breaker_admits_a_single_trial():
+    open_breaker()
+
+    assert breaker_wait_seconds() == 0
+    assert breaker_wait_seconds() > 0
+    assert breaker_wait_seconds() > 0
+
+    record_call_outcome(True)
+    assert resilience.breaker_state["state"] == "closed"
+    assert breaker_wait_seconds() == 0
+
+def test_failed_trial_reopens_the_breaker():
+    open_breaker()
+    assert breaker_wait_seconds() == 0
+
+    record_call_outcome(False)
+    assert resilience.breaker_state["state"] == "open"
+    assert breaker_wait_seconds() > 0
+
+def bad_request():
+    raise errors.ClientError(400, {"error": {"code": 400, "message": "bad request", "status": "INVALID_ARGUMENT"}})
+
+def out_of_quota():
+    raise RuntimeError("All API keys are out of quota")
+
+def server_error():
+    raise errors.ServerError(503, {"error": {"code": 503, "message": "unavailable", "status": "UNAVAILABLE"}})
+
+def test_non_retryable_errors_do_not_open_the_breaker():
+    for func, error in [(bad_request, errors.ClientError), (out_of_quota, RuntimeError)]:
+        for _ in range(BREAKER_MIN_CALLS):
+            with pytest.raises(error):
+                call_with_retries(func)
+    assert breaker_pause_seconds() == 0
+    assert resilience.breaker_state["recent"] == []
+
+def test_retryable_errors_open_the_breaker():
+    with pytest.raises(errors.ServerError):
+        call_with_retries(server_error, max_retries=BREAKER_MIN_CALLS - 1)
+    assert breaker_pause_seconds() > 0
+
+def test_non_retryable_error_fails_the_trial():
+    open_breaker()
+
+    with pytest.raises(errors.ClientError):
+        call_with_retries(bad_request)
+    assert resilience.breaker_state["state"] == "open"
+    assert breaker_pause_seconds() > 0
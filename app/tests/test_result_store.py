@@ -0,0 +1,60 @@
+import os
+from collections import OrderedDict
+
+import pytest
+
+import result_store
+from result_store import _payload_path, _prune_disk, get_result, get_results, put_result
+
+@pytest.fixture(autouse=True)
+def empty_memory_store(monkeypatch):
+    monkeypatch.setattr(result_store, "MEMORY_STORE", OrderedDict())
+
+def test_round_trip_returns_fresh_copies(tmp_path):
+    result = {"policy": {"mentioned": {"value": True}}}
+    content_hash = put_result(result, store_dir=tmp_path)
+
+    first = get_result(content_hash, store_dir=tmp_path)
+    assert first == result
+    first["policy"]["mentioned"]["value"] = False
+    assert get_result(content_hash, store_dir=tmp_path) == result
+
+def test_identical_payloads_are_stored_once(tmp_path):
+    assert put_result({"a": 1}, store_dir=tmp_path) == put_result({"a": 1}, store_dir=tmp_path)
+    assert put_result({"a": 2}, store_dir=tmp_path) != put_result({"a": 1}, store_dir=tmp_path)
+    assert len(os.listdir(tmp_path)) == 2
+
+def test_evicted_payloads_are_read_back_from_disk(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "MAX_MEMORY_RESULTS", 2)
+    hashes = [put_result({"n": n}, store_dir=tmp_path) for n in range(3)]
+
+    # The least recently used payload was evicted from memory
+    assert list(result_store.MEMORY_STORE) == hashes[1:]
+    assert get_result(hashes[0], store_dir=tmp_path) == {"n": 0}
+    assert list(result_store.MEMORY_STORE) == [hashes[2], hashes[0]]
+
+def test_memory_store_is_bounded_by_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_store, "MAX_MEMORY_BYTES", 1500)
+    hashes = [put_result("x" * 1000 + str(n), store_dir=tmp_path) for n in range(3)]
+    assert list(result_store.MEMORY_STORE) == hashes[2:]
+
+def test_prune_disk_deletes_least_recently_used_payloads(tmp_path, monkeypatch):
+    hashes = [put_result("x" * 1000 + str(n), store_dir=tmp_path) for n in range(3)]
+    for age, content_hash in zip((300, 100, 200), hashes):
+        os.utime(_payload_path(content_hash, tmp_path), (0, 1000 - age))
+    monkeypatch.setattr(result_store, "MAX_DISK_BYTES", 2500)
+
+    _prune_disk(tmp_path)
+
+    assert not os.path.exists(_payload_path(hashes[0], tmp_path))
+    assert os.path.exists(_payload_path(hashes[1], tmp_path))
+    assert os.path.exists(_payload_path(hashes[2], tmp_path))
+
+def test_missing_hash_returns_default(tmp_path):
+    assert get_result("0" * 64, store_dir=tmp_path) is None
+    assert get_result("0" * 64, default={}, store_dir=tmp_path) == {}
+    assert get_result(None, default="none") == "none"
+
+def test_get_results_skips_pruned_results(tmp_path):
+    kept = put_result({"a": 1}, store_dir=tmp_path)
+    assert get_results({"a.pdf": kept, "b.pdf": "0" * 64}, store_dir=tmp_path) == {"a.pdf": {"a": 1}}
@@ -0,0 +1,17 @@
+import os
+import sys
+import json
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only a rendered page may load; importing them made the login page slow to appear
+DEFERRED_MODULES = ["pandas", "matplotlib", "PIL", "pypdf", "google.genai"]
+
+def test_importing_app_defers_heavy_modules(tmp_path):
+    # A fresh interpreter, since other tests have already imported these modules
+    script = (f"import sys, json; sys.path.insert(0, {APP_DIR!r}); import app; "
+              f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))")
+    output = subprocess.run([sys.executable, "-c", script], cwd=tmp_path, capture_output=True, text=True,
+                            check=True).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == []
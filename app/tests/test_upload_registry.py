@@ -0,0 +1,124 @@
+import datetime
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors, types
+
+import gemini_calls
+import upload_registry
+from upload_registry import EXPIRY_MARGIN_SECONDS, get_remote_file, invalidate
+from utils import hash_file
+
+FAKE_ENDPOINT = "https://files.fake.invalid/"
+
+class FakeFileService:
+    """Local stand-in for the Gemini file API: uploads get a name and an expiry, and can be deleted early."""
+
+    def __init__(self, lifetime_seconds=48 * 60 * 60, now=1_000_000.0):
+        self.lifetime_seconds = lifetime_seconds
+        self.now = now
+        self.files = {}
+        self.uploads = 0
+        self.ids = itertools.count(1)
+
+    def upload(self, file_path, mime_type):
+        """Upload function with the get_remote_file contract (see upload_registry.gemini_uploader)."""
+        self.uploads += 1
+        name = f"files/fake-{next(self.ids)}"
+        self.files[name] = file_path
+        return {"name": name, "uri": FAKE_ENDPOINT + name, "mime_type": mime_type,
+                "expires_at": self.now + self.lifetime_seconds}
+
+    def delete(self, name):
+        self.files.pop(name, None)
+
+    def client(self):
+        """A client whose files.upload and models.generate_content talk to this service."""
+        def upload(file, config):
+            entry = self.upload(file, config["mime_type"])
+            return SimpleNamespace(name=entry["name"], uri=entry["uri"], mime_type=entry["mime_type"],
+                                   expiration_time=datetime.datetime.fromtimestamp(entry["expires_at"]))
+
+        def generate_content(model, contents, config=None):
+            file_data = contents[0].file_data
+            if file_data is not None and file_data.file_uri.removeprefix(FAKE_ENDPOINT) not in self.files:
+                raise errors.ClientError(404, {"error": {"code": 404, "message": "File not found",
+                                                         "status": "NOT_FOUND"}})
+            return types.GenerateContentResponse.model_validate(
+                {"candidates": [{"content": {"role": "model", "parts": [{"text": "{}"}]}}]})
+
+        return SimpleNamespace(files=SimpleNamespace(upload=upload),
+                               models=SimpleNamespace(generate_content=generate_content))
+
+@pytest.fixture
+def pdf_file(tmp_path):
+    path = tmp_path / "document.pdf"
+    path.write_bytes(b"%PDF-1.4 fake document")
+    return str(path)
+
+def test_same_content_reuses_upload(tmp_path, pdf_file):
+    service = FakeFileService()
+    registry_path = str(tmp_path / "registry.json")
+    copy_path = tmp_path / "renamed.pdf"
+    copy_path.write_bytes(open(pdf_file, 'rb').read())
+
+    first, reused_first = get_remote_file(pdf_file, service.upload, registry_path=registry_path, now=service.now)
+    second, reused_second = get_remote_file(str(copy_path), service.upload, registry_path=registry_path,
+                                            now=service.now + 60)
+
+    assert (reused_first, reused_second) == (False, True)
+    assert second["name"] == first["name"]
+    assert service.uploads == 1
+
+def test_scopes_upload_separately(tmp_path, pdf_file):
+    service = FakeFileService()
+    registry_path = str(tmp_path / "registry.json")
+
+    get_remote_file(pdf_file, service.upload, registry_path=registry_path, now=service.now, scope="key-a")
+    _, reused = get_remote_file(pdf_file, service.upload, registry_path=registry_path, now=service.now, scope="key-b")
+
+    assert not reused
+    assert service.uploads == 2
+
+def test_upload_near_expiry_is_replaced(tmp_path, pdf_file):
+    service = FakeFileService(lifetime_seconds=3600)
+    registry_path = str(tmp_path / "registry.json")
+    first, _ = get_remote_file(pdf_file, service.upload, registry_path=registry_path, now=service.now)
+
+    just_before_margin = first["expires_at"] - EXPIRY_MARGIN_SECONDS - 1
+    _, reused = get_remote_file(pdf_file, service.upload, registry_path=registry_path, now=just_before_margin)
+    assert reused
+
+    service.now = first["expires_at"] - EXPIRY_MARGIN_SECONDS + 1
+    second, reused = get_remote_file(pdf_file, service.upload, registry_path=registry_path, now=service.now)
+    assert not reused
+    assert second["name"] != first["name"]
+    assert service.uploads == 2
+
+def test_invalidated_upload_is_uploaded_again(tmp_path, pdf_file):
+    service = FakeFileService()
+    registry_path = str(tmp_path / "registry.json")
+    first, _ = get_remote_file(pdf_file, service.upload, registry_path=registry_path, now=service.now)
+
+    invalidate(hash_file(pdf_file).hexdigest(), registry_path=registry_path)
+    second, reused = get_remote_file(pdf_file, service.upload, registry_path=registry_path, now=service.now)
+
+    assert not reused
+    assert second["name"] != first["name"]
+
+def test_rejected_file_reference_is_uploaded_again(monkeypatch, pdf_file):
+    monkeypatch.setattr(gemini_calls, "USE_FILE_API", True)
+    monkeypatch.setattr(gemini_calls, "USE_CONTEXT_CACHE", False)
+    service = FakeFileService(now=upload_registry.time.time())
+    client = service.client()
+
+    pdf_part = gemini_calls._pdf_part(client, pdf_file, "test-key")
+    # The file disappears server-side while the registry still considers it valid
+    service.delete(pdf_part.file_data.file_uri.removeprefix(FAKE_ENDPOINT))
+    response = gemini_calls._generate_for_file(client, pdf_part, pdf_file, "prompt", api_key="test-key")
+
+    assert response.text == "{}"
+    assert service.uploads == 2
+    _, reused = get_remote_file(pdf_file, service.upload, scope=gemini_calls.key_label("test-key"))
+    assert reused
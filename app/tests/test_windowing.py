@@ -0,0 +1,70 @@
+from windowing import (
+    WINDOW_BYTE_THRESHOLD, WINDOW_OVERLAP, WINDOW_PAGES, merge_window_results, merge_window_values, plan_windows
+)
+
+def test_short_document_is_one_window():
+    assert plan_windows(10) == [(0, 10)]
+
+def test_windows_overlap_and_cover_all_pages():
+    windows = plan_windows(100)
+    assert windows[0] == (0, WINDOW_PAGES)
+    assert windows[-1][1] == 100
+    for (_, previous_end), (start, _) in zip(windows, windows[1:]):
+        assert previous_end - start == WINDOW_OVERLAP
+
+def test_large_pages_shrink_windows_under_the_byte_threshold():
+    page_count = 30
+    file_size = 2 * WINDOW_BYTE_THRESHOLD
+    windows = plan_windows(page_count, file_size)
+    assert len(windows) > 1
+    assert windows[-1][1] == page_count
+    for start, end in windows:
+        assert (end - start) * file_size / page_count <= WINDOW_BYTE_THRESHOLD
+
+def answer(value, location="", reasoning=""):
+    return {"value": value, "location": location, "reasoning": reasoning}
+
+def test_booleans_are_ored():
+    merged = merge_window_values([answer(False), answer(True, "p. 3", "found"), answer(False)])
+    assert merged == answer(True, "p. 3", "found")
+
+def test_lists_are_unioned_and_deduplicated():
+    merged = merge_window_values([
+        answer(["PET", "HDPE"]),
+        answer(["pet ", "PVC"], "p. 7", "listed"),
+        answer(None),
+    ])
+    assert [item.strip().lower() for item in merged["value"]] == ["pet", "hdpe", "pvc"]
+    assert merged["location"] == "p. 7"
+
+def test_list_items_keep_the_best_supported_copy():
+    weak = {"value": "PET", "location": "", "reasoning": ""}
+    strong = {"value": "pet", "location": "p. 2", "reasoning": "table 1"}
+    assert merge_window_values([[weak], [strong]]) == [strong]
+
+def test_scalars_keep_the_best_supported_answer():
+    merged = merge_window_values([
+        answer("", "", ""),
+        answer("2019", "", "a guess"),
+        answer("2021", "p. 12", "stated in the introduction"),
+    ])
+    assert merged == answer("2021", "p. 12", "stated in the introduction")
+
+def test_all_empty_scalars_stay_empty():
+    assert merge_window_values([answer(""), answer(None)])["value"] == ""
+
+def test_mixed_shapes_prefer_a_structured_answer():
+    assert merge_window_values(["", answer("EU", "p. 1", "scope")]) == answer("EU", "p. 1", "scope")
+    assert merge_window_values([None, None]) is None
+
+def test_merge_window_results_merges_nested_sections_and_skips_failed_windows():
+    first = {"policy": {"mentioned": answer(False), "year": answer("")}}
+    second = {"policy": {"mentioned": answer(True, "p. 30", "quoted"), "targets": answer(["recycling"])}}
+    merged = merge_window_results([first, None, second])
+    assert merged["policy"]["mentioned"]["value"] is True
+    assert merged["policy"]["year"]["value"] == ""
+    assert merged["policy"]["targets"]["value"] == ["recycling"]
+    assert list(merged["policy"]) == ["mentioned", "year", "targets"]
+
+def test_merge_window_results_with_only_failed_windows():
+    assert merge_window_results([None, None]) is None
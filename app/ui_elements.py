@@ -1,26 +1,31 @@
 import streamlit as st
-import numpy as np
-from IRR_pipeline import process_json_files
-import seaborn as sns
 import re
+import math
 import traceback
-import matplotlib.pyplot as plt
 from pathlib import Path
 import os
 import json
-import pandas as pd
-import zipfile
-import io
 from utils import (
     load_codebook_template, load_codebook_comments, save_codebook_comments, 
-    fetch_github_file, display_json_editor, render_nested_json,
+    display_json_editor, render_nested_json,
     create_dataframe_from_json, load_lyrics, save_uploaded_file,
-    create_zip_from_results, ensure_folders_exist, get_default_api_key,
+    create_zip_from_results, deferred_file_data, ensure_folders_exist, get_default_api_key,
     DEFAULT_CODEBOOK_URL
 )
 
-from irr_analysis import run_irr_analysis_for_streamlit
-from gemini_calls import analyze_pdf_file
+# Modules that pull in pandas, matplotlib, seaborn or google.genai (the pipeline, API key pool,
+# versioning) are imported inside the functions that use them, so importing this module stays fast
+from codebook_diff import diff_codebooks, changed_field_paths, removed_field_paths
+from pdf_slimming import SLIMMING_POLICIES, format_slimming_stats
+from adaptive_rate import current_limits
+from batch_planner import (
+    MODE_FULL, MODE_SECTIONED, MODE_INCREMENTAL, plan_batch, format_plan, format_eta,
+    create_job, get_job, update_job, pending_files, list_jobs
+)
+from model_backend import MODEL_BACKEND, RECORDINGS_DIR, is_replay
+from stage_timing import stage_totals
+from metrics import increment
+from result_store import put_result, get_result, get_results
 
 # Directory setup
 DOCS_FOLDER = "docs"     # Folder containing PDF files to analyze
@@ -83,6 +88,10 @@ def render_sidebar():
             # If using the default key
             st.info("Using API key from environment variables")
         
+        if MODEL_BACKEND != "live":
+            st.info(f"Model backend: **{MODEL_BACKEND}** (responses {'served from' if is_replay() else 'stored in'} "
+                    f"'{RECORDINGS_DIR}')")
+        
         # GitHub integration
         st.subheader("GitHub Integration")
         
@@ -92,7 +101,8 @@ def render_sidebar():
         if st.button("Refresh Codebook from GitHub"):
             with st.spinner("Fetching latest codebook from GitHub..."):
                 # Force reload from GitHub
-                codebook = load_codebook_comments(github_url=DEFAULT_CODEBOOK_URL, force_local=False)
+                codebook = load_codebook_comments(github_url=DEFAULT_CODEBOOK_URL, force_local=False,
+                                                  wait_for_refresh=True)
                 if codebook:
                     st.session_state.codebook_comments = codebook
                     st.success("Successfully refreshed codebook from GitHub!")
@@ -113,7 +123,8 @@ def render_sidebar():
             
             if st.button("Fetch from Custom URL"):
                 with st.spinner("Fetching from custom GitHub URL..."):
-                    codebook = load_codebook_comments(github_url=github_url, force_local=False)
+                    codebook = load_codebook_comments(github_url=github_url, force_local=False,
+                                                      wait_for_refresh=True)
                     if codebook:
                         st.session_state.codebook_comments = codebook
                         st.success("Successfully fetched codebook from custom URL!")
@@ -232,15 +243,19 @@ def render_file_processing_tab():
                     
                     # Process button
                     if st.button("Process File"):
+                        from gemini_calls import analyze_pdf_file
                         # API key handling is done within the function
+                        run_info = {"mode": "full"}
                         result = analyze_pdf_file(
                             file_path, 
                             codebook_template, 
-                            st.session_state.codebook_comments
+                            st.session_state.codebook_comments,
+                            run_info=run_info
                         )
                         
                         if result:
-                            st.session_state.results[selected_file] = result
+                            st.session_state.result_hashes[selected_file] = put_result(result)
+                            st.session_state.run_metadata[selected_file] = run_info
                             if selected_file not in st.session_state.processed_files:
                                 st.session_state.processed_files.append(selected_file)
                             
@@ -267,8 +282,25 @@ def render_file_processing_tab():
         else:
             st.error(f"The '{DOCS_FOLDER}' folder does not exist. Please create it and add PDF files.")
 
+def _quota_budget(username):
+    """Returns (requests left today, requests per full quota day) for a user across the API key pool."""
+    if is_replay():
+        # Replayed responses don't use any quota
+        return math.inf, math.inf
+    from api_key_pool import KEY_CALLS_PER_DAY, calls_left_today, environment_api_keys
+    from user_quota import get_allowance, requests_left_today
+    api_keys = environment_api_keys()
+    if st.session_state.get("api_key") and st.session_state.api_key not in api_keys:
+        api_keys.append(st.session_state.api_key)
+    daily_requests, _ = get_allowance(username)
+    return (min(calls_left_today(api_keys), requests_left_today(username)),
+            min(len(api_keys) * KEY_CALLS_PER_DAY, daily_requests))
+
 def render_batch_processing_tab():
     """Render the batch processing tab with integrated IRR analysis."""
+    from versioning import list_experiments, get_experiment
+    from api_key_pool import next_daily_reset
+    
     st.header("Batch Process & Analyze")
     
     st.info("""
@@ -294,6 +326,41 @@ def render_batch_processing_tab():
                 if not nvivo_exists:
                     st.warning(f"NVivo export file ({nvivo_path}) not found. IRR analysis will be skipped.")
                 
+                # Estimate the quota needed per extraction mode before starting
+                username = st.session_state.get("username") or "anonymous"
+                left_today, daily_budget = _quota_budget(username)
+                calls_per_minute, _ = current_limits()
+                with st.expander("Batch Plan & Quota"):
+                    if is_replay():
+                        st.caption(f"Quota: not used by the replay backend, {calls_per_minute:.1f} calls/min.")
+                    else:
+                        st.caption(f"Quota: {left_today} requests left today, {daily_budget} per day "
+                                   f"(resets {format_eta(next_daily_reset())}), {calls_per_minute:.1f} calls/min.")
+                    pdf_paths = [os.path.join(DOCS_FOLDER, f) for f in pdf_files]
+                    plan_rows = []
+                    for mode in [MODE_FULL, MODE_SECTIONED]:
+                        plan = plan_batch(pdf_paths, mode, len(codebook_template), left_today, daily_budget,
+                                          calls_per_minute, next_daily_reset())
+                        plan_rows.append({
+                            "Mode": mode,
+                            "Requests": plan["total_requests"],
+                            "Processing (min)": plan["processing_minutes"],
+                            "Quota Days": len(plan["days"]),
+                            "ETA": format_eta(plan["eta"])
+                        })
+                    st.table(plan_rows)
+                
+                # Jobs that ran out of quota can be resumed on a later day
+                queued_jobs = list_jobs(username)
+                if queued_jobs:
+                    st.subheader("Queued Jobs")
+                    st.table([{
+                        "Job": job["id"],
+                        "Experiment": job["name"],
+                        "Done": f"{len(job['files']) - len(pending_files(job))}/{len(job['files'])}",
+                        "ETA": format_eta(job["plan"].get("eta"))
+                    } for job in queued_jobs])
+                
                 # Combined form with metadata and process button
                 with st.form(key="experiment_form"):
                     st.subheader("Experiment Information")
@@ -302,33 +369,199 @@ def render_batch_processing_tab():
                     exp_notes = st.text_area("Experiment Notes (optional):", 
                                            placeholder="Enter notes about this experiment (e.g., changes made to codebook)")
                     
+                    extraction_mode = st.radio(
+                        "Extraction mode:",
+                        [MODE_FULL, MODE_SECTIONED],
+                        horizontal=True,
+                        help="Sectioned mode requests each top-level codebook section concurrently and merges the results. "
+                             "Smaller responses are faster and less likely to be truncated."
+                    )
+                    
+                    top_k_pages = st.number_input(
+                        "Pages per section (sectioned mode, 0 = all pages):",
+                        min_value=0,
+                        value=0,
+                        help="Ranks pages offline against each section's codebook descriptions (BM25) "
+                             "and only sends the most relevant pages with that section's request."
+                    )
+                    
+                    slimming_policy = st.selectbox(
+                        "PDF pre-processing:",
+                        list(SLIMMING_POLICIES.keys()),
+                        help="Local pre-pass that shrinks documents before upload: 'strip_images' removes embedded images, "
+                             "'drop_blank_pages' skips blank and repeated pages, 'slim' does both, and 'text' sends the "
+                             "extracted text with page markers instead of the PDF. Results are cached per document."
+                    )
+                    
+                    # Incremental mode: only re-extract fields whose definitions changed since a previous experiment
+                    previous_experiments = [exp.get("id", "") for exp in list_experiments()]
+                    incremental = st.checkbox(
+                        "Incremental mode (only re-extract changed codebook fields)",
+                        disabled=not previous_experiments,
+                        help="Compares the current codebook with a previous experiment's codebook and only asks the model for changed fields. "
+                             "New values are merged into that experiment's results."
+                    )
+                    base_experiment_id = st.selectbox(
+                        "Base experiment for incremental mode:",
+                        previous_experiments,
+                        disabled=not previous_experiments
+                    ) if previous_experiments else None
+                    
+                    new_job_option = "(start a new job)"
+                    resume_job_id = st.selectbox(
+                        "Resume queued job:",
+                        [new_job_option] + [job["id"] for job in queued_jobs],
+                        help="Continues a job's remaining files with the settings it was started with."
+                    ) if queued_jobs else new_job_option
+                    
                     # Submit button for the combined form
                     process_submitted = st.form_submit_button("Process & Analyze")
                 
                 # Process the files if the form was submitted
                 if process_submitted:
+                    from gemini_calls import analyze_pdf_file, analyze_pdf_file_incremental, analyze_pdf_file_sectioned
+                    from resilience import breaker_pause_seconds, wait_for_breaker
+                    from user_quota import check_allowance
+                    job = get_job(resume_job_id) if resume_job_id != new_job_option else None
+                    if job:
+                        # Resume with the settings the job was started with
+                        exp_name, exp_notes = job["name"], job["notes"]
+                        extraction_mode = job["settings"]["extraction_mode"]
+                        top_k_pages = job["settings"]["top_k_pages"]
+                        slimming_policy = job["settings"]["slimming_policy"]
+                        incremental = job["settings"]["incremental"]
+                        base_experiment_id = job["settings"]["base_experiment_id"]
+                    
                     if not exp_name:
                         st.error("Please enter an experiment name before processing.")
                     else:
+                        # Work out which fields changed since the base experiment
+                        base_results = None
+                        changed_paths = []
+                        removed_paths = []
+                        if incremental and base_experiment_id:
+                            base_experiment = get_experiment(base_experiment_id) or {}
+                            base_results = base_experiment.get('results', {})
+                            codebook_diff = diff_codebooks(base_experiment.get('codebook', {}), st.session_state.codebook_comments)
+                            changed_paths = changed_field_paths(codebook_diff)
+                            removed_paths = removed_field_paths(codebook_diff)
+                        
+                        # Plan the batch across quota days and record it in the persistent queue; in incremental
+                        # mode, files without a previous result are estimated as full extractions
+                        batch_files = pending_files(job) if job else pdf_files
+                        planning_mode = MODE_INCREMENTAL if base_results is not None else extraction_mode
+                        incremental_files = None
+                        if base_results is not None:
+                            incremental_files = {f for f in batch_files
+                                                 if os.path.splitext(f)[0] + "_codebook.json" in base_results}
+                        plan = plan_batch([os.path.join(DOCS_FOLDER, f) for f in batch_files], planning_mode,
+                                          len(codebook_template), *_quota_budget(username),
+                                          current_limits()[0], next_daily_reset(),
+                                          incremental_files=incremental_files, fallback_mode=extraction_mode)
+                        if job:
+                            job_id = job["id"]
+                            update_job(job_id, plan=plan)
+                        else:
+                            job_id = create_job(username, exp_name, exp_notes, {
+                                "extraction_mode": extraction_mode,
+                                "top_k_pages": int(top_k_pages),
+                                "slimming_policy": slimming_policy,
+                                "incremental": incremental,
+                                "base_experiment_id": base_experiment_id
+                            }, batch_files, plan)
+                        st.info(f"Batch plan ({job_id}): {format_plan(plan)}")
+                        
                         # Process all PDF files
                         st.subheader("Step 1: Processing Documents")
                         progress_bar = st.progress(0)
                         
+                        if base_results is not None:
+                            st.info(f"Incremental mode: {len(changed_paths)} codebook fields changed and {len(removed_paths)} "
+                                    f"removed since '{base_experiment_id}'.")
+                        
                         results = {}
-                        for i, filename in enumerate(pdf_files):
+                        run_metadata = {}
+                        batch_timings = {"spans": []}
+                        for i, filename in enumerate(batch_files):
                             file_path = os.path.join(DOCS_FOLDER, filename)
-                            st.write(f"Processing {filename} ({i+1}/{len(pdf_files)})")
+                            st.write(f"Processing {filename} ({i+1}/{len(batch_files)})")
+                            
+                            # Pause the batch while the API is failing instead of failing every remaining file
+                            pause_seconds = breaker_pause_seconds()
+                            if pause_seconds > 0:
+                                st.warning(f"Gemini API is failing repeatedly. Pausing the batch for {pause_seconds:.0f} seconds.")
+                                wait_for_breaker(take_trial=False)
+                            
+                            # Stop (rather than fail every remaining file) once the user's daily allowance is used up
+                            allowed, message = (True, "") if is_replay() else check_allowance(username)
+                            if not allowed:
+                                st.error(f"{message}. Stopping the batch; the remaining files stay queued as '{job_id}'.")
+                                break
+                            
+                            # Skip files that need more requests than a full quota day; they could never run
+                            if filename in plan.get("unschedulable", []):
+                                st.error(f"{filename} needs ~{plan['file_requests'][filename]} requests, more than a full "
+                                         f"quota day allows. Skipping it.")
+                                update_job(job_id, filename, "skipped")
+                                progress_bar.progress((i + 1) / len(batch_files))
+                                continue
+                            
+                            # Leave files that don't fit in today's quota for the next quota day
+                            if _quota_budget(username)[0] < plan["file_requests"][filename]:
+                                st.warning(f"Today's quota can't cover {filename}. The remaining files stay queued as "
+                                           f"'{job_id}' and can be resumed after the quota resets at {format_eta(next_daily_reset())}.")
+                                break
+                            
+                            previous_result = None
+                            if base_results is not None:
+                                previous_result = base_results.get(os.path.splitext(filename)[0] + "_codebook.json")
                             
                             # API key handling is done within the function
-                            result = analyze_pdf_file(
-                                file_path, 
-                                codebook_template, 
-                                st.session_state.codebook_comments
-                            )
+                            run_info = {}
+                            if previous_result is not None:
+                                run_info["mode"] = "incremental"
+                                run_info["changed_fields"] = changed_paths
+                                run_info["removed_fields"] = removed_paths
+                                result = analyze_pdf_file_incremental(
+                                    file_path,
+                                    codebook_template,
+                                    st.session_state.codebook_comments,
+                                    previous_result,
+                                    changed_paths,
+                                    run_info=run_info,
+                                    slimming_policy=slimming_policy,
+                                    removed_paths=removed_paths
+                                )
+                            elif extraction_mode == MODE_SECTIONED:
+                                result = analyze_pdf_file_sectioned(
+                                    file_path,
+                                    codebook_template,
+                                    st.session_state.codebook_comments,
+                                    run_info=run_info,
+                                    slimming_policy=slimming_policy,
+                                    top_k_pages=int(top_k_pages)
+                                )
+                                if run_info.get("merge_conflicts"):
+                                    st.warning(f"{len(run_info['merge_conflicts'])} merge conflicts while combining sections of {filename}")
+                            else:
+                                run_info["mode"] = "full"
+                                result = analyze_pdf_file(
+                                    file_path, 
+                                    codebook_template, 
+                                    st.session_state.codebook_comments,
+                                    run_info=run_info,
+                                    slimming_policy=slimming_policy
+                                )
+                            
+                            run_metadata[filename] = run_info
+                            update_job(job_id, filename, "done" if result else "failed", run_info=run_info)
+                            increment("greentrac_files_processed_total", mode=run_info.get("mode", "full"),
+                                      status="ok" if result else "failed")
                             
                             if result:
                                 results[filename] = result
-                                st.session_state.results[filename] = result
+                                st.session_state.result_hashes[filename] = put_result(result)
+                                st.session_state.run_metadata[filename] = run_info
                                 if filename not in st.session_state.processed_files:
                                     st.session_state.processed_files.append(filename)
                                 
@@ -338,129 +571,166 @@ def render_batch_processing_tab():
                                     json.dump(result, outfile, indent=2, ensure_ascii=False)
                                 
                                 st.success(f"✓ {os.path.basename(output_filename)}")
+                                if run_info.get("tokens"):
+                                    stage_times = ", ".join(f"{stage}: {seconds:.1f}s" for stage, seconds in stage_totals(run_info.get("spans", [])).items())
+                                    st.caption(f"Tokens: {run_info['tokens']['input']:,} in / {run_info['tokens']['output']:,} out - {stage_times}")
+                                if run_info.get("sections"):
+                                    timings = ", ".join(f"{section}: {info['seconds']:.1f}s" for section, info in run_info["sections"].items())
+                                    st.caption(f"Section timings - {timings}")
+                                if run_info.get("retries"):
+                                    st.caption(f"Retried {run_info['retries']['retried']} transient API errors")
+                                if run_info.get("windows"):
+                                    windows = ", ".join(f"pages {w['pages'][0]}-{w['pages'][1]}: {w['seconds']:.1f}s" for w in run_info["windows"])
+                                    st.caption(f"Processed in {len(run_info['windows'])} page windows - {windows}")
+                                if run_info.get("slimming"):
+                                    st.caption(format_slimming_stats(run_info["slimming"]))
                             else:
                                 st.error(f"Failed to process {filename}")
                             
                             # Update progress
-                            progress_bar.progress((i + 1) / len(pdf_files))
+                            progress_bar.progress((i + 1) / len(batch_files))
                         
-                        st.success(f"Document processing complete. Processed {len(results)}/{len(pdf_files)} files.")
+                        st.success(f"Document processing complete. Processed {len(results)}/{len(batch_files)} files.")
+                        calls_per_minute, concurrency = current_limits()
+                        st.caption(f"Learned API limits: {calls_per_minute:.1f} calls/min, {concurrency} concurrent requests")
                         
-                        # Run IRR analysis if possible
-                        irr_results = None
-                        if nvivo_exists and results:
-                            st.subheader("Step 2: Running IRR Analysis")
-                            try:
-                                with st.spinner("Preparing LLM data for IRR analysis..."):
-                                    # Get paths to the JSON files in the docs folder
-                                    json_file_paths = []
-                                    for filename in results.keys():
-                                        # The JSON file is in the same location as the PDF but with _codebook.json suffix
-                                        json_filename = os.path.splitext(filename)[0] + "_codebook.json"
-                                        json_path = os.path.join(DOCS_FOLDER, json_filename)
+                        # Analysis and saving run once every file of the job has been processed
+                        job = get_job(job_id)
+                        remaining_files = pending_files(job) if job else []
+                        if job is None:
+                            st.error(f"Job '{job_id}' is no longer in the batch queue, so its results can't be analyzed "
+                                     f"or saved. Results of processed files are in '{DOCS_FOLDER}'.")
+                        elif remaining_files:
+                            st.info(f"{len(remaining_files)} files of '{job_id}' are still queued. IRR analysis and saving "
+                                    f"will run when the job is resumed and completed (ETA {format_eta(job['plan'].get('eta'))}).")
+                        else:
+                            # Include files completed on earlier days of a resumed job
+                            for done_file, file_status in job["files"].items():
+                                done_path = os.path.join(DOCS_FOLDER, os.path.splitext(done_file)[0] + "_codebook.json")
+                                if file_status == "done" and done_file not in results and os.path.exists(done_path):
+                                    with open(done_path, 'r', encoding="utf-8") as f:
+                                        results[done_file] = json.load(f)
+                                    if done_file in job.get("run_metadata", {}):
+                                        run_metadata[done_file] = job["run_metadata"][done_file]
+                            
+                            # Run IRR analysis if possible
+                            irr_results = None
+                            if nvivo_exists and results:
+                                st.subheader("Step 2: Running IRR Analysis")
+                                try:
+                                    with st.spinner("Preparing LLM data for IRR analysis..."):
+                                        # Get paths to the JSON files in the docs folder
+                                        json_file_paths = []
+                                        for filename in results.keys():
+                                            # The JSON file is in the same location as the PDF but with _codebook.json suffix
+                                            json_filename = os.path.splitext(filename)[0] + "_codebook.json"
+                                            json_path = os.path.join(DOCS_FOLDER, json_filename)
                                         
-                                        if os.path.exists(json_path):
-                                            json_file_paths.append(json_path)
-                                        else:
-                                            st.warning(f"Could not find JSON file for {filename} at {json_path}")
+                                            if os.path.exists(json_path):
+                                                json_file_paths.append(json_path)
+                                            else:
+                                                st.warning(f"Could not find JSON file for {filename} at {json_path}")
 
-                                    # Only proceed if we found valid JSON files
-                                    if json_file_paths:
-                                        # Process JSON files into a DataFrame
-                                        from IRR_pipeline import process_json_files
-                                        st.info(f"Found {len(json_file_paths)} JSON files for IRR analysis")
-                                        llm_data_df = process_json_files(json_file_paths)
+                                        # Only proceed if we found valid JSON files
+                                        if json_file_paths:
+                                            # Process JSON files into a DataFrame
+                                            from IRR_pipeline import process_json_files
+                                            st.info(f"Found {len(json_file_paths)} JSON files for IRR analysis")
+                                            llm_data_df = process_json_files(json_file_paths)
                                         
-                                        if llm_data_df.empty:
-                                            st.error("Could not process JSON files into a usable DataFrame for IRR analysis.")
-                                        else:
-                                            # Save DataFrame to a temporary CSV file
-                                            temp_llm_csv_path = os.path.join(RESULTS_FOLDER, "temp_llm_data.csv")
-                                            llm_data_df.to_csv(temp_llm_csv_path, index=False)
+                                            if llm_data_df.empty:
+                                                st.error("Could not process JSON files into a usable DataFrame for IRR analysis.")
+                                            else:
+                                                # Save DataFrame to a temporary CSV file
+                                                temp_llm_csv_path = os.path.join(RESULTS_FOLDER, "temp_llm_data.csv")
+                                                llm_data_df.to_csv(temp_llm_csv_path, index=False)
                                             
-                                            # Run IRR analysis
-                                            from irr_analysis import run_irr_analysis_for_streamlit
-                                            with st.spinner("Running IRR analysis..."):
-                                                irr_results = run_irr_analysis_for_streamlit(
-                                                    llm_data_path=temp_llm_csv_path,
-                                                    nvivo_data_path=nvivo_path,
-                                                    output_dir=RESULTS_FOLDER
-                                                )
+                                                # Run IRR analysis
+                                                from irr_analysis import run_irr_analysis_for_streamlit
+                                                with st.spinner("Running IRR analysis..."):
+                                                    irr_results = run_irr_analysis_for_streamlit(
+                                                        llm_data_path=temp_llm_csv_path,
+                                                        nvivo_data_path=nvivo_path,
+                                                        output_dir=RESULTS_FOLDER,
+                                                        spans_owner=batch_timings
+                                                    )
                                             
-                                            if irr_results:
-                                                st.session_state.irr_analysis = irr_results
-                                                st.success("IRR analysis completed successfully!")
-                                            else:
-                                                st.error("IRR analysis failed to complete.")
-                                    else:
-                                        st.error("No valid JSON files found for IRR analysis. Cannot proceed.")
-                            except Exception as e:
-                                import traceback
-                                st.error(f"Error running IRR analysis: {e}")
-                                st.code(traceback.format_exc())
-                        else:
-                            if not nvivo_exists:
-                                st.info("Step 2: IRR Analysis (Skipped - NVivo export not found)")
-                            elif not results:
-                                st.info("Step 2: IRR Analysis (Skipped - No processing results)")
+                                                if irr_results:
+                                                    st.session_state.irr_analysis_hash = put_result(irr_results)
+                                                    st.success("IRR analysis completed successfully!")
+                                                else:
+                                                    st.error("IRR analysis failed to complete.")
+                                        else:
+                                            st.error("No valid JSON files found for IRR analysis. Cannot proceed.")
+                                except Exception as e:
+                                    import traceback
+                                    st.error(f"Error running IRR analysis: {e}")
+                                    st.code(traceback.format_exc())
+                            else:
+                                if not nvivo_exists:
+                                    st.info("Step 2: IRR Analysis (Skipped - NVivo export not found)")
+                                elif not results:
+                                    st.info("Step 2: IRR Analysis (Skipped - No processing results)")
                         
-                        # Save everything as a single experiment
-                        st.subheader("Step 3: Saving Experiment")
-                        with st.spinner("Saving experiment..."):
-                            from ui_experiment_history import save_current_experiment
-                            experiment_id = save_current_experiment(
-                                results=results,
-                                notes=exp_notes,
-                                name=exp_name
-                            )
+                            # Save everything as a single experiment
+                            st.subheader("Step 3: Saving Experiment")
+                            with st.spinner("Saving experiment..."):
+                                from ui_experiment_history import save_current_experiment
+                                experiment_id = save_current_experiment(
+                                    results=results,
+                                    notes=exp_notes,
+                                    name=exp_name,
+                                    run_metadata=run_metadata,
+                                    batch_spans=batch_timings["spans"]
+                                )
                             
-                            if experiment_id:
-                                st.success(f"Experiment saved with ID: {experiment_id}")
-                                st.info("You can view experiment details in the 'Experiment History' tab.")
-                            else:
-                                st.error("Failed to save experiment.")
+                                if experiment_id:
+                                    st.success(f"Experiment saved with ID: {experiment_id}")
+                                    st.info("You can view experiment details in the 'Experiment History' tab.")
+                                else:
+                                    st.error("Failed to save experiment.")
                         
-                        # Create download links
-                        st.subheader("Step 4: Download Options")
-                        col1, col2 = st.columns(2)
+                            # Create download links
+                            st.subheader("Step 4: Download Options")
+                            col1, col2 = st.columns(2)
                         
-                        with col1:
-                            # Download results as ZIP
-                            if results:
-                                zip_data = create_zip_from_results(results)
-                                st.download_button(
-                                    label="Download Results (ZIP)",
-                                    data=zip_data,
-                                    file_name="codebook_results.zip",
-                                    mime="application/zip"
-                                )
+                            with col1:
+                                # Download results as ZIP
+                                if results:
+                                    # Archive is cached by content hash, so reruns reuse it
+                                    zip_path = create_zip_from_results(results)
+                                    st.download_button(
+                                        label="Download Results (ZIP)",
+                                        data=deferred_file_data(zip_path, lambda: create_zip_from_results(results)),
+                                        file_name="codebook_results.zip",
+                                        mime="application/zip"
+                                    )
                         
-                        with col2:
-                            # Download IRR report if available
-                            if irr_results and 'report_path' in irr_results and os.path.exists(irr_results['report_path']):
-                                with open(irr_results['report_path'], "rb") as f:
+                            with col2:
+                                # Download IRR report if available
+                                if irr_results and 'report_path' in irr_results and os.path.exists(irr_results['report_path']):
                                     st.download_button(
                                         label="Download IRR Report (Excel)",
-                                        data=f.read(),
+                                        data=deferred_file_data(irr_results['report_path']),
                                         file_name="irr_analysis_report.xlsx",
                                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                     )
                         
-                        # Offer to navigate to results or experiment history
-                        st.subheader("Next Steps")
-                        col1, col2 = st.columns(2)
+                            # Offer to navigate to results or experiment history
+                            st.subheader("Next Steps")
+                            col1, col2 = st.columns(2)
                         
-                        with col1:
-                            if st.button("View Results Tab"):
-                                # Set a session state variable that the Results tab will check
-                                st.session_state.active_tab = "Results"
-                                st.experimental_rerun()
+                            with col1:
+                                if st.button("View Results Tab"):
+                                    # Set a session state variable that the Results tab will check
+                                    st.session_state.active_tab = "Results"
+                                    st.experimental_rerun()
                         
-                        with col2:
-                            if st.button("View Experiment History"):
-                                # Set a session state variable that will be checked to switch tabs
-                                st.session_state.active_tab = "Experiment History"
-                                st.experimental_rerun()
+                            with col2:
+                                if st.button("View Experiment History"):
+                                    # Set a session state variable that will be checked to switch tabs
+                                    st.session_state.active_tab = "Experiment History"
+                                    st.experimental_rerun()
             else:
                 st.warning(f"No PDF files found in the '{DOCS_FOLDER}' folder.")
         else:
@@ -493,7 +763,7 @@ def render_results_viewer_tab():
                 placeholder="Choose a file..."
             )
             
-            if selected_file and selected_file in st.session_state.results:
+            if selected_file and selected_file in st.session_state.result_hashes:
                 st.write(f"Viewing results for: **{selected_file}**")
                 
                 # View options
@@ -503,7 +773,10 @@ def render_results_viewer_tab():
                     horizontal=True
                 )
                 
-                result = st.session_state.results[selected_file]
+                result = get_result(st.session_state.result_hashes[selected_file])
+                if result is None:
+                    st.warning("This result is no longer in the result store. Process the file again to view it.")
+                    result = {}
                 
                 if view_mode == "Raw JSON":
                     st.json(result)
@@ -527,13 +800,12 @@ def render_results_viewer_tab():
     
     # IRR Analysis Results tab
     with irr_tab:
-        if 'irr_analysis' not in st.session_state or not st.session_state.irr_analysis:
+        irr_results = get_result(st.session_state.get('irr_analysis_hash'))
+        if not irr_results:
             st.info("No IRR analysis results available. Run the 'Batch Processing & Analysis' workflow to generate IRR results.")
         else:
             st.subheader("Inter-Rater Reliability Analysis")
             
-            irr_results = st.session_state.irr_analysis
-            
             # Display summary metrics
             if 'summary_data' in irr_results:
                 summary_data = irr_results['summary_data']
@@ -589,7 +861,7 @@ def render_results_viewer_tab():
             if 'report_path' in irr_results and os.path.exists(irr_results['report_path']):
                 st.download_button(
                     label="Download IRR Report (Excel)",
-                    data=open(irr_results['report_path'], "rb").read(),
+                    data=deferred_file_data(irr_results['report_path']),
                     file_name="irr_analysis_report.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
@@ -798,7 +1070,7 @@ def render_results_viewer_tab():
             placeholder="Choose a file..."
         )
         
-        if selected_file and selected_file in st.session_state.results:
+        if selected_file and selected_file in st.session_state.result_hashes:
             st.subheader(f"Results for {selected_file}")
             
             # View options
@@ -808,7 +1080,10 @@ def render_results_viewer_tab():
                 horizontal=True
             )
             
-            result = st.session_state.results[selected_file]
+            result = get_result(st.session_state.result_hashes[selected_file])
+            if result is None:
+                st.warning("This result is no longer in the result store. Process the file again to view it.")
+                result = {}
             
             if view_mode == "Raw JSON":
                 st.json(result)
@@ -889,6 +1164,9 @@ def render_irr_analysis_tab():
         should_run_analysis = st.button("Run IRR Analysis", key="run_irr_button")
 
         if should_run_analysis:
+            from IRR_pipeline import process_json_files
+            from irr_analysis import run_irr_analysis_for_streamlit
+            
             if not json_files: # Double check in case files were removed since last check
                 st.error("No processed JSON files found in 'docs' folder. Cannot run IRR analysis.")
             else:
@@ -906,17 +1184,21 @@ def render_irr_analysis_tab():
                             llm_data_df.to_csv(temp_llm_csv_path, index=False)
 
                             # 3. Run IRR analysis using the temporary CSV file
+                            irr_timings = {"spans": []}
                             irr_results = run_irr_analysis_for_streamlit( # Now correctly calling streamlit version
                                 llm_data_path=temp_llm_csv_path, # Pass path to the temp CSV
                                 nvivo_data_path=nvivo_path,
-                                output_dir=RESULTS_FOLDER
+                                output_dir=RESULTS_FOLDER,
+                                spans_owner=irr_timings
                             )
+                            # Kept for "Save as Experiment", which runs on a later rerun
+                            st.session_state.irr_spans = irr_timings["spans"]
                             # Clean up temporary CSV (optional, but good practice)
                             # os.remove(temp_llm_csv_path) # Commented out for debugging - you can uncomment later
 
                         if irr_results:
-                            # Store results in session state
-                            st.session_state.irr_analysis = irr_results
+                            # Store a reference to the results in session state
+                            st.session_state.irr_analysis_hash = put_result(irr_results)
 
                             st.success("IRR analysis completed successfully!")
                             
@@ -932,14 +1214,23 @@ def render_irr_analysis_tab():
                                 if st.button("Save as Experiment"):
                                     from ui_experiment_history import save_current_experiment
                                     
-                                    # Get the processed results from session state
-                                    results = st.session_state.get('results', {})
+                                    # Get the processed results referenced from session state
+                                    result_hashes = st.session_state.get('result_hashes', {})
+                                    results = get_results(result_hashes)
+                                    missing_files = [f for f in result_hashes if f not in results]
                                     
-                                    if results:
+                                    if missing_files:
+                                        # Saving the rest would record a partial experiment
+                                        st.error(f"{len(missing_files)} of {len(result_hashes)} results are no longer in the result store "
+                                                 f"({', '.join(missing_files)}). Reprocess these files before saving the experiment.")
+                                    elif results:
+                                        run_metadata = st.session_state.get('run_metadata', {})
                                         experiment_id = save_current_experiment(
                                             results=results,
                                             notes=exp_notes,
-                                            name=exp_name
+                                            name=exp_name,
+                                            run_metadata={f: run_metadata[f] for f in results if f in run_metadata},
+                                            batch_spans=st.session_state.get('irr_spans', [])
                                         )
                                         
                                         st.success(f"Experiment saved with ID: {experiment_id}")
@@ -997,7 +1288,7 @@ def render_irr_analysis_tab():
                             if 'report_path' in irr_results and os.path.exists(irr_results['report_path']):
                                 st.download_button(
                                     label="Download Report (Excel)",
-                                    data=open(irr_results['report_path'], "rb").read(),
+                                    data=deferred_file_data(irr_results['report_path']),
                                     file_name="irr_analysis_report.xlsx",
                                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                                 )
@@ -1015,10 +1306,10 @@ def render_irr_analysis_tab():
         st.warning("No processed JSON files found. Process some files first before running analysis.")
 
     # Show previous results if available, but only if last analysis was successful
-    if 'irr_analysis' in st.session_state and st.session_state.irr_analysis is not None and not should_run_analysis and st.session_state.irr_analysis: # Added check for non-None irr_analysis
+    if st.session_state.get('irr_analysis_hash') and not should_run_analysis:
         st.subheader("Previous IRR Analysis Results")
 
-        irr_results = st.session_state.irr_analysis
+        irr_results = get_result(st.session_state.irr_analysis_hash)
 
         if irr_results: # Check again if irr_results is not None before proceeding
             # Display summary metrics
@@ -1075,7 +1366,7 @@ def render_irr_analysis_tab():
             if 'report_path' in irr_results and os.path.exists(irr_results['report_path']):
                 st.download_button(
                     label="Download Report (Excel)",
-                    data=open(irr_results['report_path'], "rb").read(),
+                    data=deferred_file_data(irr_results['report_path']),
                     file_name="irr_analysis_report.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
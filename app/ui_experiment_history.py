@@ -1,19 +1,14 @@
 import streamlit as st
-import pandas as pd
 import os
 import json
 import datetime
-import matplotlib.pyplot as plt
-import numpy as np
-import io
-import base64
-from PIL import Image
 
-from versioning import (
-    list_experiments, get_experiment, delete_experiment,
-    apply_experiment_codebook, create_experiment_zip,
-    compare_experiments
-)
+# pandas, matplotlib and versioning (which loads pandas) are imported when the tab renders,
+# so importing this module stays fast
+from codebook_diff import summarize_diff_by_category
+from stage_timing import STAGES, timing_table, timeline
+from profiling import profile_summary
+from utils import deferred_file_data
 
 def format_timestamp(timestamp_str):
     """Format an ISO timestamp string to a more readable format."""
@@ -25,6 +20,13 @@ def format_timestamp(timestamp_str):
 
 def render_experiment_history_tab():
     """Render the Experiment History tab."""
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    from versioning import (
+        list_experiments, get_experiment, delete_experiment,
+        create_experiment_zip, compare_experiments
+    )
+
     st.header("Experiment History")
     
     st.info("""
@@ -74,18 +76,37 @@ def render_experiment_history_tab():
                 
                     # Export experiment as ZIP
                 if st.button("Export Experiment", key="export_exp"):
-                    zip_data = create_experiment_zip(selected_exp_id)
-                    if zip_data:
-                        # Create a download button
+                    zip_path = create_experiment_zip(selected_exp_id)
+                    if zip_path:
+                        # The cached archive is only read from disk when the download is clicked
                         st.download_button(
                             label="Download Experiment ZIP",
-                            data=zip_data,
+                            data=deferred_file_data(zip_path, lambda: create_experiment_zip(selected_exp_id)),
                             file_name=f"{selected_exp_id}.zip",
                             mime="application/zip"
                         )
                     else:
                         st.error("Failed to create experiment ZIP file.")
                 
+                # Re-score all experiments against the current NVivo reference
+                with st.expander("Re-score All Experiments"):
+                    st.write("Recompute the IRR of every stored experiment against the current NVivo export. "
+                             "Uses the stored results only - no API calls are made.")
+                    force_rescore = st.checkbox("Also re-score experiments already scored against this file", key="force_rescore")
+
+                    if st.button("Re-score Experiments", key="rescore_exps"):
+                        if not os.path.exists("nvivo_export.csv"):
+                            st.error("NVivo export file (nvivo_export.csv) not found.")
+                        else:
+                            from rescore import rescore_all_experiments, format_rescore_summary
+                            with st.spinner("Re-scoring experiments..."):
+                                summaries = rescore_all_experiments("nvivo_export.csv", force=force_rescore)
+                            st.dataframe(format_rescore_summary(summaries), use_container_width=True)
+                            for summary in summaries:
+                                if summary["score_changes"]:
+                                    with st.expander(f"Score changes: {summary['experiment_id']}"):
+                                        st.dataframe(pd.DataFrame(summary["score_changes"]), use_container_width=True)
+
                 # Delete experiment option (with confirmation)
                 with st.expander("Delete Experiment"):
                     st.warning("This action cannot be undone!")
@@ -161,19 +182,26 @@ def render_experiment_history_tab():
                     
                     st.dataframe(meta_df, use_container_width=True)
                     
+                    codebook_diff = comparison.get('codebook_diffs') or {}
+                    changes_by_category = summarize_diff_by_category(codebook_diff) if codebook_diff else {}
+
                     # Show IRR comparison if available
                     if 'irr_comparison' in comparison:
                         st.markdown("### IRR Score Comparison")
-                        
+
                         irr_df = pd.DataFrame(comparison['irr_comparison'])
-                        
+
                         # Clean up the DataFrame
                         irr_df = irr_df.rename(columns={
                             'Gwet AC1_1': 'Experiment 1 Score',
                             'Gwet AC1_2': 'Experiment 2 Score',
                             'Difference': 'Score Difference'
                         })
-                        
+
+                        # Show how many codebook fields changed next to each category's delta
+                        if codebook_diff:
+                            irr_df['Codebook Changes'] = irr_df['Category'].map(changes_by_category).fillna(0).astype(int)
+
                         # Color code the differences
                         def color_difference(val):
                             color = 'green' if val > 0 else 'red' if val < 0 else 'black'
@@ -240,6 +268,30 @@ def render_experiment_history_tab():
                                 - Maximum improvement: {differences.max():.3f}
                                 - Maximum decline: {differences.min():.3f}
                                 """)
+
+                    # Show codebook changes between the two experiments
+                    if codebook_diff:
+                        st.markdown("### Codebook Changes")
+
+                        diff_rows = []
+                        for kind in ("changed", "added", "removed"):
+                            for change in codebook_diff.get(kind, []):
+                                if kind == "changed" and 'text_diff' in change:
+                                    detail = change['text_diff']
+                                else:
+                                    detail = change['new'] if kind == "added" else change['old']
+                                diff_rows.append({
+                                    "Category": change.get('category') or "",
+                                    "Field": change['path'],
+                                    "Change": kind.capitalize(),
+                                    "Detail": str(detail)
+                                })
+
+                        if diff_rows:
+                            st.caption("Removed words are shown as [-...-], added words as {+...+}.")
+                            st.dataframe(pd.DataFrame(diff_rows), use_container_width=True)
+                        else:
+                            st.info("Both experiments used an identical codebook.")
                 else:
                     st.error("Failed to compare experiments. Make sure both experiments have data.")
     
@@ -276,7 +328,7 @@ def render_experiment_history_tab():
                     st.markdown(metadata['notes'])
                 
                 # Show tabs for different aspects of the experiment
-                result_tab, irr_tab, codebook_tab = st.tabs(["Results", "IRR Analysis", "Codebook"])
+                result_tab, irr_tab, timing_tab, codebook_tab = st.tabs(["Results", "IRR Analysis", "Timing & Tokens", "Codebook"])
                 
                 # Results tab
                 with result_tab:
@@ -340,6 +392,51 @@ def render_experiment_history_tab():
                     else:
                         st.info("No IRR analysis data found for this experiment.")
                 
+                # Timing & Tokens tab
+                with timing_tab:
+                    timing_rows = timing_table(metadata)
+                    if timing_rows:
+                        st.subheader("Time and Tokens per File")
+                        timing_df = pd.DataFrame(timing_rows).fillna(0)
+                        st.dataframe(timing_df, use_container_width=True)
+                        input_tokens = sum(row.get("input_tokens", 0) for row in timing_rows)
+                        output_tokens = sum(row.get("output_tokens", 0) for row in timing_rows)
+                        st.markdown(f"**Total tokens:** {input_tokens:,} input, {output_tokens:,} output")
+                        
+                        # Timeline of every span, one row per file
+                        spans = timeline(metadata)
+                        if spans:
+                            st.subheader("Timeline")
+                            labels = list(dict.fromkeys(label for label, _, _, _ in spans))
+                            colors = dict(zip(STAGES, plt.cm.tab10.colors))
+                            fig, ax = plt.subplots(figsize=(12, max(2, 0.4 * len(labels) + 1)))
+                            for label, stage, offset, seconds in spans:
+                                ax.broken_barh([(offset, max(seconds, 0.01))], (labels.index(label) - 0.4, 0.8),
+                                               color=colors.get(stage, "gray"))
+                            ax.set_yticks(range(len(labels)))
+                            ax.set_yticklabels(labels)
+                            ax.invert_yaxis()
+                            ax.set_xlabel("Seconds since start")
+                            used_stages = [stage for stage in STAGES if any(s == stage for _, s, _, _ in spans)]
+                            ax.legend(handles=[plt.Rectangle((0, 0), 1, 1, color=colors[stage]) for stage in used_stages],
+                                      labels=used_stages, loc="upper right", fontsize="small")
+                            plt.tight_layout()
+                            st.pyplot(fig)
+                    else:
+                        st.info("No timing data was recorded for this experiment.")
+                    
+                    # Profiles recorded with GREENTRAC_PROFILE set
+                    profile_dir = os.path.join("experiments", selected_exp_id, "profiles")
+                    if os.path.isdir(profile_dir):
+                        st.subheader("Profiles")
+                        for profile_name in sorted(os.listdir(profile_dir)):
+                            profile_path = os.path.join(profile_dir, profile_name)
+                            if profile_name.endswith(".pstats"):
+                                with st.expander(profile_name):
+                                    st.dataframe(pd.DataFrame(profile_summary(profile_path)), use_container_width=True)
+                            st.download_button(f"Download {profile_name}", deferred_file_data(profile_path),
+                                               file_name=profile_name, key=f"download_profile_{profile_name}")
+                
                 # Codebook tab
                 with codebook_tab:
                     st.subheader("Codebook Used")
@@ -355,7 +452,7 @@ def render_experiment_history_tab():
             else:
                 st.error("Failed to load experiment data.")
 
-def save_current_experiment(results, notes="", name=""):
+def save_current_experiment(results, notes="", name="", run_metadata=None, batch_spans=None):
     """
     Save the current experiment state including codebook and results.
     
@@ -367,6 +464,10 @@ def save_current_experiment(results, notes="", name=""):
         Optional notes about the experiment
     name : str
         Optional name for the experiment
+    run_metadata : dict, optional
+        Per-file information about how each result was produced
+    batch_spans : list, optional
+        Timings of the batch stages (IRR analysis, export)
         
     Returns:
     --------
@@ -395,7 +496,9 @@ def save_current_experiment(results, notes="", name=""):
         results=results,
         codebook=codebook,
         notes=notes,
-        name=name
+        name=name,
+        run_metadata=run_metadata,
+        batch_spans=batch_spans
     )
     
     return experiment_id
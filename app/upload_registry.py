@@ -0,0 +1,145 @@
+import os
+import json
+import logging
+import time
+import threading
+from collections import defaultdict
+
+from google.genai import types
+
+from utils import hash_file
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+# Registry mapping PDF content hashes to files uploaded through the Gemini file API
+REGISTRY_PATH = os.path.join("results", "upload_registry.json")
+
+# Re-upload a little before the remote file actually expires
+EXPIRY_MARGIN_SECONDS = 10 * 60
+
+# Uploaded files are kept for 48 hours; assume slightly less if the API doesn't say
+DEFAULT_FILE_LIFETIME_SECONDS = 47 * 60 * 60
+
+registry_lock = threading.Lock()
+upload_locks = defaultdict(threading.Lock)
+
+def load_registry(registry_path=REGISTRY_PATH):
+    """Load the upload registry from disk (empty if missing or unreadable)."""
+    if not os.path.exists(registry_path):
+        return {}
+    try:
+        with open(registry_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning("Error reading upload registry %s: %s", registry_path, e)
+        return {}
+
+def save_registry(registry, registry_path=REGISTRY_PATH):
+    """Atomically write the upload registry to disk."""
+    os.makedirs(os.path.dirname(registry_path) or ".", exist_ok=True)
+    tmp_path = f"{registry_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_path, registry_path)
+
+def gemini_uploader(client):
+    """
+    Returns an upload function backed by the Gemini file API.
+
+    Upload functions take (file_path, mime_type) and return a dict with the remote
+    'name', 'uri', 'mime_type' and 'expires_at' (Unix timestamp). Any callable with
+    the same contract (e.g. a local fake) can be passed to get_remote_file instead.
+    """
+    def upload(file_path, mime_type):
+        remote_file = client.files.upload(file=file_path, config={"mime_type": mime_type})
+        if remote_file.expiration_time is not None:
+            expires_at = remote_file.expiration_time.timestamp()
+        else:
+            expires_at = time.time() + DEFAULT_FILE_LIFETIME_SECONDS
+        return {
+            "name": remote_file.name,
+            "uri": remote_file.uri,
+            "mime_type": remote_file.mime_type or mime_type,
+            "expires_at": expires_at
+        }
+    return upload
+
+def get_remote_file(file_path, upload_fn, mime_type="application/pdf", registry_path=REGISTRY_PATH, now=None,
+                    scope=""):
+    """
+    Returns the registry entry for a file, uploading it only if needed.
+
+    Files are identified by content hash, so renamed or copied PDFs reuse the same
+    upload. A new upload happens when the file was never uploaded, its remote
+    handle expires within EXPIRY_MARGIN_SECONDS, or the handle was dropped with
+    invalidate (e.g. after the API rejected it).
+
+    Parameters:
+    -----------
+    file_path : str
+        Path to the local file
+    upload_fn : callable
+        Upload function (see gemini_uploader)
+    mime_type : str
+        MIME type of the file
+    registry_path : str
+        Path of the JSON registry
+    now : float, optional
+        Current Unix time (defaults to time.time())
+    scope : str, optional
+        Namespace for the upload (e.g. the API key label); files uploaded with one
+        key can't be used with another
+
+    Returns:
+    --------
+    tuple
+        (entry, reused) where entry has 'name', 'uri', 'mime_type', 'expires_at'
+        and reused is True if no upload was needed
+    """
+    content_hash = hash_file(file_path).hexdigest()
+    registry_key = f"{scope}:{content_hash}" if scope else content_hash
+
+    # Only one upload per content hash at a time (sectioned requests share a PDF)
+    with registry_lock:
+        hash_lock = upload_locks[registry_key]
+
+    with hash_lock:
+        current_time = now if now is not None else time.time()
+        with registry_lock:
+            entry = load_registry(registry_path).get(registry_key)
+
+        if entry and entry.get("expires_at", 0) - EXPIRY_MARGIN_SECONDS > current_time:
+            return entry, True
+
+        entry = upload_fn(file_path, mime_type)
+        entry["uploaded_at"] = current_time
+        entry["source"] = os.path.basename(file_path)
+
+        with registry_lock:
+            registry = load_registry(registry_path)
+            # Drop entries that have already expired while we're rewriting the file
+            registry = {h: e for h, e in registry.items() if e.get("expires_at", 0) > current_time}
+            registry[registry_key] = entry
+            save_registry(registry, registry_path)
+
+        return entry, False
+
+def invalidate(content_hash, scope="", registry_path=REGISTRY_PATH):
+    """Forgets the uploaded copy of a file (e.g. after the API rejected it), so the next lookup uploads it again."""
+    registry_key = f"{scope}:{content_hash}" if scope else content_hash
+    with registry_lock:
+        registry = load_registry(registry_path)
+        if registry.pop(registry_key, None) is not None:
+            save_registry(registry, registry_path)
+
+def get_pdf_part(client, pdf_file_path, scope=""):
+    """Returns a Gemini Part referencing an uploaded copy of the PDF (uploading it once per content hash and scope)."""
+    entry, reused = get_remote_file(pdf_file_path, gemini_uploader(client), scope=scope)
+    increment("greentrac_upload_cache_total", outcome="hit" if reused else "miss")
+    return types.Part.from_uri(file_uri=entry["uri"], mime_type=entry["mime_type"])
+
+def invalidate_pdf_part(pdf_file_path, scope=""):
+    """Forgets the uploaded copy of the PDF, so the next get_pdf_part uploads it again."""
+    invalidate(hash_file(pdf_file_path).hexdigest(), scope=scope)
+    increment("greentrac_upload_cache_total", outcome="invalidated")
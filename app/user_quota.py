@@ -0,0 +1,156 @@
+import os
+import json
+import heapq
+import logging
+import datetime
+import itertools
+import threading
+
+from api_key_pool import QUOTA_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+# Default daily allowances per user (admins can override them per user)
+DEFAULT_DAILY_REQUESTS = int(os.getenv("GREENTRAC_USER_DAILY_REQUESTS", "300"))
+DEFAULT_DAILY_TOKENS = int(os.getenv("GREENTRAC_USER_DAILY_TOKENS", "5000000"))
+
+# Usage and allowance overrides are persisted here
+USER_USAGE_PATH = os.path.join("results", "user_usage.json")
+
+usage_lock = threading.Lock()
+
+def _today():
+    return datetime.datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+def load_user_usage():
+    """Loads per-user usage and allowances ({"usage": {...}, "allowances": {...}})."""
+    if os.path.exists(USER_USAGE_PATH):
+        try:
+            with open(USER_USAGE_PATH, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+                data.setdefault("usage", {})
+                data.setdefault("allowances", {})
+                return data
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Error reading user usage: %s", e)
+    return {"usage": {}, "allowances": {}}
+
+def _save_user_usage(data):
+    os.makedirs(os.path.dirname(USER_USAGE_PATH), exist_ok=True)
+    tmp_path = f"{USER_USAGE_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, USER_USAGE_PATH)
+
+def _usage_today(data, username):
+    """Returns the user's usage entry for today, starting a new one on a new quota day."""
+    entry = data["usage"].get(username)
+    if not entry or entry.get("day") != _today():
+        entry = {"day": _today(), "requests": 0, "input_tokens": 0, "output_tokens": 0}
+        data["usage"][username] = entry
+    return entry
+
+def get_allowance(username, data=None):
+    """Returns the user's daily (requests, tokens) allowance."""
+    data = data if data is not None else load_user_usage()
+    allowance = data["allowances"].get(username, {})
+    return (allowance.get("daily_requests", DEFAULT_DAILY_REQUESTS),
+            allowance.get("daily_tokens", DEFAULT_DAILY_TOKENS))
+
+def set_allowance(username, daily_requests, daily_tokens):
+    """Overrides a user's daily allowance."""
+    with usage_lock:
+        data = load_user_usage()
+        data["allowances"][username] = {"daily_requests": int(daily_requests), "daily_tokens": int(daily_tokens)}
+        _save_user_usage(data)
+
+def check_allowance(username):
+    """
+    Checks whether a user may make another request today.
+
+    Returns:
+    --------
+    tuple
+        (allowed, message) where message explains which allowance was used up
+    """
+    with usage_lock:
+        data = load_user_usage()
+        entry = _usage_today(data, username)
+        daily_requests, daily_tokens = get_allowance(username, data)
+    if entry["requests"] >= daily_requests:
+        return False, f"Daily request allowance of {daily_requests} used up for user '{username}'"
+    if entry["input_tokens"] + entry["output_tokens"] >= daily_tokens:
+        return False, f"Daily token allowance of {daily_tokens} used up for user '{username}'"
+    return True, ""
+
+def requests_left_today(username):
+    """Returns how many more requests the user may make today."""
+    with usage_lock:
+        data = load_user_usage()
+        entry = _usage_today(data, username)
+        daily_requests, _ = get_allowance(username, data)
+    return max(daily_requests - entry["requests"], 0)
+
+def record_user_usage(username, requests=1, input_tokens=0, output_tokens=0):
+    """Adds requests and tokens to a user's usage for today."""
+    with usage_lock:
+        data = load_user_usage()
+        entry = _usage_today(data, username)
+        entry["requests"] += requests
+        entry["input_tokens"] += input_tokens or 0
+        entry["output_tokens"] += output_tokens or 0
+        _save_user_usage(data)
+
+def user_usage_table(usernames):
+    """Returns per-user usage rows for today (for display)."""
+    with usage_lock:
+        data = load_user_usage()
+    rows = []
+    for username in usernames:
+        entry = data["usage"].get(username, {})
+        if entry.get("day") != _today():
+            entry = {}
+        daily_requests, daily_tokens = get_allowance(username, data)
+        tokens = entry.get("input_tokens", 0) + entry.get("output_tokens", 0)
+        rows.append({
+            "Username": username,
+            "Requests Today": f"{entry.get('requests', 0)} / {daily_requests}",
+            "Tokens Today": f"{tokens:,} / {daily_tokens:,}",
+        })
+    return rows
+
+# Fair-share scheduling: requests waiting for the shared rate limiter are served in order of
+# per-user virtual time, so each active user gets an equal share regardless of batch size
+turn_condition = threading.Condition()
+waiting_requests = []
+user_virtual_times = {}
+ticket_counter = itertools.count()
+virtual_time = 0
+turn_taken = False
+
+def fair_share_turn(username, func):
+    """
+    Runs func (e.g. the rate limiter) once it is this user's turn.
+
+    Each request gets a virtual finish time one step after the user's previous request
+    (or the current virtual time if the user was idle). Waiting requests run in order of
+    those times, which interleaves users round-robin instead of first-come-first-served.
+    """
+    global virtual_time, turn_taken
+    with turn_condition:
+        tag = max(virtual_time, user_virtual_times.get(username, 0)) + 1
+        user_virtual_times[username] = tag
+        ticket = (tag, next(ticket_counter))
+        heapq.heappush(waiting_requests, ticket)
+        while turn_taken or waiting_requests[0] != ticket:
+            turn_condition.wait()
+        heapq.heappop(waiting_requests)
+        turn_taken = True
+        virtual_time = tag
+
+    try:
+        return func()
+    finally:
+        with turn_condition:
+            turn_taken = False
+            turn_condition.notify_all()
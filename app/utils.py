@@ -1,62 +1,175 @@
 import os
 import json
-import pandas as pd
+import logging
 import requests
 import streamlit as st
 import zipfile
 import io
+import time
+import hashlib
+import tempfile
+import threading
 from dotenv import load_dotenv
 
+from file_cache import cached_load, read_json
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables from .env file if it exists
 load_dotenv()
 
 # Default GitHub URL for codebook
 DEFAULT_CODEBOOK_URL = "https://raw.githubusercontent.com/CNielsen94/GreenTrac/refs/heads/main/codebook_enhanced.json"
 
+# Last fetched codebook per URL, with its ETag/Last-Modified and content hash. New sessions are served
+# from here at once while a conditional GET refreshes the copy in the background
+CODEBOOK_CACHE_DIR = os.path.join("results", "codebook_cache")
+
+# Hard limit on a codebook fetch (seconds); slower fetches fall back to the cached or local copy
+CODEBOOK_FETCH_TIMEOUT_SECONDS = 5
+
+# Cache directory for generated ZIP exports (keyed by content hash)
+EXPORT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "greentrac_exports")
+MAX_CACHED_EXPORTS = 20
+
+# Exports used within this many seconds are never pruned, since a session may still offer them for download
+EXPORT_GRACE_SECONDS = 3600
+EXPORT_CHUNK_SIZE = 1024 * 1024
+
+codebook_fetch_lock = threading.Lock()
+codebook_fetches = {}
+codebook_fetch_status = {}
+
 def get_default_api_key():
-    """Get the default API key from environment variables."""
-    return os.getenv("GOOGLE_API_KEY")
+    """Get the default API key from environment variables (the first of GOOGLE_API_KEYS if GOOGLE_API_KEY is unset)."""
+    # The key pool reads the full GOOGLE_API_KEYS list itself (api_key_pool.environment_api_keys)
+    keys = [key.strip() for key in os.getenv("GOOGLE_API_KEYS", "").split(",") if key.strip()]
+    return os.getenv("GOOGLE_API_KEY") or (keys[0] if keys else None)
 
 def load_codebook_template(path="plastics_codebook.json"):
-    """Load the codebook template from file."""
+    """Load the codebook template from file (parsed once per process until the file changes)."""
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return cached_load(path, read_json)
     except FileNotFoundError:
         st.error(f"Error: {path} not found in the application directory")
         return {}
 
-def fetch_github_file(url):
-    """Fetches a file from a GitHub URL (raw content)."""
+def _codebook_cache_path(url, cache_dir=None):
+    return os.path.join(cache_dir or CODEBOOK_CACHE_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest()[:16] + ".json")
+
+def read_cached_codebook(url, cache_dir=None):
+    """Returns the cache entry for url ({url, etag, last_modified, sha256, fetched_at, content}) or None."""
     try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for 4XX/5XX responses
-        return response.text
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error fetching file from GitHub: {e}")
+        with open(_codebook_cache_path(url, cache_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
         return None
 
-def load_codebook_comments(local_path="codebook_finetune.json", github_url=DEFAULT_CODEBOOK_URL, force_local=False):
+def _write_cached_codebook(url, entry, cache_dir=None):
+    path = _codebook_cache_path(url, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entry, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def refresh_codebook_cache(url, cache_dir=None, timeout=CODEBOOK_FETCH_TIMEOUT_SECONDS):
     """
-    Load the codebook comments from GitHub first, then fall back to local file if needed.
+    Revalidates the cached codebook for url with a conditional GET (If-None-Match / If-Modified-Since).
+
+    The cache is only rewritten if the server sends a new body that parses as JSON. Runs outside the
+    Streamlit script thread, so errors are logged rather than shown.
+
+    Returns:
+        "updated", "not_modified" or "failed"
+    """
+    cached = read_cached_codebook(url, cache_dir)
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        response = requests.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and cached:
+            cached["fetched_at"] = time.time()
+            _write_cached_codebook(url, cached, cache_dir)
+            return "not_modified"
+        response.raise_for_status()
+        json.loads(response.text)
+    except (requests.exceptions.RequestException, json.JSONDecodeError, OSError) as e:
+        logger.warning("Could not refresh codebook from %s: %s", url, e)
+        return "failed"
+
+    content_hash = hashlib.sha256(response.text.encode("utf-8")).hexdigest()
+    if cached and cached.get("sha256") == content_hash:
+        status = "not_modified"
+    else:
+        status = "updated"
+    _write_cached_codebook(url, {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": content_hash,
+        "fetched_at": time.time(),
+        "content": response.text
+    }, cache_dir)
+    return status
+
+def start_codebook_refresh(url, cache_dir=None, timeout=CODEBOOK_FETCH_TIMEOUT_SECONDS):
+    """Starts refresh_codebook_cache in a background thread (at most one per URL) and returns the thread."""
+    key = (url, cache_dir)
+
+    def refresh():
+        codebook_fetch_status[key] = refresh_codebook_cache(url, cache_dir, timeout)
+
+    with codebook_fetch_lock:
+        thread = codebook_fetches.get(key)
+        if thread is None or not thread.is_alive():
+            codebook_fetch_status.pop(key, None)
+            thread = threading.Thread(target=refresh, daemon=True, name="codebook-refresh")
+            codebook_fetches[key] = thread
+            thread.start()
+    return thread
+
+def load_codebook_comments(local_path="codebook_finetune.json", github_url=DEFAULT_CODEBOOK_URL, force_local=False,
+                           wait_for_refresh=False, cache_dir=None, timeout=CODEBOOK_FETCH_TIMEOUT_SECONDS):
+    """
+    Load the codebook comments from GitHub (via the local cache), then fall back to local file if needed.
+    
+    A cached copy is returned immediately and revalidated in the background, so a change on GitHub
+    reaches the sessions started after the refresh. Without a cached copy (or with wait_for_refresh)
+    the fetch is awaited for at most timeout seconds before falling back to the cached or local copy.
     
     Args:
         local_path: Path to local codebook file
         github_url: URL to GitHub raw codebook file
         force_local: If True, only try to load from local file
+        wait_for_refresh: If True, wait for the conditional GET instead of serving the cached copy first
+        cache_dir: Directory of the fetched-codebook cache (defaults to CODEBOOK_CACHE_DIR)
+        timeout: Hard limit on waiting for the fetch (seconds)
         
     Returns:
         Dictionary containing the codebook comments
     """
-    # Try to load from GitHub first unless force_local is True
+    # Try GitHub (or its cached copy) first unless force_local is True
     if not force_local:
-        with st.spinner("Fetching codebook from GitHub..."):
-            github_content = fetch_github_file(github_url)
-            if github_content:
-                try:
-                    return json.loads(github_content)
-                except json.JSONDecodeError as e:
-                    st.warning(f"Error parsing GitHub codebook: {e}. Falling back to local file.")
+        cached = read_cached_codebook(github_url, cache_dir)
+        thread = start_codebook_refresh(github_url, cache_dir, timeout)
+        if cached is None or wait_for_refresh:
+            with st.spinner("Fetching codebook from GitHub..."):
+                thread.join(timeout)
+            if thread.is_alive():
+                st.warning(f"Fetching the codebook from GitHub took longer than {timeout} seconds; "
+                           f"using the {'cached' if cached else 'local'} copy.")
+            elif codebook_fetch_status.get((github_url, cache_dir)) == "failed":
+                st.warning(f"Could not fetch the codebook from GitHub; using the {'cached' if cached else 'local'} copy.")
+            cached = read_cached_codebook(github_url, cache_dir)
+        if cached:
+            try:
+                return json.loads(cached["content"])
+            except json.JSONDecodeError as e:
+                st.warning(f"Error parsing GitHub codebook: {e}. Falling back to local file.")
     
     # Fall back to local file if GitHub fails or if force_local is True
     try:
@@ -126,6 +239,8 @@ def flatten_json_for_table(nested_json, prefix=""):
 
 def create_dataframe_from_json(result):
     """Create a pandas DataFrame from flattened JSON data for display."""
+    import pandas as pd
+    
     try:
         flat_data = flatten_json_for_table(result)
         df = pd.DataFrame([flat_data])
@@ -168,14 +283,93 @@ def save_uploaded_file(uploaded_file, target_folder):
         st.error(f"Error saving uploaded file: {e}")
         return False
 
+def hash_file(path, digest=None):
+    """Feed a file into a SHA-256 digest in fixed-size chunks and return the digest."""
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(EXPORT_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest
+
+def _prune_export_cache():
+    """Remove the oldest cached exports beyond MAX_CACHED_EXPORTS that weren't used within EXPORT_GRACE_SECONDS."""
+    exports = []
+    for name in os.listdir(EXPORT_CACHE_DIR):
+        if name.endswith(".zip"):
+            try:
+                exports.append((os.path.getmtime(os.path.join(EXPORT_CACHE_DIR, name)), name))
+            except OSError:
+                continue
+    exports.sort(reverse=True)
+    cutoff = time.time() - EXPORT_GRACE_SECONDS
+    for mtime, name in exports[MAX_CACHED_EXPORTS:]:
+        if mtime > cutoff:
+            continue
+        stale_path = os.path.join(EXPORT_CACHE_DIR, name)
+        try:
+            os.remove(stale_path)
+        except OSError:
+            pass
+
+def build_cached_zip(content_hash, write_entries):
+    """
+    Stream a ZIP archive to a file in the export cache and return its path.
+
+    The archive is written entry by entry to a temporary file (never held in memory)
+    and moved into place atomically. If an archive with the same content hash already
+    exists it is reused, so Streamlit reruns don't rebuild it.
+    """
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    zip_path = os.path.join(EXPORT_CACHE_DIR, f"{content_hash}.zip")
+    if os.path.exists(zip_path):
+        os.utime(zip_path)  # Mark as recently used
+        return zip_path
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".zip.tmp", dir=EXPORT_CACHE_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            with zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED) as zip_file:
+                write_entries(zip_file)
+        os.replace(tmp_path, zip_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _prune_export_cache()
+    return zip_path
+
+def deferred_file_data(path, rebuild=None):
+    """
+    Returns st.download_button data that reads the file only when the download is clicked, not on every rerun.
+
+    If the file is gone by then (e.g. a cached export was pruned), rebuild() is called for a new path.
+    """
+    def read():
+        file_path = path
+        if rebuild is not None and not os.path.exists(file_path):
+            file_path = rebuild()
+        with open(file_path, "rb") as f:
+            return f.read()
+    return read
+
 def create_zip_from_results(results):
-    """Create a zip file containing all results."""
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+    """Create a zip file containing all results and return the path to it."""
+    # Hash the serialized results so identical result sets reuse the same archive
+    digest = hashlib.sha256()
+    for filename in sorted(results):
+        digest.update(filename.encode("utf-8"))
+        digest.update(json.dumps(results[filename], sort_keys=True, ensure_ascii=False).encode("utf-8"))
+
+    def write_entries(zip_file):
         for filename, result in results.items():
             output_filename = f"{os.path.splitext(filename)[0]}_codebook.json"
-            zip_file.writestr(output_filename, json.dumps(result, indent=2, ensure_ascii=False))
-    return zip_buffer.getvalue()
+            # Serialize each result straight into the archive entry
+            with zip_file.open(output_filename, "w") as entry:
+                with io.TextIOWrapper(entry, encoding="utf-8") as text_entry:
+                    json.dump(result, text_entry, indent=2, ensure_ascii=False)
+
+    return build_cached_zip(f"results_{digest.hexdigest()}", write_entries)
 
 def ensure_folders_exist(folders):
     """Ensure all required folders exist."""
@@ -1,17 +1,27 @@
 import os
 import json
 import time
+import hashlib
 import datetime
 import shutil
+import threading
 import pandas as pd
 import streamlit as st
 from pathlib import Path
-import zipfile
-import io
+
+from codebook_diff import codebook_file_key, diff_codebooks
+from stage_timing import add_span
+from utils import build_cached_zip, hash_file
+from profiling import profiled, attach_profiles
+from file_cache import cached_load, read_json
 
 # Directory for storing experiment versions
 EXPERIMENTS_DIR = "experiments"
 
+# Last export per experiment: its files' (path, mtime, size) signature and the archive built from them
+export_signatures = {}
+export_lock = threading.Lock()
+
 def ensure_experiments_dir():
     """Ensure the experiments directory exists."""
     if not os.path.exists(EXPERIMENTS_DIR):
@@ -19,12 +29,20 @@ def ensure_experiments_dir():
         return True
     return False
 
+def write_json_atomic(path, data):
+    """Write JSON to a temporary file next to the target and rename it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
 def generate_experiment_id():
     """Generate a unique experiment ID based on timestamp."""
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     return f"exp_{timestamp}"
 
-def save_experiment(results, codebook, notes="", name=""):
+@profiled("save_experiment", output_dir=lambda experiment_id: os.path.join(EXPERIMENTS_DIR, experiment_id))
+def save_experiment(results, codebook, notes="", name="", run_metadata=None, batch_spans=None):
     """
     Save an experiment with its associated codebook and metadata.
     
@@ -38,12 +56,17 @@ def save_experiment(results, codebook, notes="", name=""):
         User notes about the experiment
     name : str
         Optional user-provided name for the experiment
+    run_metadata : dict, optional
+        Per-file information about how each result was produced (mode, timings, ...)
+    batch_spans : list, optional
+        Batch stage timings (IRR analysis, export); the time spent saving is added to them
     
     Returns:
     --------
     str
         The ID of the saved experiment
     """
+    start_time = time.time()
     ensure_experiments_dir()
     
     # Generate experiment ID if no name provided
@@ -69,8 +92,8 @@ def save_experiment(results, codebook, notes="", name=""):
         "num_files": len(results)
     }
     
-    with open(os.path.join(experiment_dir, "metadata.json"), 'w', encoding='utf-8') as f:
-        json.dump(metadata, f, indent=4, ensure_ascii=False)
+    if run_metadata:
+        metadata["run_metadata"] = run_metadata
     
     # Save codebook (single file)
     with open(os.path.join(experiment_dir, "codebook.json"), 'w', encoding='utf-8') as f:
@@ -95,6 +118,17 @@ def save_experiment(results, codebook, notes="", name=""):
         if os.path.exists(img_path):
             shutil.copy(img_path, os.path.join(experiment_dir, img_name))
     
+    # Profiles of the runs that produced these results (only if GREENTRAC_PROFILE is set)
+    attach_profiles(experiment_dir)
+    
+    # Metadata is written last so it can include the time spent saving
+    timings = {"spans": list(batch_spans or [])}
+    add_span(timings, "save", start_time, time.time() - start_time)
+    metadata["batch_spans"] = timings["spans"]
+    
+    with open(os.path.join(experiment_dir, "metadata.json"), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=4, ensure_ascii=False)
+    
     return experiment_id
 
 def list_experiments():
@@ -104,7 +138,8 @@ def list_experiments():
     Returns:
     --------
     list
-        List of experiment metadata dictionaries, sorted by timestamp (newest first)
+        List of experiment metadata dictionaries, sorted by timestamp (newest first).
+        They are shared with other sessions (parsed once until metadata.json changes), so treat them as read-only
     """
     ensure_experiments_dir()
     
@@ -114,9 +149,7 @@ def list_experiments():
         
         if os.path.exists(metadata_path):
             try:
-                with open(metadata_path, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                    experiments.append(metadata)
+                experiments.append(cached_load(metadata_path, read_json))
             except Exception as e:
                 print(f"Error reading metadata for {exp_dir}: {e}")
     
@@ -156,12 +189,14 @@ def get_experiment(experiment_id):
     if os.path.exists(codebook_path):
         with open(codebook_path, 'r', encoding='utf-8') as f:
             experiment_data['codebook'] = json.load(f)
+        experiment_data['codebook_path'] = codebook_path
     else:
         # For backward compatibility
         codebook_finetuned_path = os.path.join(experiment_dir, "codebook_finetuned.json")
         if os.path.exists(codebook_finetuned_path):
             with open(codebook_finetuned_path, 'r', encoding='utf-8') as f:
                 experiment_data['codebook'] = json.load(f)
+            experiment_data['codebook_path'] = codebook_finetuned_path
     
     # Load results
     results_dir = os.path.join(experiment_dir, "results")
@@ -177,7 +212,7 @@ def get_experiment(experiment_id):
     if os.path.exists(irr_report_path):
         experiment_data['irr_report_path'] = irr_report_path
         try:
-            experiment_data['irr_report_df'] = pd.read_excel(irr_report_path)
+            experiment_data['irr_report_df'] = cached_load(irr_report_path, pd.read_excel)
         except Exception as e:
             print(f"Error loading IRR report for {experiment_id}: {e}")
     
@@ -245,6 +280,10 @@ def create_experiment_zip(experiment_id):
     """
     Create a ZIP file containing all files for an experiment.
     
+    The archive is streamed to disk and cached by a hash of the experiment's
+    file contents, so repeated exports of an unchanged experiment are free. The
+    contents are only hashed again when a file's mtime or size changed.
+    
     Parameters:
     -----------
     experiment_id : str
@@ -252,24 +291,46 @@ def create_experiment_zip(experiment_id):
         
     Returns:
     --------
-    bytes
-        ZIP file content as bytes
+    str
+        Path to the ZIP file
     """
     experiment_dir = os.path.join(EXPERIMENTS_DIR, experiment_id)
     
     if not os.path.exists(experiment_dir):
         return None
     
-    zip_buffer = io.BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for root, dirs, files in os.walk(experiment_dir):
-            for file in files:
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, EXPERIMENTS_DIR)
-                zip_file.write(file_path, rel_path)
-    
-    return zip_buffer.getvalue()
+    # Collect files in a stable order; the archive is reused while none of them changed
+    file_entries = []
+    signature = []
+    for root, dirs, files in os.walk(experiment_dir):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            stat = os.stat(file_path)
+            file_entries.append((file_path, os.path.relpath(file_path, EXPERIMENTS_DIR)))
+            signature.append((file_entries[-1][1], stat.st_mtime_ns, stat.st_size))
+    signature = tuple(signature)
+    
+    with export_lock:
+        cached = export_signatures.get(experiment_id)
+    if cached and cached[0] == signature and os.path.exists(cached[1]):
+        os.utime(cached[1])  # Mark as recently used in the export cache
+        return cached[1]
+    
+    # Hash paths and contents, so an unchanged experiment still reuses its archive after a restart
+    digest = hashlib.sha256()
+    for file_path, rel_path in file_entries:
+        digest.update(rel_path.encode("utf-8"))
+        hash_file(file_path, digest)
+    
+    def write_entries(zip_file):
+        for file_path, rel_path in file_entries:
+            zip_file.write(file_path, rel_path)
+    
+    zip_path = build_cached_zip(f"{experiment_id}_{digest.hexdigest()}", write_entries)
+    with export_lock:
+        export_signatures[experiment_id] = (signature, zip_path)
+    return zip_path
 
 def compare_experiments(experiment_id1, experiment_id2):
     """
@@ -302,6 +363,11 @@ def compare_experiments(experiment_id1, experiment_id2):
         "result_diffs": {}
     }
     
+    # Structural diff of the codebook comments (memoized per pair of codebook files)
+    if 'codebook' in exp1 and 'codebook' in exp2:
+        cache_key = (codebook_file_key(exp1['codebook_path']), codebook_file_key(exp2['codebook_path']))
+        comparison['codebook_diffs'] = diff_codebooks(exp1['codebook'], exp2['codebook'], cache_key=cache_key)
+    
     # Compare IRR results if available
     if 'irr_report_df' in exp1 and 'irr_report_df' in exp2:
         try:
@@ -0,0 +1,169 @@
+import os
+import json
+import tempfile
+
+from utils import hash_file
+from pdf_slimming import SLIM_CACHE_DIR
+
+# Documents above either threshold are split into overlapping page windows; windows of large
+# documents are also kept under the byte threshold (estimated from the average page size)
+WINDOW_PAGE_THRESHOLD = int(os.getenv("GREENTRAC_WINDOW_PAGE_THRESHOLD", "40"))
+WINDOW_BYTE_THRESHOLD = int(os.getenv("GREENTRAC_WINDOW_BYTE_THRESHOLD", str(15 * 1024 * 1024)))
+
+# Size of each window and number of pages shared by neighbouring windows
+WINDOW_PAGES = 25
+WINDOW_OVERLAP = 2
+
+def count_pages(pdf_file_path):
+    """Returns the number of pages in a PDF."""
+    from pypdf import PdfReader
+    return len(PdfReader(pdf_file_path).pages)
+
+def needs_windowing(pdf_file_path, page_count):
+    """Checks whether a document is large enough to be split into windows."""
+    return page_count > WINDOW_PAGE_THRESHOLD or os.path.getsize(pdf_file_path) > WINDOW_BYTE_THRESHOLD
+
+def plan_windows(page_count, file_size=0, window_pages=WINDOW_PAGES, overlap=WINDOW_OVERLAP,
+                 max_window_bytes=WINDOW_BYTE_THRESHOLD):
+    """
+    Splits a page range into overlapping windows.
+
+    Windows have at most window_pages pages, fewer if the document's average page size
+    (file_size / page_count) would make a window larger than max_window_bytes.
+
+    Returns:
+    --------
+    list
+        (start, end) tuples of 0-based page indices, end exclusive
+    """
+    if file_size and page_count:
+        bytes_per_page = file_size / page_count
+        window_pages = min(window_pages, int(max_window_bytes // bytes_per_page))
+    # Each window must still advance past the pages it shares with the previous one
+    window_pages = max(window_pages, overlap + 1)
+    if page_count <= window_pages:
+        return [(0, page_count)]
+
+    step = max(window_pages - overlap, 1)
+    windows = []
+    start = 0
+    while start < page_count:
+        end = min(start + window_pages, page_count)
+        windows.append((start, end))
+        if end == page_count:
+            break
+        start += step
+    return windows
+
+def write_window(pdf_file_path, start, end, cache_dir=SLIM_CACHE_DIR):
+    """Writes pages [start, end) of a PDF to a separate file and returns its path, cached by content hash."""
+    content_hash = hash_file(pdf_file_path).hexdigest()
+    window_path = os.path.join(cache_dir, f"{content_hash}_window_{start}_{end}.pdf")
+    if os.path.exists(window_path):
+        return window_path
+
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(pdf_file_path)
+    writer = PdfWriter()
+    for i in range(start, end):
+        writer.add_page(reader.pages[i])
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Concurrent sessions may window the same PDF, so each writes its own temporary file
+    fd, tmp_path = tempfile.mkstemp(suffix=".pdf.tmp", dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writer.write(f)
+        os.replace(tmp_path, window_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return window_path
+
+def _is_empty(value):
+    return value is None or value == "" or value == [] or value == {}
+
+def _is_value_object(node):
+    return isinstance(node, dict) and "value" in node
+
+def _support(node):
+    """How well an extracted value is supported: a location first, then the length of the reasoning."""
+    if not isinstance(node, dict):
+        return (False, 0)
+    return (bool(node.get("location")), len(node.get("reasoning") or ""))
+
+def _item_key(item):
+    """Key used to de-duplicate list items across windows."""
+    value = item.get("value") if _is_value_object(item) else item
+    if isinstance(value, str):
+        return value.strip().lower()
+    return json.dumps(value, sort_keys=True)
+
+def _union_lists(lists):
+    """Unions list items across windows, keeping the best-supported copy of each item in first-seen order."""
+    merged = {}
+    for items in lists:
+        for item in items:
+            key = _item_key(item)
+            if key not in merged or _support(item) > _support(merged[key]):
+                merged[key] = item
+    return list(merged.values())
+
+def _merge_value_objects(nodes):
+    values = [node["value"] for node in nodes]
+
+    if any(isinstance(value, bool) for value in values):
+        # A field counts as mentioned if any window found it
+        merged_value = any(value is True for value in values)
+        candidates = [node for node in nodes if node["value"] is merged_value]
+    elif all(isinstance(value, list) for value in values if value is not None):
+        merged_value = _union_lists([value for value in values if value is not None])
+        candidates = [node for node in nodes if not _is_empty(node["value"])]
+    else:
+        candidates = [node for node in nodes if not _is_empty(node["value"])]
+        merged_value = max(candidates, key=_support)["value"] if candidates else values[0]
+
+    best = max(candidates or nodes, key=_support)
+    return {
+        "value": merged_value,
+        "location": best.get("location", ""),
+        "reasoning": best.get("reasoning", "")
+    }
+
+def merge_window_values(nodes):
+    """
+    Merges the values extracted for the same codebook node from several windows.
+
+    - booleans (e.g. 'mentioned') are OR-ed
+    - lists are unioned, de-duplicated by value
+    - other values keep the best-supported non-empty answer
+    - the location and reasoning come from the best-supported window agreeing with the merged value
+    """
+    nodes = [node for node in nodes if node is not None]
+    if not nodes:
+        return None
+
+    if all(_is_value_object(node) for node in nodes):
+        return _merge_value_objects(nodes)
+
+    if all(isinstance(node, dict) and not _is_value_object(node) for node in nodes):
+        keys = []
+        for node in nodes:
+            keys.extend(key for key in node if key not in keys)
+        return {key: merge_window_values([node.get(key) for node in nodes]) for key in keys}
+
+    if all(isinstance(node, list) for node in nodes):
+        return _union_lists(nodes)
+
+    # Mixed shapes (e.g. one window returned a bare value): prefer a structured, supported answer
+    non_empty = [node for node in nodes if not _is_empty(node)]
+    return max(non_empty or nodes, key=_support)
+
+def merge_window_results(window_results):
+    """Merges per-window codebook results (failed windows are None) into one result."""
+    results = [result for result in window_results if isinstance(result, dict)]
+    if not results:
+        return None
+    return merge_window_values(results)